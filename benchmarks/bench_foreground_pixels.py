@@ -0,0 +1,59 @@
+"""Compare the legacy per-pixel list comprehension with the mask-based foreground extraction.
+
+Usage:
+    python benchmarks/bench_foreground_pixels.py [--megapixels 12] [--repeat 3]
+"""
+import argparse
+import os
+import pathlib
+import sys
+import time
+
+import numpy as np
+from PIL import Image as PILImage
+
+sys.path.insert(0, '.')
+
+from streamlit_camouflage.v1.utils import get_foreground_pixels
+
+TEST_IMAGES_PATH = pathlib.Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / "tests" / "test_images"
+
+
+def legacy_foreground_pixels(image: PILImage.Image) -> np.ndarray:
+    return np.array([pixel for row in np.array(image.convert('RGB')) for pixel in row if sum(pixel) != 0])
+
+
+def best_time(fn, image, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(image)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=12.0, help="Size of the upscaled image")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fixture = PILImage.open(TEST_IMAGES_PATH / "shirt_plaid_red_black_grey_no_background.jpg").convert('RGB')
+
+    # rembg style RGBA image: black background becomes transparent
+    array = np.asarray(fixture)
+    alpha = np.where(array.any(axis=-1), 255, 0).astype(np.uint8)
+    rgba = PILImage.fromarray(np.dstack([array, alpha]), mode='RGBA')
+
+    scale = (args.megapixels * 1e6 / (fixture.width * fixture.height)) ** 0.5
+    size = (int(fixture.width * scale), int(fixture.height * scale))
+
+    for name, image in [("fixture", rgba), (f"{args.megapixels:g} MP", rgba.resize(size, PILImage.NEAREST))]:
+        legacy = best_time(legacy_foreground_pixels, image, args.repeat)
+        masked = best_time(get_foreground_pixels, image, args.repeat)
+        print(f"{name:>10} {image.width}x{image.height}: legacy {legacy * 1000:9.1f} ms, "
+              f"mask {masked * 1000:7.1f} ms, speedup {legacy / masked:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Replay a JSONL trace of API requests at increasing concurrency and report throughput and latency per route.
+
+The app from streamlit_camouflage/api.py is driven in-process through the httpx ASGI transport, or a running
+server with --url. Each line of the trace is one request:
+
+    {"method": "POST", "path": "/v1/colors", "params": {"mode": "fast"}, "file": "tests/test_images/shirt.jpg"}
+    {"method": "POST", "path": "/v1/matches", "json": {"colors": [...]}}
+
+"file" is uploaded as multipart form data, relative to the repository root. At every concurrency level the
+trace is replayed in a loop by that many clients for --duration seconds, and the throughput, latency
+percentiles and error rate of every route are reported. Uploads carry a request counter after the end of the
+image unless --repeat-uploads is given, so the result cache sees distinct images as it would from users.
+
+Usage:
+    python benchmarks/loadtest.py [--trace benchmarks/traces/sample.jsonl] [--concurrency 1 2 4 8 16] [--duration 10]
+    python benchmarks/loadtest.py --url http://localhost:8000 [--max-p99 2000] [--json results.json]
+
+The ramp stops at the first level over --max-p99 milliseconds or --max-error-rate, the previous level is
+reported as the sustained concurrency.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import pathlib
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, '.')
+
+REPO_PATH = pathlib.Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_TRACE = REPO_PATH / "benchmarks" / "traces" / "sample.jsonl"
+
+# Route, HTTP status (0 when the request failed) and latency in seconds
+Sample = Tuple[str, int, float]
+
+
+def load_trace(path: str) -> List[dict]:
+    """Read the requests of a trace, with the contents of their uploads
+
+    Raises:
+        ValueError: If a line is not a request
+    """
+    trace = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "path" not in entry:
+                raise ValueError(f"{path}:{number} has no 'path'")
+            entry.setdefault("method", "POST" if "file" in entry or "json" in entry else "GET")
+            if "file" in entry:
+                entry["contents"] = (REPO_PATH / entry["file"]).read_bytes()
+            trace.append(entry)
+    if not trace:
+        raise ValueError(f"{path} has no requests")
+    return trace
+
+
+def build_request(entry: dict, counter: Optional[int] = None) -> dict:
+    """Keyword arguments of httpx.AsyncClient.request replaying a trace entry
+
+    Args:
+        entry (dict): Trace entry from load_trace
+        counter (Optional[int], optional): Appended after the end of the upload to make it unique, decoders
+            ignore trailing bytes. Defaults to None, the upload as recorded.
+    """
+    request = {"method": entry["method"], "url": entry["path"], "params": entry.get("params")}
+    if "contents" in entry:
+        contents = entry["contents"] if counter is None else entry["contents"] + str(counter).encode()
+        request["files"] = {"file": (os.path.basename(entry["file"]), contents)}
+    if "json" in entry:
+        request["json"] = entry["json"]
+    return request
+
+
+def make_client(url: Optional[str], timeout: float) -> httpx.AsyncClient:
+    """Client for a server at url, or for the app in-process"""
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=timeout)
+
+    from streamlit_camouflage.api import app
+    from streamlit_camouflage.v1.models import mark_ready
+
+    # The ASGI transport does not run the lifespan, models load on first use
+    mark_ready()
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://camouflage", timeout=timeout)
+
+
+async def run_level(
+        client: httpx.AsyncClient,
+        trace: List[dict],
+        concurrency: int,
+        duration: float,
+        unique_uploads: bool,
+        counter: itertools.count
+    ) -> Tuple[List[Sample], float]:
+    """Replay the trace with concurrency clients for duration seconds
+
+    Returns:
+        Tuple[List[Sample], float]: Samples of every completed request and the elapsed seconds
+    """
+    samples: List[Sample] = []
+    entries = itertools.cycle(trace)
+    start = time.perf_counter()
+    deadline = start + duration
+
+    async def user():
+        while time.perf_counter() < deadline:
+            entry = next(entries)
+            request = build_request(entry, next(counter) if unique_uploads else None)
+            request_start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            samples.append((entry["path"], status, time.perf_counter() - request_start))
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, dict]:
+    """Throughput, latency percentiles in milliseconds and error rate by route, and over all routes as 'all'"""
+    routes: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        routes.setdefault(sample[0], []).append(sample)
+    routes["all"] = samples
+
+    summary = {}
+    for route, route_samples in routes.items():
+        if not route_samples:
+            continue
+        latencies = np.array([latency for _, _, latency in route_samples]) * 1000
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        errors = sum(1 for _, status, _ in route_samples if status == 0 or status >= 400)
+        summary[route] = {
+            "requests": len(route_samples),
+            "throughput": len(route_samples) / elapsed,
+            "p50_ms": p50,
+            "p90_ms": p90,
+            "p99_ms": p99,
+            "max_ms": latencies.max(),
+            "error_rate": errors / len(route_samples),
+            "statuses": {str(status): sum(1 for _, s, _ in route_samples if s == status)
+                         for status in sorted({s for _, s, _ in route_samples})},
+        }
+    return summary
+
+
+async def run(args) -> List[dict]:
+    trace = load_trace(args.trace)
+    counter = itertools.count()
+    levels = []
+    async with make_client(args.url, args.timeout) as client:
+        if args.warmup:
+            await run_level(client, trace, 1, args.warmup, not args.repeat_uploads, counter)
+
+        print(f"{'users':>6} {'route':>24} {'requests':>9} {'req/s':>8} {'p50 (ms)':>9} {'p90 (ms)':>9} "
+              f"{'p99 (ms)':>9} {'max (ms)':>9} {'errors':>7}")
+        for concurrency in args.concurrency:
+            samples, elapsed = await run_level(
+                client, trace, concurrency, args.duration, not args.repeat_uploads, counter)
+            summary = summarize(samples, elapsed)
+            levels.append({"concurrency": concurrency, "seconds": elapsed, "routes": summary})
+            for route, result in summary.items():
+                print(f"{concurrency:>6} {route:>24} {result['requests']:>9} {result['throughput']:8.2f} "
+                      f"{result['p50_ms']:9.1f} {result['p90_ms']:9.1f} {result['p99_ms']:9.1f} "
+                      f"{result['max_ms']:9.1f} {result['error_rate']:7.1%}")
+
+            overall = summary.get("all")
+            if overall and (overall["p99_ms"] > args.max_p99 or overall["error_rate"] > args.max_error_rate):
+                print(f"Stopping at {concurrency} users: p99 {overall['p99_ms']:.0f} ms, "
+                      f"errors {overall['error_rate']:.1%}")
+                break
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", default=str(DEFAULT_TRACE), help="JSONL trace of requests to replay")
+    parser.add_argument("--url", help="Base URL of a running server, the app is run in-process otherwise")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds at each concurrency level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of a single client before the ramp")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Request timeout in seconds")
+    parser.add_argument("--repeat-uploads", action="store_true", help="Upload the recorded bytes, hitting the result cache")
+    parser.add_argument("--max-p99", type=float, default=5000.0, help="p99 latency in ms that stops the ramp")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate that stops the ramp")
+    parser.add_argument("--json", help="Write the results of every level to this JSON file")
+    args = parser.parse_args()
+
+    levels = asyncio.run(run(args))
+
+    sustained = [level["concurrency"] for level in levels
+                 if level["routes"].get("all", {}).get("p99_ms", 0) <= args.max_p99
+                 and level["routes"].get("all", {}).get("error_rate", 0) <= args.max_error_rate]
+    print(f"Sustained concurrency: {max(sustained) if sustained else 0} users "
+          f"(p99 <= {args.max_p99:.0f} ms, errors <= {args.max_error_rate:.1%})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"trace": args.trace, "url": args.url or "in-process", "levels": levels}, f, indent=2)
+        print(f"Saved {len(levels)} levels to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Report palette drift and latency of the 'fast' and 'histogram' extraction modes against the full resolution result.
+
+Usage:
+    python benchmarks/palette_drift.py [--budgets 5000 20000 50000 100000] [--bits 4 5 6] [--megapixels 1 4 12]
+"""
+import argparse
+import os
+import pathlib
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image as PILImage
+
+sys.path.insert(0, '.')
+
+from streamlit_camouflage.v1.objects import Clothing
+from streamlit_camouflage.v1.utils import palette_drift
+
+TEST_IMAGES_PATH = pathlib.Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / "tests" / "test_images"
+
+
+def encode(image: PILImage.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def extract(image_bytes: bytes, n: int, **kwargs):
+    clothing = Clothing(BytesIO(image_bytes), **kwargs)
+    start = time.perf_counter()
+    clothing.extract_colors(n=n)
+    return clothing.colors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budgets", type=int, nargs="+", default=[5_000, 20_000, 50_000, 100_000])
+    parser.add_argument("--bits", type=int, nargs="+", default=[4, 5, 6])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[0.46, 4.0])
+    parser.add_argument("--n", type=int, default=4, help="Number of colors to extract")
+    args = parser.parse_args()
+
+    fixture = PILImage.open(TEST_IMAGES_PATH / "shirt_plaid_red_black_grey_no_background.jpg").convert('RGB')
+
+    print(f"{'image':>12} {'mode':>14} {'time (ms)':>10} {'drift (rgb)':>12}")
+    for megapixels in args.megapixels:
+        scale = (megapixels * 1e6 / (fixture.width * fixture.height)) ** 0.5
+        image = fixture.resize((int(fixture.width * scale), int(fixture.height * scale)), PILImage.BILINEAR)
+        image_bytes = encode(image)
+        label = f"{image.width}x{image.height}"
+
+        reference, full_time = extract(image_bytes, args.n)
+        print(f"{label:>12} {'full':>14} {full_time * 1000:10.1f} {0.0:12.2f}")
+        for budget in args.budgets:
+            colors, fast_time = extract(image_bytes, args.n, mode='fast', max_pixels=budget)
+            print(f"{label:>12} {'fast ' + str(budget):>14} {fast_time * 1000:10.1f} {palette_drift(reference, colors):12.2f}")
+        for bits in args.bits:
+            colors, histogram_time = extract(image_bytes, args.n, mode='histogram', quantize_bits=bits)
+            print(f"{label:>12} {'histogram ' + str(bits):>14} {histogram_time * 1000:10.1f} {palette_drift(reference, colors):12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Time every stage of the analysis pipeline and compare against a JSON baseline.
+
+Stages are decode, rembg, pixels (foreground extraction), kmeans (one per extraction mode), naming,
+color_desc (GetColorDescBatch, the classification /v1/matches, wardrobe and outfit requests run) and matches
+(GetValidMatches). They run on the fixture images and on synthetic garments at several resolutions and palette
+sizes. Each result records the best time per call, the throughput and the peak memory traced by tracemalloc,
+which sees NumPy and Python allocations but not the buffers of PIL images or onnxruntime. The rembg stages are skipped when the u2netp model cannot be loaded.
+
+Usage:
+    python benchmarks/pipeline.py [--megapixels 0.3 1 4] [--palette-sizes 2 4 8] [--save benchmarks/baseline.json]
+    python benchmarks/pipeline.py --baseline benchmarks/baseline.json [--threshold 0.25]
+
+Comparing against a baseline exits with status 1 when a stage is slower, or uses more memory, than the
+baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image as PILImage, ImageDraw
+
+sys.path.insert(0, '.')
+
+from streamlit_camouflage.v1.color_names import get_color_names
+from streamlit_camouflage.v1.decoding import decode_image
+from streamlit_camouflage.v1.fuzzy_classifier import GetColorDescBatch, GetValidMatches
+from streamlit_camouflage.v1.objects import EXTRACTION_MODES, cluster_colors, predict_mask
+from streamlit_camouflage.v1.utils import get_foreground_pixels, rgb_to_hsv_batch
+
+TEST_IMAGES_PATH = pathlib.Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / "tests" / "test_images"
+
+# Smallest duration of one timing sample, fast stages are called in a loop until they reach it
+MIN_SAMPLE_SECONDS = 0.02
+
+# Differences below these are noise and never reported as regressions
+MIN_REGRESSION = {"seconds": 0.0005, "peak_mb": 1.0}
+
+
+def synthetic_garment(megapixels: float, palette_size: int, seed: int = 0) -> Tuple[bytes, PILImage.Image]:
+    """A JPEG of a garment-shaped region striped with palette_size noisy colors on a white background
+
+    Returns:
+        Tuple[bytes, PILImage.Image]: Encoded image and its foreground mask
+    """
+    rng = np.random.default_rng(seed)
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+
+    palette = rng.integers(0, 256, (palette_size, 3))
+    stripes = palette[(np.arange(width) * palette_size * 3 // width) % palette_size]
+    array = np.broadcast_to(stripes, (height, width, 3)) + rng.normal(0, 6, (height, width, 3))
+    image = PILImage.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+
+    mask = PILImage.new('L', image.size, 0)
+    ImageDraw.Draw(mask).ellipse((width // 6, height // 10, width * 5 // 6, height * 9 // 10), fill=255)
+    image = PILImage.composite(image, PILImage.new('RGB', image.size, (255, 255, 255)), mask)
+
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue(), mask
+
+
+def fixture_images() -> List[Tuple[str, bytes, PILImage.Image]]:
+    """Fixture images with a foreground mask from their non-black pixels"""
+    fixtures = []
+    for path in sorted(TEST_IMAGES_PATH.glob("*.jpg")):
+        contents = path.read_bytes()
+        array = np.asarray(PILImage.open(BytesIO(contents)).convert('RGB'))
+        mask = PILImage.fromarray(np.where(array.max(axis=-1) > 16, 255, 0).astype(np.uint8), mode='L')
+        fixtures.append((path.stem, contents, mask))
+    return fixtures
+
+
+def measure(fn: Callable, repeat: int) -> Tuple[float, float]:
+    """Best time per call over repeat samples, and the peak traced memory of one call
+
+    Returns:
+        Tuple[float, float]: Seconds per call and peak memory in MB
+    """
+    fn()
+    loops = 1
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    if elapsed < MIN_SAMPLE_SECONDS:
+        loops = int(MIN_SAMPLE_SECONDS / max(elapsed, 1e-7)) + 1
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - start) / loops)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1e6
+
+
+def rembg_available() -> bool:
+    """Whether the u2netp model can be loaded"""
+    try:
+        predict_mask(PILImage.new('RGB', (64, 64)))
+    except Exception as e:
+        print(f"Skipping rembg, the model is unavailable: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def run_case(
+        contents: bytes,
+        mask: PILImage.Image,
+        n: int,
+        modes: List[str],
+        repeat: int,
+        rembg: bool
+    ) -> Dict[str, dict]:
+    """Benchmark every stage on one image
+
+    Returns:
+        Dict[str, dict]: Results by stage name
+    """
+    results = {}
+
+    def record(stage, fn, amount, unit):
+        seconds, peak_mb = measure(fn, repeat)
+        results[stage] = {
+            "seconds": seconds,
+            "throughput": amount / seconds,
+            "unit": unit,
+            "peak_mb": peak_mb,
+        }
+
+    image, _ = decode_image(BytesIO(contents))
+    megapixels = image.width * image.height / 1e6
+    record("decode", lambda: decode_image(BytesIO(contents)), megapixels, "MP/s")
+
+    if rembg:
+        record("rembg", lambda: predict_mask(image), megapixels, "MP/s")
+        record("rembg_lowres", lambda: predict_mask(image, lowres=True), megapixels, "MP/s")
+
+    pixels = get_foreground_pixels(image, mask)
+    record("pixels", lambda: get_foreground_pixels(image, mask), megapixels, "MP/s")
+
+    colors = None
+    for mode in modes:
+        record(f"kmeans_{mode}", lambda: cluster_colors(pixels, n, mode), len(pixels) / 1e6, "MP/s")
+        colors = colors or cluster_colors(pixels, n, mode)
+
+    rgbs = list(colors)
+    hsvs = rgb_to_hsv_batch(rgbs)
+    color_descs = GetColorDescBatch(hsvs)
+    record("naming", lambda: get_color_names(rgbs), len(rgbs), "colors/s")
+    record("color_desc", lambda: GetColorDescBatch(hsvs), len(rgbs), "colors/s")
+    record("matches", lambda: GetValidMatches(color_descs), 1, "outfits/s")
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Describe every result slower or heavier than its baseline by more than threshold"""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            expected = baseline[key][metric]
+            if result[metric] > expected * (1 + threshold) + MIN_REGRESSION[metric]:
+                regressions.append(f"{key} {metric}: {result[metric]:.4g} vs baseline {expected:.4g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[0.3, 1.0, 4.0])
+    parser.add_argument("--palette-sizes", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--modes", choices=EXTRACTION_MODES, nargs="+", default=list(EXTRACTION_MODES))
+    parser.add_argument("--n", type=int, default=4, help="Number of colors to extract from the fixture images")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="Write the results to this JSON baseline")
+    parser.add_argument("--baseline", help="Compare the results against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    cases = [(name, contents, mask, args.n) for name, contents, mask in fixture_images()]
+    for megapixels in args.megapixels:
+        for palette_size in args.palette_sizes:
+            contents, mask = synthetic_garment(megapixels, palette_size)
+            cases.append((f"synthetic_{megapixels:g}mp_{palette_size}colors", contents, mask, palette_size))
+
+    rembg = rembg_available()
+    results = {}
+    print(f"{'case':>36} {'stage':>18} {'time (ms)':>10} {'throughput':>18} {'peak (MB)':>10}")
+    for name, contents, mask, n in cases:
+        for stage, result in run_case(contents, mask, n, args.modes, args.repeat, rembg).items():
+            results[f"{name}/{stage}"] = result
+            throughput = f"{result['throughput']:.4g} {result['unit']}"
+            print(f"{name:>36} {stage:>18} {result['seconds'] * 1000:10.3f} {throughput:>18} {result['peak_mb']:10.1f}")
+
+    if args.save:
+        document = {
+            "environment": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "processor": platform.processor(),
+                "cpus": os.cpu_count(),
+            },
+            "results": results,
+        }
+        with open(args.save, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Saved {len(results)} results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions over {args.threshold:.0%} against {args.baseline}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
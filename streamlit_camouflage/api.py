@@ -1,16 +1,31 @@
+from contextlib import asynccontextmanager
 import logging
 import sys
+import threading
 
 from fastapi import FastAPI
 import uvicorn
 
 sys.path.insert(0, '.')
 
+from streamlit_camouflage.v1.config import PRELOAD
 from streamlit_camouflage.v1.endpoints import router as v1_router
+from streamlit_camouflage.v1.models import mark_ready, preload
+from streamlit_camouflage.v1.workers import WORKER_POOL
 
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm up models in the background, /v1/ready reports when they are done
+    if PRELOAD:
+        threading.Thread(target=preload, daemon=True, name="preload").start()
+    else:
+        mark_ready()
+    yield
+    WORKER_POOL.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 v1_app = FastAPI()
 v1_app.include_router(v1_router)
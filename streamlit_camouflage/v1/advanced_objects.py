@@ -1,42 +1,21 @@
 from io import BytesIO
 from typing import Dict, List, Tuple, NewType
 
-from colorsys import rgb_to_hsv
 import numpy as np
 from PIL import Image
-from rembg import remove, new_session
-from scipy.spatial import KDTree
-from sklearn.cluster import KMeans
-import streamlit as st
-from webcolors import (
-    CSS3_HEX_TO_NAMES,
-    hex_to_rgb,
-)
-
-from streamlit_camouflage.v1.fuzzy_classifier import GetValidMatches, GetColorDesc
-
-@st.cache_resource
-def get_session():
-    return new_session("u2netp")
-
-@st.cache_resource
-def get_kdt_db():
-    names = []
-    rgb_values = []
-    for color_hex, color_name in CSS3_HEX_TO_NAMES.items():
-        names.append(color_name)
-        rgb_values.append(hex_to_rgb(color_hex))
-    
-    return names, KDTree(rgb_values)
-
-SESSION = get_session()
 
-COLOR_NAMES, KDT_DB = get_kdt_db()
+from streamlit_camouflage.v1.fuzzy_classifier import GetValidMatches, GetColorDescBatch
+from streamlit_camouflage.v1.color_names import get_color_names
+from streamlit_camouflage.v1.hierarchy import ColorHierarchy
+from streamlit_camouflage.v1.models import get_session
+from streamlit_camouflage.v1.utils import get_foreground_pixels, rgb_to_hsv_batch
 
 Colors = NewType('Colors', Dict[Tuple[float, float, float], float])
 
 DEFAULT_EXTRACT_N = 4
 DENOISE_N = 2
+# Largest number of colors answered from the clustering of the first extraction, more colors cluster again
+MAX_N_COLORS = 8
 
 class Clothing:
     """Describes an article of clothing"""
@@ -47,18 +26,24 @@ class Clothing:
             image_bytes (BytesIO): Image of the clothing item
         """
         self.image_bytes: BytesIO = image_bytes
-        self.image: np.ndarray = Image.open(image_bytes).convert('RGB')
-        self.image_rembg: np.ndarray = None
+        self.image: Image.Image = Image.open(image_bytes).convert('RGB')
+        self.image_rembg: Image.Image = None
         self.colors: Colors = None
         self.n_colors: int = None
+        self.hierarchy: ColorHierarchy = None
 
     def rembg(self):
         """Remove background from the clothing image"""
-        self.image_rembg = remove(self.image, session=SESSION).convert('RGB')
+        from rembg import remove
+
+        self.image_rembg = remove(self.image, session=get_session())
 
     def set_n_colors(self, n: int):
         """Set the maximum number of colors in the clothing item
 
+        Colors already extracted are answered from the stored cluster hierarchy, without clustering the
+        pixels again unless n is over the number of clusters it was fitted with.
+
         Args:
             n (int): The maximum number of colors
         """
@@ -72,36 +57,43 @@ class Clothing:
         Args:
             n (float, optional): Number of colors to extract from the image. Defaults to 4.
         """
-        if not self.image_rembg:
-            self.rembg()
-        
-        pixels = np.array([pixel for row in np.array(self.image_rembg) for pixel in row if sum(pixel) != 0])
-    
-        # Find clusters of colors to determine dominant colors
         n = self.n_colors + DENOISE_N if self.n_colors is not None else DEFAULT_EXTRACT_N
-        color_cluster = KMeans(n_clusters=n, random_state=1).fit(pixels)
-        cluster, colors = color_cluster, color_cluster.cluster_centers_
-        
-        # Compute the percent of the pixels containing that color
-        color_labels = np.arange(0, len(np.unique(cluster.labels_)) + 1)
-        (color_hist, _) = np.histogram(cluster.labels_, bins = color_labels)
-        color_hist = color_hist.astype("float")
-        color_hist /= color_hist.sum()
+        if self.hierarchy is None or n > self.hierarchy.n_clusters:
+            self.fit_hierarchy(max(n, MAX_N_COLORS + DENOISE_N))
 
-        # Remove the noise colors
+        # Remove the noise colors, images with fewer distinct colors than n keep at most n - DENOISE_N of theirs
         image_colors = dict()
-        pct_colors = sorted([(percent, color) for percent, color in zip(color_hist, colors)])[::-1]
-        pct_colors = pct_colors[:(-1*DENOISE_N)]
+        palette = self.hierarchy.palette(min(n, self.hierarchy.max_k))
+        pct_colors = [(percent, color) for color, percent in palette.items()]
+        pct_colors = pct_colors[:n - DENOISE_N]
         total_pct = sum([percent for percent, color in pct_colors])
         pct_colors = [(percent / total_pct, color) for percent, color in pct_colors]
 
         # Save the color and the percent of pixels with that color
         for pct, color in pct_colors:
-            color = tuple(color.tolist())
             image_colors[color] = pct
 
         self.colors = image_colors
 
+    def fit_hierarchy(self, max_k: int):
+        """Cluster the foreground pixels into max_k colors and build the hierarchy of smaller palettes
+
+        Args:
+            max_k (int): Number of clusters fitted
+        """
+        from sklearn.cluster import KMeans
+
+        if not self.image_rembg:
+            self.rembg()
+        
+        pixels = get_foreground_pixels(self.image_rembg)
+    
+        # Find clusters of colors to determine dominant colors
+        k = min(max_k, len(pixels))
+        color_cluster = KMeans(n_clusters=k, random_state=1).fit(pixels)
+        color_hist = np.bincount(color_cluster.labels_, minlength=k)
+        self.hierarchy = ColorHierarchy(color_cluster.cluster_centers_, color_hist)
+
 
     def get_colors(self) -> List[Tuple[float, float, float]]:
         """Gets the list of colors as rgb values in order of frequency
@@ -124,11 +116,7 @@ class Clothing:
         Returns:
             List[str]: List of color names in order of frequency in the clothing image
         """
-        color_names = []
-        for color in self.get_colors():
-            distance, index = KDT_DB.query(color)
-            color_names.append(COLOR_NAMES[index])
-        return color_names
+        return get_color_names(self.get_colors())
 
     def get_color_rect(self, height: int = 50, width: int = 300) -> np.ndarray:
         """Get a numpy array of shape (width, height, 3) containing proportional amounts of each color in the
@@ -173,11 +161,9 @@ class Outfit:
             List[str]: List of names of outfit match types
         """
         rgbs = sum([clothing.get_colors() for clothing in self], start=[])
-        rgb_norms = [(r/255.0, g/255.0, b/255.0) for r, g, b in rgbs]
-        hsv_norms = [rgb_to_hsv(r, g, b) for r, g, b in rgb_norms]
-        hsvs = [(h*360.0, s*100.0, v*100.0) for h, s, v in hsv_norms]
+        hsvs = rgb_to_hsv_batch(rgbs)
 
-        outfit = [GetColorDesc(hsv) for hsv in hsvs]
+        outfit = GetColorDescBatch(hsvs)
 
         matches = GetValidMatches(outfit)
 
@@ -1,5 +1,5 @@
-from typing import List
-from pydantic import BaseModel
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
 
 
 class Color(BaseModel):
@@ -10,11 +10,62 @@ class Color(BaseModel):
     pct: float
     name: str
 
+class ImageInfo(BaseModel):
+    width: int
+    height: int
+    decoded_width: int
+    decoded_height: int
+
+class Palette(BaseModel):
+    n: int
+    colors: List[Color]
+
 class Colors(BaseModel):
     colors: List[Color]
+    image: Optional[ImageInfo] = None
+    palettes: Optional[List[Palette]] = None
 
 class Outfit(BaseModel):
     outfit: List[Colors]
 
 class Matches(BaseModel):
-    matches: List[str]
\ No newline at end of file
+    matches: List[str]
+
+class Garment(BaseModel):
+    id: str
+    slot: str
+    colors: List[Color]
+
+class Wardrobe(BaseModel):
+    garments: List[Garment]
+
+class WardrobeCombination(BaseModel):
+    garments: List[str]
+    matches: List[str]
+
+class SamplerInfo(BaseModel):
+    id: str
+    width: int
+    height: int
+    masked: bool
+
+class Point(BaseModel):
+    x: float
+    y: float
+
+class SampleQuery(BaseModel):
+    points: List[Point]
+    radius: int = Field(5, ge=0, le=256)
+    method: Literal['mean', 'dominant'] = 'mean'
+    palette: Literal['css3', 'xkcd'] = 'css3'
+
+class GarmentRegion(BaseModel):
+    name: str
+    box: List[int]
+    pct: float
+    colors: List[Color]
+
+class OutfitAnalysis(BaseModel):
+    regions: List[GarmentRegion]
+    matches: List[str]
+    image: Optional[ImageInfo] = None
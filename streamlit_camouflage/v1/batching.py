@@ -0,0 +1,150 @@
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image as PILImage
+
+from streamlit_camouflage.v1.config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+from streamlit_camouflage.v1.metrics import MODEL_IMAGES, MODEL_INFERENCES
+from streamlit_camouflage.v1.models import MODEL_NAME
+
+logger = logging.getLogger(__name__)
+
+# u2netp preprocessing, as in rembg's U2netpSession.predict
+MODEL_SIZE = (320, 320)
+MODEL_MEAN = (0.485, 0.456, 0.406)
+MODEL_STD = (0.229, 0.224, 0.225)
+
+Size = Tuple[int, int]
+
+
+def predict_masks(
+        session,
+        images: List[PILImage.Image],
+        sizes: Optional[List[Optional[Size]]] = None
+    ) -> List[PILImage.Image]:
+    """Predict the foreground masks of images with a rembg u2netp session in a single inference
+
+    Args:
+        session: rembg session
+        images (List[PILImage.Image]): Images to segment
+        sizes (List[Optional[Size]], optional): Size of each mask, None for the size of its image. Defaults to None.
+
+    Returns:
+        List[PILImage.Image]: Grayscale masks, each the requested size
+    """
+    sizes = sizes or [None] * len(images)
+    inputs = [session.normalize(image, MODEL_MEAN, MODEL_STD, MODEL_SIZE) for image in images]
+    input_name = next(iter(inputs[0]))
+    batch = np.concatenate([i[input_name] for i in inputs], axis=0)
+    preds = session.inner_session.run(None, {input_name: batch})[0][:, 0, :, :]
+    MODEL_INFERENCES.inc(model=MODEL_NAME)
+    MODEL_IMAGES.inc(len(images), model=MODEL_NAME)
+
+    masks = []
+    for image, size, pred in zip(images, sizes, preds):
+        ma = np.max(pred)
+        mi = np.min(pred)
+        if ma > mi:
+            pred = (pred - mi) / (ma - mi)
+        else:
+            # A flat prediction, e.g. of a blank image, has no range to stretch, keep its probability
+            pred = np.clip(np.nan_to_num(pred), 0, 1)
+        mask = PILImage.fromarray((pred * 255).astype("uint8"), mode="L")
+        masks.append(mask.resize(size or image.size, PILImage.LANCZOS))
+    return masks
+
+
+def has_dynamic_batch(session) -> bool:
+    """Whether the model accepts more than one image per inference"""
+    batch_dim = session.inner_session.get_inputs()[0].shape[0]
+    return not isinstance(batch_dim, int) or batch_dim != 1
+
+
+class MaskBatcher:
+    """Collects concurrent mask predictions into batched inferences
+
+    Callers block in predict() while a background thread waits up to max_wait_ms for up to max_batch_size
+    images, runs them through the model in one call and hands every caller its own mask. Models with a fixed
+    batch size of 1, or a max_batch_size of 1, predict in the caller's thread instead.
+    """
+
+    def __init__(self, get_session: Callable, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        """
+        Args:
+            get_session (Callable): Returns the rembg session, called on first use
+            max_batch_size (int, optional): Maximum number of images per inference. Defaults to 8.
+            max_wait_ms (float, optional): Longest time the first image of a batch waits for others. Defaults to 5.
+        """
+        self.get_session: Callable = get_session
+        self.max_batch_size: int = max_batch_size
+        self.max_wait_ms: float = max_wait_ms
+        self.batches: int = 0
+        self.images: int = 0
+        self._queue: "queue.Queue[Tuple[PILImage.Image, Optional[Size], Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._batched: Optional[bool] = None
+
+    def _start(self):
+        with self._lock:
+            if self._batched is None:
+                session = self.get_session()
+                self._batched = has_dynamic_batch(session)
+                if not self._batched:
+                    logger.info("Model has a fixed batch size of 1, masks are predicted without batching")
+                    return
+                self._thread = threading.Thread(target=self._run, args=(session,), daemon=True, name="mask-batcher")
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[PILImage.Image, Optional[Size], Future]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, session):
+        while True:
+            batch = self._collect()
+            images = [image for image, _, _ in batch]
+            sizes = [size for _, size, _ in batch]
+            try:
+                masks = predict_masks(session, images, sizes)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images += len(batch)
+            for (_, _, future), mask in zip(batch, masks):
+                future.set_result(mask)
+
+    def predict(self, image: PILImage.Image, size: Optional[Size] = None) -> PILImage.Image:
+        """Predict the foreground mask of an image, blocking until its batch has run
+
+        Args:
+            image (PILImage.Image): Image to segment
+            size (Optional[Size], optional): Size of the mask, None for the size of the image. Defaults to None.
+
+        Returns:
+            PILImage.Image: Grayscale mask of the requested size
+        """
+        if self.max_batch_size > 1:
+            self._start()
+        if not self._batched:
+            return predict_masks(self.get_session(), [image], [size])[0]
+
+        future = Future()
+        self._queue.put((image, size, future))
+        return future.result()
@@ -0,0 +1,208 @@
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Awaitable, Callable, Dict, Optional
+
+from streamlit_camouflage.v1.config import CACHE_DIR, CACHE_DISK_MAX_BYTES, CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """Content-addressed cache of encoded results
+
+    Results live in a byte-budgeted in-memory LRU tier and, when a directory is given, in a local disk tier
+    with its own byte budget. Disk entries are evicted least recently used first, by modification time, which
+    disk hits refresh. Concurrent requests for the same key are coalesced so only one computation runs.
+    """
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None, max_disk_bytes: int = CACHE_DISK_MAX_BYTES):
+        """
+        Args:
+            max_bytes (int): Budget of the in-memory tier in bytes
+            directory (str, optional): Directory of the disk tier. If None, only the memory tier is used
+            max_disk_bytes (int, optional): Budget of the disk tier in bytes. Defaults to CACHE_DISK_MAX_BYTES.
+        """
+        self.max_bytes: int = max_bytes
+        self.directory: Optional[str] = directory
+        self.max_disk_bytes: int = max_disk_bytes
+        self.size: int = 0
+        self.disk_size: int = 0
+        self.hits: int = 0
+        self.disk_hits: int = 0
+        self.misses: int = 0
+        self.coalesced: int = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._disk_entries: "Optional[OrderedDict[str, int]]" = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def make_key(namespace: str, content: bytes, **params) -> str:
+        """Build a cache key from the uploaded bytes and the parameters of the computation
+
+        Args:
+            namespace (str): Kind of result, e.g. the route name
+            content (bytes): Uploaded bytes
+
+        Returns:
+            str: Hex digest identifying the result
+        """
+        digest = hashlib.sha256()
+        digest.update(namespace.encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _disk_index(self) -> "OrderedDict[str, int]":
+        """Sizes of the entries of the disk tier, least recently used first, read from the directory on first use"""
+        if self._disk_entries is None:
+            entries = []
+            if os.path.isdir(self.directory):
+                for prefix in os.scandir(self.directory):
+                    if not prefix.is_dir():
+                        continue
+                    for entry in os.scandir(prefix.path):
+                        # Skip the temporary files of interrupted writes
+                        if entry.is_file() and entry.name.startswith(prefix.name):
+                            stat = entry.stat()
+                            entries.append((stat.st_mtime, entry.name, stat.st_size))
+            self._disk_entries = OrderedDict((key, size) for _, key, size in sorted(entries))
+            self.disk_size = sum(self._disk_entries.values())
+        return self._disk_entries
+
+    def _evict_disk(self):
+        index = self._disk_index()
+        while self.disk_size > self.max_disk_bytes and index:
+            key, size = index.popitem(last=False)
+            self.disk_size -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Unable to evict cache entry {key}: {e}")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Get a cached result, promoting disk hits to memory
+
+        Returns:
+            Optional[bytes]: The cached result, None on a miss
+        """
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+        if self.directory is not None:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    value = f.read()
+            except FileNotFoundError:
+                return None
+            self.disk_hits += 1
+            index = self._disk_index()
+            if key in index:
+                index.move_to_end(key)
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+            self._put_memory(key, value)
+            return value
+
+        return None
+
+    def _put_memory(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self.size -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def put(self, key: str, value: bytes):
+        """Store a result in every tier"""
+        self._put_memory(key, value)
+        if self.directory is not None and len(value) <= self.max_disk_bytes:
+            path = self._path(key)
+            index = self._disk_index()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                    f.write(value)
+                os.replace(f.name, path)
+            except OSError as e:
+                logger.warning(f"Unable to write cache entry {key}: {e}")
+                return
+            self.disk_size += len(value) - index.pop(key, 0)
+            index[key] = len(value)
+            self._evict_disk()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Get a cached result or compute it, sharing one computation between concurrent callers
+
+        Args:
+            key (str): Cache key from make_key
+            compute (Callable[[], Awaitable[bytes]]): Computes the result on a miss
+
+        Returns:
+            bytes: The result
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        self.put(key, value)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and memory and disk usage"""
+        stats = {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
+        if self.directory is not None:
+            stats.update({
+                "disk_entries": len(self._disk_index()),
+                "disk_bytes": self.disk_size,
+                "max_disk_bytes": self.max_disk_bytes,
+            })
+        return stats
+
+
+RESULT_CACHE = ResultCache(CACHE_MAX_BYTES, CACHE_DIR)
@@ -0,0 +1,228 @@
+"""Name RGB colors from a quantized RGB cube of palette indices.
+
+Every cell of a 2^bits per channel RGB cube holds the index of the palette color nearest to the cell
+center, so naming any number of colors is a single gather. Cells where another palette color may be
+nearer to part of the cell are flagged ambiguous, and colors falling in them are compared to the whole
+palette unless exact=False, so names match an exact nearest neighbour search. The cubes are built offline, with distances
+in RGB for CSS3 (as the KDTree it replaces) and in CIE Lab for the larger XKCD color survey palette, and
+shipped in v1/data:
+
+    python -m streamlit_camouflage.v1.color_names build|verify [--palette css3|xkcd]
+"""
+import argparse
+from functools import lru_cache
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+TABLE_DIRECTORY = os.path.join(os.path.dirname(__file__), 'data')
+
+# Palette name -> color space the nearest palette color is searched in
+PALETTES = {
+    'css3': 'rgb',
+    'xkcd': 'lab',
+}
+DEFAULT_PALETTE = 'css3'
+CUBE_BITS = 6
+# Slack on the cell radius, Lab distances within a cell are only approximately bounded by its corners
+AMBIGUITY_MARGIN = 1.25
+
+# sRGB (D65) to CIE XYZ, and the D65 white point
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+
+def get_palette_colors(palette: str) -> Dict[str, Tuple[int, int, int]]:
+    """Names and RGB values of a palette, read from the package that defines it
+
+    Args:
+        palette (str): One of PALETTES
+
+    Returns:
+        Dict[str, Tuple[int, int, int]]: RGB value of every color name
+    """
+    from webcolors import hex_to_rgb
+
+    if palette == 'css3':
+        from webcolors import CSS3_HEX_TO_NAMES
+        return {name: tuple(hex_to_rgb(color_hex)) for color_hex, name in CSS3_HEX_TO_NAMES.items()}
+    if palette == 'xkcd':
+        from matplotlib._color_data import XKCD_COLORS
+        return {name[len('xkcd:'):]: tuple(hex_to_rgb(color_hex)) for name, color_hex in XKCD_COLORS.items()}
+    raise ValueError(f"Unknown palette '{palette}', expected one of {list(PALETTES)}")
+
+
+def rgb_to_lab(rgbs) -> np.ndarray:
+    """Convert RGB values (0 to 255) to CIE Lab (D65)
+
+    Args:
+        rgbs: Array-like of shape (N, 3)
+
+    Returns:
+        np.ndarray: Array of shape (N, 3) of L, a, b values
+    """
+    rgb = np.asarray(rgbs, dtype=np.float64).reshape(-1, 3) / 255.0
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    xyz = linear @ _RGB_TO_XYZ.T / _WHITE_D65
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def to_color_space(rgbs, space: str) -> np.ndarray:
+    """RGB values (0 to 255) in the color space distances are measured in, 'rgb' or 'lab'"""
+    if space == 'lab':
+        return rgb_to_lab(rgbs)
+    return np.asarray(rgbs, dtype=np.float64).reshape(-1, 3)
+
+
+def table_path(palette: str) -> str:
+    return os.path.join(TABLE_DIRECTORY, f'color_names_{palette}.npz')
+
+
+def build_table(palette: str, bits: int = CUBE_BITS, chunk_size: int = 16384) -> Dict[str, np.ndarray]:
+    """Find the nearest palette color to the center of every cell of the RGB cube
+
+    Args:
+        palette (str): One of PALETTES
+        bits (int, optional): Bits per channel of the cube. Defaults to CUBE_BITS.
+        chunk_size (int, optional): Cells compared to the palette at once. Defaults to 16384.
+
+    Returns:
+        Dict[str, np.ndarray]: 'names' and 'rgb' of the palette colors, 'table', the flat cube of palette
+            indices indexed by (r << 2 * bits) | (g << bits) | b of the quantized channels, and 'ambiguous',
+            whether the nearest palette color may differ within each cell
+    """
+    colors = get_palette_colors(palette)
+    names = np.array(list(colors))
+    rgb = np.array(list(colors.values()), dtype=np.uint8)
+
+    side = 1 << bits
+    step = 256 // side
+    levels = np.arange(side) * step + (step - 1) / 2
+    centers = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    # Offsets from a cell center to its corners
+    corners = np.stack(np.meshgrid(*[[-step / 2, step / 2]] * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    palette_points = to_color_space(rgb, PALETTES[palette])
+    table = np.empty(len(centers), dtype=np.uint8 if len(names) <= 256 else np.uint16)
+    ambiguous = np.empty(len(centers), dtype=bool)
+    for start in range(0, len(centers), chunk_size):
+        chunk = centers[start:start + chunk_size]
+        points = to_color_space(chunk, PALETTES[palette])
+        distances = np.sqrt(((points[:, None, :] - palette_points[None, :, :]) ** 2).sum(axis=-1))
+        nearest = np.partition(distances, 1, axis=1)[:, :2]
+        table[start:start + chunk_size] = distances.argmin(axis=1)
+
+        # Every point of the cell is within radius of its center, so the nearest color can only change when the
+        # runner-up is less than twice that further away
+        radius = np.zeros(len(chunk))
+        for corner in corners:
+            corner_points = to_color_space(np.clip(chunk + corner, 0, 255), PALETTES[palette])
+            radius = np.maximum(radius, np.sqrt(((corner_points - points) ** 2).sum(axis=-1)))
+        ambiguous[start:start + chunk_size] = nearest[:, 1] - nearest[:, 0] <= 2 * radius * AMBIGUITY_MARGIN
+    return {'names': names, 'rgb': rgb, 'table': table, 'ambiguous': ambiguous}
+
+
+def save_table(palette: str, path: str = None):
+    """Build a palette's cube and save it to v1/data"""
+    os.makedirs(TABLE_DIRECTORY, exist_ok=True)
+    np.savez_compressed(path or table_path(palette), **build_table(palette))
+
+
+@lru_cache(maxsize=None)
+def get_table(palette: str = DEFAULT_PALETTE) -> Dict[str, np.ndarray]:
+    """The cube of a palette, loaded from v1/data on first use and built if it is missing
+
+    Returns:
+        Dict[str, np.ndarray]: Arrays described in build_table
+    """
+    if palette not in PALETTES:
+        raise ValueError(f"Unknown palette '{palette}', expected one of {list(PALETTES)}")
+    path = table_path(palette)
+    if not os.path.exists(path):
+        return build_table(palette)
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def get_color_indices(rgbs, palette: str = DEFAULT_PALETTE, exact: bool = True, chunk_size: int = 4096) -> np.ndarray:
+    """Palette indices of the nearest named color of RGB values (0 to 255), in one gather
+
+    Args:
+        rgbs: Array-like of shape (N, 3)
+        palette (str, optional): One of PALETTES. Defaults to DEFAULT_PALETTE.
+        exact (bool, optional): Compare colors in ambiguous cells to the whole palette, otherwise every color
+            takes the name of its cell center. Defaults to True.
+        chunk_size (int, optional): Ambiguous colors compared to the palette at once. Defaults to 4096.
+
+    Returns:
+        np.ndarray: Array of shape (N,) of indices into the palette names
+    """
+    data = get_table(palette)
+    bits = round(np.log2(len(data['table'])) / 3)
+    rgbs = np.clip(np.asarray(rgbs, dtype=np.float64).reshape(-1, 3), 0, 255)
+    quantized = rgbs.astype(np.int64) >> (8 - bits)
+    cells = (quantized[:, 0] << 2 * bits) | (quantized[:, 1] << bits) | quantized[:, 2]
+    indices = data['table'][cells].astype(np.int64)
+
+    if not exact:
+        return indices
+
+    # Colors in ambiguous cells are compared to the whole palette
+    ambiguous = np.flatnonzero(data['ambiguous'][cells])
+    space = PALETTES[palette]
+    palette_points = to_color_space(data['rgb'], space)
+    for start in range(0, len(ambiguous), chunk_size):
+        rows = ambiguous[start:start + chunk_size]
+        points = to_color_space(rgbs[rows], space)
+        distances = ((points[:, None, :] - palette_points[None, :, :]) ** 2).sum(axis=-1)
+        indices[rows] = distances.argmin(axis=1)
+    return indices
+
+
+def get_color_names(rgbs, palette: str = DEFAULT_PALETTE, exact: bool = True) -> List[str]:
+    """Names of the nearest palette color of RGB values (0 to 255)
+
+    Args:
+        rgbs: Array-like of shape (N, 3)
+        palette (str, optional): One of PALETTES. Defaults to DEFAULT_PALETTE.
+        exact (bool, optional): See get_color_indices. Defaults to True.
+
+    Returns:
+        List[str]: Color names, in the order of rgbs
+    """
+    return get_table(palette)['names'][get_color_indices(rgbs, palette, exact)].tolist()
+
+
+def verify_table(palette: str) -> int:
+    """Number of cells where the shipped cube disagrees with a fresh build"""
+    data = get_table(palette)
+    expected = build_table(palette)
+    if data['names'].tolist() != expected['names'].tolist():
+        return len(data['table'])
+    return int((data['table'] != expected['table']).sum() + (data['ambiguous'] != expected['ambiguous']).sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or verify the color name lookup cubes")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--palette", choices=list(PALETTES), nargs="*", default=list(PALETTES))
+    args = parser.parse_args()
+
+    mismatches = 0
+    for palette in args.palette:
+        if args.command == "build":
+            save_table(palette)
+            print(f"Saved {palette} cube to {table_path(palette)}")
+        else:
+            palette_mismatches = verify_table(palette)
+            print(f"{palette}: {palette_mismatches} mismatches")
+            mismatches += palette_mismatches
+    if mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,30 @@
+import os
+
+# Result cache
+CACHE_MAX_BYTES = int(os.environ.get("CAMOUFLAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_DIR = os.environ.get("CAMOUFLAGE_CACHE_DIR") or None
+CACHE_DISK_MAX_BYTES = int(os.environ.get("CAMOUFLAGE_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Worker pool for CPU-bound stages
+WORKER_KIND = os.environ.get("CAMOUFLAGE_WORKER_KIND", "thread")
+WORKERS = int(os.environ.get("CAMOUFLAGE_WORKERS", os.cpu_count() or 1))
+MAX_QUEUED_JOBS = int(os.environ.get("CAMOUFLAGE_MAX_QUEUED_JOBS", 64))
+MAX_QUEUED_MEGAPIXELS = float(os.environ.get("CAMOUFLAGE_MAX_QUEUED_MEGAPIXELS", 200))
+
+# Micro-batching of background removal inference
+BATCH_MAX_SIZE = int(os.environ.get("CAMOUFLAGE_BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get("CAMOUFLAGE_BATCH_MAX_WAIT_MS", 5))
+
+# Model lifecycle
+PRELOAD = os.environ.get("CAMOUFLAGE_PRELOAD", "1") != "0"
+ORT_INTRA_OP_THREADS = int(os.environ.get("CAMOUFLAGE_ORT_INTRA_OP_THREADS", 0))
+ORT_INTER_OP_THREADS = int(os.environ.get("CAMOUFLAGE_ORT_INTER_OP_THREADS", 0))
+ORT_GRAPH_OPTIMIZATION = os.environ.get("CAMOUFLAGE_ORT_GRAPH_OPTIMIZATION", "all")
+
+# Upload decoding
+MAX_IMAGE_PIXELS = int(os.environ.get("CAMOUFLAGE_MAX_IMAGE_PIXELS", 100_000_000))
+
+# Region sampling, prepared samplers are kept per upload until unused for the TTL
+SAMPLER_CACHE_MAX_ENTRIES = int(os.environ.get("CAMOUFLAGE_SAMPLER_CACHE_MAX_ENTRIES", 32))
+SAMPLER_CACHE_TTL = float(os.environ.get("CAMOUFLAGE_SAMPLER_CACHE_TTL", 15 * 60))
+SAMPLER_CACHE_MAX_BYTES = int(os.environ.get("CAMOUFLAGE_SAMPLER_CACHE_MAX_BYTES", 256 * 1024 * 1024))
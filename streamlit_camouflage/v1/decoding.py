@@ -0,0 +1,110 @@
+from io import BytesIO
+from typing import Optional, Tuple
+import warnings
+
+from PIL import Image as PILImage, ImageOps
+
+from streamlit_camouflage.v1.config import MAX_IMAGE_PIXELS
+from streamlit_camouflage.v1.metrics import timed
+from streamlit_camouflage.v1.utils import has_alpha, scaled_size
+
+Size = Tuple[int, int]
+
+
+class ImageTooLarge(Exception):
+    """Raised when an upload would decode to more than MAX_IMAGE_PIXELS pixels"""
+
+    def __init__(self, size: Optional[Size], max_pixels: int):
+        self.size: Optional[Size] = size
+        self.max_pixels: int = max_pixels
+        dimensions = f" of {size[0]}x{size[1]} pixels" if size is not None else ""
+        super().__init__(f"Image{dimensions} is over the limit of {max_pixels} pixels")
+
+
+# EXIF orientation tag, and the orientations that swap width and height
+ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def _open(image_bytes: BytesIO, max_side: Optional[int], max_pixels: Optional[int]) -> Tuple[PILImage.Image, Size]:
+    """Open an image from its header, rejecting decompression bombs and setting up reduced-scale JPEG decoding
+
+    Returns:
+        Tuple[PILImage.Image, Size]: The image, not decoded yet, and its oriented width and height
+    """
+    max_pixels = max_pixels or MAX_IMAGE_PIXELS
+    try:
+        with warnings.catch_warnings():
+            # The limit is enforced below, PIL's own limit only matters past twice its default
+            warnings.simplefilter('ignore', PILImage.DecompressionBombWarning)
+            image = PILImage.open(image_bytes)
+    except PILImage.DecompressionBombError:
+        raise ImageTooLarge(None, max_pixels)
+
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLarge(image.size, max_pixels)
+    if image.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+
+    # JPEG DCT scaling decodes at the smallest 1/2, 1/4 or 1/8 scale still covering the working size
+    if max_side is not None and image.format == 'JPEG':
+        image.draft('RGB', scaled_size(image.size, max_side))
+    return image, (width, height)
+
+
+def probe_image(
+        image_bytes: BytesIO,
+        max_side: Optional[int] = None,
+        max_pixels: Optional[int] = None
+    ) -> Tuple[Size, Size]:
+    """Read the size of an upload and the size decode_image decodes it at, without decoding it
+
+    Args:
+        image_bytes (BytesIO): Encoded image
+        max_side (Optional[int], optional): Working size, see decode_image. Defaults to None.
+        max_pixels (Optional[int], optional): Largest number of pixels accepted. Defaults to MAX_IMAGE_PIXELS.
+
+    Raises:
+        ImageTooLarge: The image is over max_pixels
+
+    Returns:
+        Tuple[Size, Size]: Oriented width and height of the upload and of the decoded image
+    """
+    image, original_size = _open(image_bytes, max_side, max_pixels)
+    decoded_size = image.size
+    if image.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+        decoded_size = decoded_size[::-1]
+    if max_side is not None:
+        decoded_size = scaled_size(decoded_size, max_side)
+    return original_size, decoded_size
+
+
+def decode_image(
+        image_bytes: BytesIO,
+        max_side: Optional[int] = None,
+        max_pixels: Optional[int] = None
+    ) -> Tuple[PILImage.Image, Size]:
+    """Decode an upload as RGB, or RGBA when it carries transparency, at no more than its working size
+
+    JPEGs are decoded directly at a reduced scale, other formats are decoded in full and downsampled.
+    The image is rotated according to its EXIF orientation.
+
+    Args:
+        image_bytes (BytesIO): Encoded image
+        max_side (Optional[int], optional): Longest side of the decoded image. Defaults to None, the full image.
+        max_pixels (Optional[int], optional): Largest number of pixels accepted. Defaults to MAX_IMAGE_PIXELS.
+
+    Raises:
+        ImageTooLarge: The image is over max_pixels
+
+    Returns:
+        Tuple[PILImage.Image, Size]: The decoded image and the oriented width and height of the upload
+    """
+    with timed("decode"):
+        image, original_size = _open(image_bytes, max_side, max_pixels)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA') if has_alpha(image) else image.convert('RGB')
+        if max_side is not None and scaled_size(image.size, max_side) != image.size:
+            image = image.resize(scaled_size(image.size, max_side), PILImage.LANCZOS, reducing_gap=3.0)
+    return image, original_size
@@ -1,38 +1,341 @@
+from io import BytesIO
 import logging
+import time
+from typing import Callable, List, Literal, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, UploadFile, Response
-from colorsys import rgb_to_hsv
+from fastapi import APIRouter, Header, HTTPException, Query, Request, UploadFile, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
+import numpy as np
 
-from streamlit_camouflage.v1.objects import Clothing, Image
-from streamlit_camouflage.v1.api_spec import Colors, Matches, Outfit
-from streamlit_camouflage.v1.fuzzy_classifier import GetValidMatches, GetColorDesc
+from streamlit_camouflage.v1.objects import (
+    Clothing,
+    Image,
+    build_sampler,
+    cluster_region_colors,
+    DEFAULT_COMPRESS_LEVEL,
+    DEFAULT_JPEG_QUALITY,
+    DEFAULT_MAX_PIXELS,
+    DEFAULT_QUANTIZE_BITS,
+    MAX_COLORS,
+    OUTPUT_MEDIA_TYPES,
+)
+from streamlit_camouflage.v1.api_spec import (
+    Colors,
+    GarmentRegion,
+    ImageInfo,
+    Matches,
+    Outfit,
+    OutfitAnalysis,
+    SampleQuery,
+    SamplerInfo,
+    Wardrobe,
+    WardrobeCombination,
+)
+from streamlit_camouflage.v1.cache import RESULT_CACHE, ResultCache
+from streamlit_camouflage.v1.color_names import DEFAULT_PALETTE, get_color_names
+from streamlit_camouflage.v1.decoding import ImageTooLarge, Size, probe_image
+from streamlit_camouflage.v1.metrics import (
+    IMAGE_MEGAPIXELS,
+    REQUEST_LATENCY,
+    REQUESTS_IN_FLIGHT,
+    TIMINGS,
+    render_metrics,
+    server_timing,
+    timed,
+)
+from streamlit_camouflage.v1.models import is_ready, status
+from streamlit_camouflage.v1.fuzzy_classifier import GetValidMatches
+from streamlit_camouflage.v1.matching import get_color_descs, get_matches
+from streamlit_camouflage.v1.sampling import SAMPLER_CACHE
+from streamlit_camouflage.v1.segmentation import region_boxes, segment_garments
 from streamlit_camouflage.v1.utils import rgb_to_hex
-
-router = APIRouter()
+from streamlit_camouflage.v1.wardrobe import iter_combinations, rank_combinations
+from streamlit_camouflage.v1.workers import WORKER_POOL, Overloaded
 
 logger = logging.getLogger(__name__)
 
+
+class InstrumentedRoute(APIRoute):
+    """Route that collects stage timings into a Server-Timing header and records request metrics
+
+    Latency is measured until the endpoint returns its response, the body of streaming responses is sent after.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def instrumented_handler(request: Request) -> Response:
+            route = request.scope.get("root_path", "") + self.path
+            timings: List[Tuple[str, float]] = []
+            token = TIMINGS.set(timings)
+            REQUESTS_IN_FLIGHT.inc(route=route)
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                REQUESTS_IN_FLIGHT.dec(route=route)
+                REQUEST_LATENCY.observe(elapsed, method=request.method, route=route, status=str(status))
+                TIMINGS.reset(token)
+
+            response.headers["Server-Timing"] = server_timing(timings + [("total", elapsed)])
+            return response
+
+        return instrumented_handler
+
+
+router = APIRouter(route_class=InstrumentedRoute)
+
+# Longest side full-body photos are decoded at for outfit analysis
+DEFAULT_OUTFIT_SIDE = 1024
+
+# Longest side images are decoded at for region sampling, taps are in the coordinates of the decoded image
+DEFAULT_SAMPLE_SIDE = 1024
+
+# Outputs chosen by the Accept header when none is requested, 'mask' is only available as a query parameter
+ACCEPTED_OUTPUTS = {
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'multipart/mixed': 'jpeg',
+    'image/*': 'png',
+    '*/*': 'png',
+}
+
 @router.get("/")
 async def root():
     return {"message": "Hello World"}
 
 
-@router.post("/rembg", responses={200: {"content": {"image/png": {}}}}, response_class=Response)
-async def rembg(file: UploadFile):
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready():
+    return JSONResponse(content=status(), status_code=200 if is_ready() else 503)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    """Build the 429 response for a job rejected by the worker pool"""
+    logger.warning(e)
+    return HTTPException(status_code=429, detail="Server is busy", headers={"Retry-After": str(e.retry_after)})
+
+
+def negotiate_output(accept: Optional[str]) -> str:
+    """Pick the background removal output preferred by an Accept header, PNG when none is acceptable"""
+    preferences = []
+    for i, media_range in enumerate((accept or '').split(',')):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0 and media_type.lower() in ACCEPTED_OUTPUTS:
+            preferences.append((-q, i, ACCEPTED_OUTPUTS[media_type.lower()]))
+    return min(preferences)[2] if preferences else 'png'
+
+
+def probe_upload(contents: bytes, max_side: Optional[int]) -> Tuple[Size, Size]:
+    """Size of an upload and the size it decodes at, read from its header
+
+    Raises:
+        HTTPException: 413 when the image is a decompression bomb
+    """
+    try:
+        return probe_image(BytesIO(contents), max_side)
+    except ImageTooLarge as e:
+        logger.warning(e)
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def size_header(size: Size) -> str:
+    return f"{size[0]}x{size[1]}"
+
+
+def remove_background(
+        contents: bytes,
+        lowres: bool,
+        size: Optional[int],
+        output: str,
+        compress_level: int,
+        quality: int
+    ) -> bytes:
+    """Remove the background of an uploaded image and encode it"""
+    image = Image(BytesIO(contents), max_side=size)
+    return image.rembg(lowres=lowres, max_side=size, output=output, compress_level=compress_level, quality=quality)
+
+
+def extract_colors(
+        contents: bytes,
+        rembg: bool,
+        lowres: bool,
+        mode: str,
+        max_pixels: int,
+        quantize_bits: int,
+        max_side: Optional[int],
+        palette: str,
+        n: int = 4,
+        max_n: Optional[int] = None
+    ) -> bytes:
+    """Extract the colors of an uploaded clothing image and encode them as a Colors JSON document
+
+    With max_n, the palettes of n to max_n colors are included, all from one clustering into max_n colors.
+    """
+    # Put the contents to a clothing object
+    clothing = Clothing(
+        BytesIO(contents), mode=mode, max_pixels=max_pixels, quantize_bits=quantize_bits, max_side=max_side
+    )
+    if rembg:
+        clothing.rembg(lowres=lowres)
+
+    # Get color information
+    palettes = None
+    if max_n is None:
+        clothing.extract_colors(n)
+    else:
+        palettes = clothing.extract_palettes(n, max_n)
+    colors = clothing.colors
+    with timed("naming"):
+        color_names = clothing.get_color_names(palette)
+    color_dicts = [
+        {'r': rgb[0], 'g': rgb[1], 'b': rgb[2], 'hex': rgb_to_hex(rgb), 'pct': pct, 'name': color_names[i]}
+        for i, (rgb, pct) in enumerate(colors.items())
+    ]
+    if palettes is not None:
+        # Name the colors of every palette at once
+        rgbs = [rgb for colors in palettes.values() for rgb in colors]
+        with timed("naming"):
+            names = iter(get_color_names(rgbs, palette))
+        palettes = [
+            {'n': k, 'colors': [
+                {'r': rgb[0], 'g': rgb[1], 'b': rgb[2], 'hex': rgb_to_hex(rgb), 'pct': pct, 'name': next(names)}
+                for rgb, pct in colors.items()
+            ]}
+            for k, colors in palettes.items()
+        ]
+    image_info = ImageInfo(
+        width=clothing.original_size[0],
+        height=clothing.original_size[1],
+        decoded_width=clothing.image.width,
+        decoded_height=clothing.image.height,
+    )
+    return Colors(colors=color_dicts, image=image_info, palettes=palettes).json().encode()
+
+
+def analyze_outfit(
+        contents: bytes,
+        lowres: bool,
+        max_side: int,
+        n: int,
+        quantize_bits: int,
+        palette: str
+    ) -> bytes:
+    """Split a full-body photo into garments and encode their colors and the outfit's matches as an
+    OutfitAnalysis JSON document"""
+    # Remove the background once for the whole outfit
+    clothing = Clothing(BytesIO(contents), max_side=max_side)
+    clothing.rembg(lowres=lowres)
+    image = np.asarray(clothing.image.convert('RGB'))
+    mask = np.asarray(clothing.mask.convert('L'))
+    if clothing.image.mode == 'RGBA':
+        mask = np.minimum(mask, np.asarray(clothing.image.getchannel('A')))
+
+    # Split the foreground into garments
+    with timed("segment"):
+        labels, names = segment_garments(image, mask)
+        boxes = region_boxes(labels, len(names))
+
+    # Extract the palettes of every garment from histograms built in one pass
+    with timed("cluster"):
+        foreground = labels > 0
+        region_labels = labels[foreground]
+        palettes = cluster_region_colors(image[foreground], region_labels - 1, len(names), n, quantize_bits)
+        shares = np.bincount(region_labels, minlength=len(names) + 1)[1:] / max(foreground.sum(), 1)
+
+    # Name every color at once, and match the outfit made of the dominant color of each garment
+    rgbs = [rgb for colors in palettes for rgb in colors]
+    with timed("naming"):
+        color_names = iter(get_color_names(rgbs, palette)) if rgbs else iter([])
+    garment_rgbs = [next(iter(colors)) for colors in palettes if colors]
+    with timed("matches"):
+        matches = get_matches(garment_rgbs) if garment_rgbs else []
+
+    regions = [
+        GarmentRegion(name=name, box=list(box), pct=float(share), colors=[
+            {'r': rgb[0], 'g': rgb[1], 'b': rgb[2], 'hex': rgb_to_hex(rgb), 'pct': pct, 'name': next(color_names)}
+            for rgb, pct in colors.items()
+        ])
+        for name, box, share, colors in zip(names, boxes, shares, palettes)
+    ]
+    image_info = ImageInfo(
+        width=clothing.original_size[0],
+        height=clothing.original_size[1],
+        decoded_width=clothing.image.width,
+        decoded_height=clothing.image.height,
+    )
+    return OutfitAnalysis(regions=regions, matches=matches, image=image_info).json().encode()
+
+
+@router.post(
+    "/rembg",
+    responses={200: {"content": {media_type: {} for media_type in set(OUTPUT_MEDIA_TYPES.values())}}},
+    response_class=Response
+)
+async def rembg(
+        file: UploadFile,
+        lowres: bool = False,
+        size: Optional[int] = Query(None, gt=0, description="Longest side of the output image in pixels"),
+        output: Optional[Literal['png', 'webp', 'jpeg', 'mask']] = Query(
+            None, description="Output encoding, negotiated from the Accept header when omitted"),
+        compress_level: int = Query(DEFAULT_COMPRESS_LEVEL, ge=0, le=9),
+        quality: int = Query(DEFAULT_JPEG_QUALITY, ge=1, le=100),
+        accept: Optional[str] = Header(None)
+    ):
     try:
         # Get image contents
-        contents = file.file
+        contents = await file.read()
+        file.file.close()
 
-        # Put the contents in an Image object
-        image = Image(contents)
+        # Reject decompression bombs before queuing any work
+        original_size, decoded_size = probe_upload(contents, size)
+        IMAGE_MEGAPIXELS.observe(original_size[0] * original_size[1] / 1e6, route="/v1/rembg")
 
-        # Remove the background
-        image_rembg = image.rembg()
+        # Remove the background in the worker pool, reusing the result of identical uploads
+        output = output or negotiate_output(accept)
+        params = {'lowres': lowres, 'size': size, 'output': output, 'compress_level': compress_level, 'quality': quality}
+        megapixels = decoded_size[0] * decoded_size[1] / 1e6
+        async def compute():
+            return await WORKER_POOL.run(remove_background, contents, megapixels=megapixels, **params)
+        key = ResultCache.make_key("rembg", contents, **params)
+        image_rembg = await RESULT_CACHE.get_or_compute(key, compute)
 
-        # Build the response
-        response = Response(content=image_rembg, media_type="image/png")
-        contents.close()
-        return response
+        # Send the cached bytes as they are, the server writes them without another copy
+        headers = {
+            'Vary': 'Accept',
+            'X-Image-Size': size_header(original_size),
+            'X-Decoded-Size': size_header(decoded_size),
+        }
+        return Response(content=image_rembg, media_type=OUTPUT_MEDIA_TYPES[output], headers=headers)
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         file.file.close()
         logger.error(e)
@@ -40,45 +343,192 @@ async def rembg(file: UploadFile):
 
 
 @router.post("/colors", response_model=Colors)
-async def colors(file: UploadFile):
+async def colors(
+        file: UploadFile,
+        rembg: bool = False,
+        lowres: bool = False,
+        mode: Literal['full', 'fast', 'histogram'] = 'full',
+        max_pixels: int = Query(DEFAULT_MAX_PIXELS, gt=0),
+        quantize_bits: int = Query(DEFAULT_QUANTIZE_BITS, ge=1, le=8),
+        max_side: Optional[int] = Query(None, gt=0, description="Longest side the image is decoded at in pixels"),
+        palette: Literal['css3', 'xkcd'] = DEFAULT_PALETTE,
+        n: int = Query(4, ge=1, le=MAX_COLORS, description="Number of colors"),
+        max_n: Optional[int] = Query(
+            None, ge=1, le=MAX_COLORS, description="Also return the palettes of n to max_n colors, from one clustering"
+        )
+    ):
+    if max_n is not None and max_n < n:
+        raise HTTPException(status_code=422, detail="max_n must be at least n")
     try:
         # Get image contents
-        contents = file.file
-
-        # Put the contents to a clothing object
-        clothing = Clothing(contents)
-
-        # Get color information
-        clothing.extract_colors()
-        colors = clothing.colors
-        color_names = clothing.get_color_names()
-        color_dicts = [
-            {'r': rgb[0], 'g': rgb[1], 'b': rgb[2], 'hex': rgb_to_hex(rgb), 'pct': pct, 'name': color_names[i]}
-            for i, (rgb, pct) in enumerate(colors.items())
-        ]
+        contents = await file.read()
+        file.file.close()
+
+        # Reject decompression bombs before queuing any work
+        original_size, decoded_size = probe_upload(contents, max_side)
+        IMAGE_MEGAPIXELS.observe(original_size[0] * original_size[1] / 1e6, route="/v1/colors")
+
+        # Get color information in the worker pool, reusing the result of identical uploads
+        params = {
+            'rembg': rembg,
+            'lowres': lowres,
+            'mode': mode,
+            'max_pixels': max_pixels,
+            'quantize_bits': quantize_bits,
+            'max_side': max_side,
+            'palette': palette,
+            'n': n,
+            'max_n': max_n,
+        }
+        megapixels = decoded_size[0] * decoded_size[1] / 1e6
+        async def compute():
+            return await WORKER_POOL.run(extract_colors, contents, megapixels=megapixels, **params)
+        key = ResultCache.make_key("colors", contents, **params)
+        colors_json = await RESULT_CACHE.get_or_compute(key, compute)
 
         # Build the response
-        response = Colors(colors=color_dicts)
+        response = Response(content=colors_json, media_type="application/json")
         return response
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_error(e)
     except Exception as e:
         file.file.close()
         logger.error(e)
         raise HTTPException(status_code=500, detail="Unable to extract colors")
+
+
+@router.post("/outfit/analyze", response_model=OutfitAnalysis)
+async def outfit_analyze(
+        file: UploadFile,
+        lowres: bool = True,
+        max_side: int = Query(DEFAULT_OUTFIT_SIDE, gt=0, description="Longest side the photo is decoded at in pixels"),
+        n: int = Query(3, ge=1, le=MAX_COLORS, description="Number of colors of each garment"),
+        quantize_bits: int = Query(DEFAULT_QUANTIZE_BITS, ge=1, le=8),
+        palette: Literal['css3', 'xkcd'] = DEFAULT_PALETTE
+    ):
+    try:
+        # Get image contents
+        contents = await file.read()
+        file.file.close()
+
+        # Reject decompression bombs before queuing any work
+        original_size, decoded_size = probe_upload(contents, max_side)
+        IMAGE_MEGAPIXELS.observe(original_size[0] * original_size[1] / 1e6, route="/v1/outfit/analyze")
+
+        # Analyze the outfit in the worker pool, reusing the result of identical uploads
+        params = {
+            'lowres': lowres,
+            'max_side': max_side,
+            'n': n,
+            'quantize_bits': quantize_bits,
+            'palette': palette,
+        }
+        megapixels = decoded_size[0] * decoded_size[1] / 1e6
+        async def compute():
+            return await WORKER_POOL.run(analyze_outfit, contents, megapixels=megapixels, **params)
+        key = ResultCache.make_key("outfit", contents, **params)
+        analysis_json = await RESULT_CACHE.get_or_compute(key, compute)
+
+        return Response(content=analysis_json, media_type="application/json")
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        file.file.close()
+        logger.error(e)
+        raise HTTPException(status_code=500, detail="Unable to analyze the outfit")
+
+
+@router.post("/sample/prepare", response_model=SamplerInfo)
+async def sample_prepare(
+        file: UploadFile,
+        rembg: bool = False,
+        lowres: bool = True,
+        max_side: int = Query(DEFAULT_SAMPLE_SIDE, gt=0, description="Longest side the image is decoded at in pixels")
+    ):
+    try:
+        # Get image contents
+        contents = await file.read()
+        file.file.close()
+
+        # Reject decompression bombs before queuing any work
+        original_size, decoded_size = probe_upload(contents, max_side)
+        IMAGE_MEGAPIXELS.observe(original_size[0] * original_size[1] / 1e6, route="/v1/sample/prepare")
+
+        # Build the summed-area tables once per upload, they are kept until unused for the cache TTL
+        key = ResultCache.make_key("sample", contents, rembg=rembg, lowres=lowres, max_side=max_side)
+        sampler = SAMPLER_CACHE.get(key)
+        if sampler is None:
+            megapixels = decoded_size[0] * decoded_size[1] / 1e6
+            sampler = await WORKER_POOL.run(
+                build_sampler, BytesIO(contents), rembg, lowres, max_side, megapixels=megapixels
+            )
+            SAMPLER_CACHE.put(key, sampler)
+
+        return SamplerInfo(id=key, width=sampler.width, height=sampler.height, masked=sampler.masked)
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        file.file.close()
+        logger.error(e)
+        raise HTTPException(status_code=500, detail="Unable to prepare the image for sampling")
+
+
+@router.post("/sample/{sampler_id}", response_model=Colors)
+async def sample(sampler_id: str, query: SampleQuery):
+    sampler = SAMPLER_CACHE.get(sampler_id)
+    if sampler is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired sampler, prepare the image again")
+    try:
+        # Look up the colors of every window in the summed-area tables
+        points = [(point.x, point.y) for point in query.points]
+        with timed("sample"):
+            rgbs, shares = sampler.sample(points, query.radius, query.method)
+        SAMPLER_CACHE.update(sampler_id)
+        with timed("naming"):
+            names = get_color_names(rgbs, query.palette) if len(points) else []
+
+        # Build the response, pct is the share of each window the color was computed from
+        colors = [
+            {'r': rgb[0], 'g': rgb[1], 'b': rgb[2], 'hex': rgb_to_hex(rgb), 'pct': share, 'name': name}
+            for rgb, share, name in zip(rgbs.tolist(), shares.tolist(), names)
+        ]
+        return Colors(colors=colors)
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail="Unable to sample colors")
+
+
+@router.get("/cache")
+async def cache():
+    return RESULT_CACHE.stats()
+
+
+@router.get("/sample/cache")
+async def sampler_cache():
+    return SAMPLER_CACHE.stats()
+
+
+@router.get("/workers")
+async def workers():
+    return WORKER_POOL.stats()
         
 
 @router.post("/matches", response_model=Matches)
 async def matches(colors: Colors):
     try:
-        # Get the HSV values for the primary colors
-        rgb_norms = [(rgb.r/255.0, rgb.g/255.0, rgb.b/255.0) for rgb in colors.colors]
-        hsv_norms = [rgb_to_hsv(r, g, b) for r, g, b in rgb_norms]
-        hsvs = [(h*360.0, s*100.0, v*100.0) for h, s, v in hsv_norms]
-
         # Get a description of the color, in tuples of (TONE, TEMP)
-        outfit_color_descs = [GetColorDesc(hsv) for hsv in hsvs]
+        with timed("color_desc"):
+            outfit_color_descs = get_color_descs([(rgb.r, rgb.g, rgb.b) for rgb in colors.colors])
 
         # Get matches for the given colors
-        matches = GetValidMatches(outfit_color_descs)
+        with timed("matches"):
+            matches = GetValidMatches(outfit_color_descs)
 
         # Build the response
         response = Matches(matches=matches)
@@ -87,3 +537,34 @@ async def matches(colors: Colors):
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail="Unable to find matches")
+
+
+@router.post("/wardrobe/combinations", responses={200: {"content": {"application/x-ndjson": {}}}}, response_class=StreamingResponse)
+async def wardrobe_combinations(
+        wardrobe: Wardrobe,
+        limit: Optional[int] = Query(None, ge=1, description="Maximum number of outfits to return")
+    ):
+    try:
+        # Rank the matching outfits made of one garment per slot in the worker pool
+        garment_slots = [garment.slot for garment in wardrobe.garments]
+        garment_colors = [[(rgb.r, rgb.g, rgb.b) for rgb in garment.colors] for garment in wardrobe.garments]
+        garments, masks = await WORKER_POOL.run(rank_combinations, garment_slots, garment_colors, limit=limit)
+    except ValueError as e:
+        logger.error(e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail="Unable to find combinations")
+
+    # Stream one outfit per line, best ranked first, naming the matches of each outfit as it is sent
+    def lines():
+        for outfit, matches in iter_combinations(garments, masks):
+            combination = WardrobeCombination(
+                garments=[wardrobe.garments[i].id for i in outfit],
+                matches=matches
+            )
+            yield combination.json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -1,13 +1,19 @@
 # From https://github.com/FCARRILLOM/ClassifyingColorMatchingOutfits/blob/main/ColorMeMedium.ipynb
 
+import argparse
+from functools import lru_cache
+import os
+
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
 
 hue_fuzzy = ['WARM', 'COOL', 'WARM_']
 sat_fuzzy = ['GRAY', 'VERY_FADED', 'FADED', 'SATURATED', 'VERY_SATURATED']
 val_fuzzy = ['BLACK', 'VERY_DARK', 'DARK', 'BRIGHT', 'VERY_BRIGHT']
 tone_fuzzy = ['NEUTRAL', 'DARK', 'BRIGHT']
+temp_fuzzy = ['WARM', 'COOL']
+
+TABLE_DIRECTORY = os.path.join(os.path.dirname(__file__), 'data')
+TONE_TABLE_PATH = os.path.join(TABLE_DIRECTORY, 'tone_table.npy')
 
 def get_tone_hue():
     """
@@ -21,6 +27,8 @@ def get_tone_hue():
     VALUE: brightness represented by number 0(dark) - 100(light)
     { BLACK, VERY_DARK, DARK, BRIGHT, VERY_BRIGHT }
     """
+    import skfuzzy as fuzz
+    from skfuzzy import control as ctrl
 
     hue_range = np.arange(0, 361, 1)
     hue = ctrl.Antecedent(hue_range, 'hue')
@@ -79,7 +87,12 @@ def get_tone_hue():
     return tone_ctrl, tone_range, tone, hue_range, hue
 
 
-tone_ctrl, tone_range, tone, hue_range, hue = get_tone_hue()
+@lru_cache(maxsize=None)
+def GetToneHue():
+    """
+    Builds the skfuzzy control system on first use, see get_tone_hue()
+    """
+    return get_tone_hue()
 
 ####################
 ## CLOTHES TYPING ##
@@ -90,6 +103,8 @@ def GetMembership(fuzzy_values, var_range, var_model, crisp_value):
     GetMembership
     Returns String representing the Fuzzy value given a variable's range, model, and crisp value
     """
+    import skfuzzy as fuzz
+
     max_membership = 0
     membership_name = fuzzy_values[0]
     for i in range(len(fuzzy_values)):
@@ -110,6 +125,9 @@ def GetTone(values):
         + sat - value from 0-100
         + val - value from 0-100
     """
+    from skfuzzy import control as ctrl
+
+    tone_ctrl, tone_range, tone, _, _ = GetToneHue()
     tone_sim = ctrl.ControlSystemSimulation(tone_ctrl)
     tone_sim.input['saturation'] = values[0]
     tone_sim.input['value'] = values[1]
@@ -127,15 +145,16 @@ def GetColorTemp(hue_val):
     INPUT:
     hue - value from 0-360
     """
+    _, _, _, hue_range, hue = GetToneHue()
     temp_membership = GetMembership(hue_fuzzy, hue_range, hue, hue_val)
     return temp_membership
 
 
-def GetColorDesc(hsv):
+def GetColorDescFuzzy(hsv):
     """
     Given Hue, Saturation, and Value, returns a String describing
-    the specified color. The output is composed of both the tone of
-    the color, and the temperature of the color.
+    the specified color by running the full skfuzzy simulation.
+    This is the reference implementation the lookup tables are built from.
     INPUT:
     hsv - tuple(hue, sat, val)
         + hue - value from 0-360
@@ -149,6 +168,266 @@ def GetColorDesc(hsv):
     return (tone, temp)
 
 
+###################
+## LOOKUP TABLES ##
+###################
+
+def BuildToneTable():
+    """
+    Runs the skfuzzy tone simulation for every integer (sat, val) pair.
+    OUTPUT:
+        uint8 array of shape (101, 101) indexed by [sat, val], holding
+        indices into tone_fuzzy
+    """
+    table = np.zeros((101, 101), dtype=np.uint8)
+    for sat in range(101):
+        for val in range(101):
+            table[sat, val] = tone_fuzzy.index(GetTone((sat, val)))
+    return table
+
+
+def BuildTempTable():
+    """
+    Classifies every integer hue as WARM or COOL with the batch engine,
+    VerifyColorDescTable checks it against the skfuzzy path.
+    OUTPUT:
+        uint8 array of shape (361,) indexed by hue, holding indices into temp_fuzzy
+    """
+    hsvs = np.zeros((361, 3))
+    hsvs[:, 0] = np.arange(361)
+    _, temp_idx = GetColorDescIndexBatch(hsvs)
+    return temp_idx.astype(np.uint8)
+
+
+def LoadColorDescTable(path=TONE_TABLE_PATH):
+    """
+    Loads the tone table from the shipped .npy artifact (memory-mapped), building
+    it with skfuzzy if the artifact is missing. The temperature table is cheap
+    and is always built.
+    OUTPUT:
+        tuple(tone_table, temp_table)
+    """
+    if os.path.exists(path):
+        tone_table = np.load(path, mmap_mode='r')
+    else:
+        tone_table = BuildToneTable()
+    temp_table = BuildTempTable()
+    return tone_table, temp_table
+
+
+_color_desc_table = None
+
+def GetColorDescTable():
+    """
+    Returns the (tone_table, temp_table) pair, loading it on first use
+    """
+    global _color_desc_table
+    if _color_desc_table is None:
+        _color_desc_table = LoadColorDescTable()
+    return _color_desc_table
+
+
+def VerifyColorDescTable(step=1):
+    """
+    Compares the lookup tables against the skfuzzy path on the integer HSV grid.
+    INPUT:
+    step - stride over the sat/val grid, 1 checks every entry
+    OUTPUT:
+        List of (hue, sat, val, table_desc, fuzzy_desc) for every disagreement
+    """
+    tone_table, temp_table = GetColorDescTable()
+    mismatches = []
+    for sat in range(0, 101, step):
+        for val in range(0, 101, step):
+            expected = GetTone((sat, val))
+            actual = tone_fuzzy[tone_table[sat, val]]
+            if actual != expected:
+                mismatches.append((None, sat, val, actual, expected))
+    for hue_val in range(361):
+        expected = GetColorTemp(hue_val)
+        if expected == "WARM_": expected = "WARM"
+        actual = temp_fuzzy[temp_table[hue_val]]
+        if actual != expected:
+            mismatches.append((hue_val, None, None, actual, expected))
+    return mismatches
+
+
+def GetColorDesc(hsv):
+    """
+    Given Hue, Saturation, and Value, returns a String describing
+    the specified color. The output is composed of both the tone of
+    the color, and the temperature of the color.
+    Answered by the vectorized engine, which agrees with the skfuzzy path
+    (GetColorDescFuzzy) off the integer HSV grid as well.
+    INPUT:
+    hsv - tuple(hue, sat, val)
+        + hue - value from 0-360
+        + sat - value from 0-100
+        + val - value from 0-100
+    OUTPUT: (TONE, TEMP) ex. (DARK, WARM)
+    """
+    tone_idx, temp_idx = GetColorDescIndexBatch([hsv])
+    return (tone_fuzzy[tone_idx[0]], temp_fuzzy[temp_idx[0]])
+
+
+##########################
+## BATCH CLASSIFICATION ##
+##########################
+
+# NumPy mirror of get_tone_hue(): membership functions are sampled on the same
+# integer universes and interpolated linearly, as skfuzzy does
+def _gaussmf(x, mean, sigma):
+    return np.exp(-((x - mean) ** 2.) / (2 * sigma ** 2.))
+
+def _trapmf(x, abcd):
+    a, b, c, d = abcd
+    y = np.ones(len(x))
+    y[(x < a) | (x > d)] = 0
+    rise = (a <= x) & (x < b)
+    y[rise] = (x[rise] - a) / (b - a)
+    fall = (c < x) & (x <= d)
+    y[fall] = (d - x[fall]) / (d - c)
+    return y
+
+def _gbellmf(x, a, b, c):
+    return 1. / (1. + np.abs((x - c) / a) ** (2 * b))
+
+_HSV_UNIVERSE = np.arange(0, 101, 1, dtype=np.float64)
+_HUE_UNIVERSE = np.arange(0, 361, 1, dtype=np.float64)
+_TONE_UNIVERSE = np.arange(0, 12, 1, dtype=np.float64)
+
+_HUE_MF = np.array([_gaussmf(_HUE_UNIVERSE, mean, 60) for mean in (0, 180, 360)])
+_SAT_MF = dict(zip(sat_fuzzy, [_gaussmf(_HSV_UNIVERSE, mean, 10) for mean in (0, 25, 50, 75, 100)]))
+_VAL_MF = dict(zip(val_fuzzy, [_gaussmf(_HSV_UNIVERSE, mean, 10) for mean in (0, 25, 50, 75, 100)]))
+_TONE_MF = np.array([
+    _trapmf(_TONE_UNIVERSE, [0, 0, 1, 2]),
+    _gbellmf(_TONE_UNIVERSE, 2, 1, 3),
+    _gbellmf(_TONE_UNIVERSE, 4, 1, 9.5),
+])
+
+# The eight tone rules as (consequent, operator, [(variable, term), ...])
+_TONE_RULES = [
+    ('NEUTRAL', np.fmax, [('value', 'BLACK'), ('saturation', 'GRAY'), ('saturation', 'VERY_FADED')]),
+    ('NEUTRAL', np.fmin, [('value', 'VERY_DARK'), ('saturation', 'SATURATED')]),
+    ('DARK', np.fmin, [('value', 'DARK'), ('saturation', 'FADED')]),
+    ('BRIGHT', np.fmin, [('value', 'DARK'), ('saturation', 'VERY_SATURATED')]),
+    ('BRIGHT', np.fmin, [('value', 'BRIGHT'), ('saturation', 'SATURATED')]),
+    ('BRIGHT', np.fmin, [('value', 'VERY_BRIGHT'), ('saturation', 'FADED')]),
+    ('BRIGHT', np.fmin, [('value', 'VERY_BRIGHT'), ('saturation', 'VERY_SATURATED')]),
+    ('NEUTRAL', np.fmin, [('value', 'VERY_DARK'), ('saturation', 'FADED')]),
+]
+
+
+def _DefuzzCentroid(cuts):
+    """
+    Centroid of the aggregated tone output for every row of cuts, matching
+    skfuzzy's upsampled universe and trapezoidal integration.
+    INPUT:
+    cuts - array (N, 3) of activation levels for each tone term
+    OUTPUT:
+        array (N,) of crisp tone values
+    """
+    n = cuts.shape[0]
+    left = _TONE_UNIVERSE[:-1]
+    y_left = _TONE_MF[:, :-1]
+    slope = _TONE_MF[:, 1:] - y_left
+
+    # Points where each term crosses its own cut level split every universe interval
+    cut = cuts[:, :, None]
+    above = _TONE_MF[None, :, :] > cut
+    above_eq = _TONE_MF[None, :, :] >= cut
+    mask = np.where(cut == 0, above, above_eq)
+    crosses = mask[:, :, 1:] != mask[:, :, :-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = (cut - y_left[None]) / slope[None]
+    offset = np.where(crosses, offset, 0.)
+
+    # points: (N, intervals, 5) sorted offsets in [0, 1]
+    points = np.concatenate([
+        np.zeros((n, len(left), 1)),
+        offset.transpose(0, 2, 1),
+        np.ones((n, len(left), 1)),
+    ], axis=2)
+    points.sort(axis=2)
+
+    # Aggregated output is the max over terms of the clipped membership
+    term_y = y_left[None, :, :, None] + points[:, None, :, :] * slope[None, :, :, None]
+    output = np.minimum(cuts[:, :, None, None], term_y).max(axis=1)
+
+    x = left[None, :, None] + points
+    dx = np.diff(x, axis=2)
+    x1 = x[:, :, :-1]
+    y1 = output[:, :, :-1]
+    y2 = output[:, :, 1:]
+    area = 0.5 * dx * (y1 + y2)
+    moment_area = area * x1 + dx * dx * (y1 + 2 * y2) / 6.
+    sum_area = area.sum(axis=(1, 2))
+    return moment_area.sum(axis=(1, 2)) / np.fmax(sum_area, np.finfo(float).eps)
+
+
+def _ArgmaxMembership(crisp, universe, mfs):
+    """
+    Vectorized GetMembership: index of the term with the highest membership,
+    falling back to the first term when every membership is zero
+    """
+    memberships = np.array([np.interp(crisp, universe, mf, left=0., right=0.) for mf in mfs])
+    return memberships.argmax(axis=0)
+
+
+def GetColorDescIndexBatch(hsv_array):
+    """
+    Runs fuzzification, rule aggregation and centroid defuzzification for
+    many colors at once.
+    INPUT:
+    hsv_array - array (N, 3) of (hue, sat, val)
+        + hue - value from 0-360
+        + sat - value from 0-100
+        + val - value from 0-100
+    OUTPUT:
+        tuple(tone_idx, temp_idx) of arrays (N,) indexing tone_fuzzy and temp_fuzzy
+    """
+    hsv_array = np.asarray(hsv_array, dtype=np.float64).reshape(-1, 3)
+    inputs = {
+        'saturation': np.clip(hsv_array[:, 1], 0, 100),
+        'value': np.clip(hsv_array[:, 2], 0, 100),
+    }
+    mfs = {'saturation': _SAT_MF, 'value': _VAL_MF}
+
+    # Fuzzification
+    memberships = {}
+    for _, _, antecedents in _TONE_RULES:
+        for variable, term in antecedents:
+            if (variable, term) not in memberships:
+                memberships[(variable, term)] = np.interp(inputs[variable], _HSV_UNIVERSE, mfs[variable][term])
+
+    # Rule evaluation and accumulation onto the consequent terms
+    cuts = np.zeros((len(hsv_array), len(tone_fuzzy)))
+    for consequent, operator, antecedents in _TONE_RULES:
+        activation = memberships[antecedents[0]]
+        for antecedent in antecedents[1:]:
+            activation = operator(activation, memberships[antecedent])
+        idx = tone_fuzzy.index(consequent)
+        cuts[:, idx] = np.fmax(cuts[:, idx], activation)
+
+    tone_output = _DefuzzCentroid(cuts)
+    tone_idx = _ArgmaxMembership(tone_output, _TONE_UNIVERSE, _TONE_MF)
+
+    hue_idx = _ArgmaxMembership(hsv_array[:, 0], _HUE_UNIVERSE, _HUE_MF)
+    temp_idx = np.where(hue_idx == hue_fuzzy.index('COOL'), temp_fuzzy.index('COOL'), temp_fuzzy.index('WARM'))
+    return tone_idx, temp_idx
+
+
+def GetColorDescBatch(hsv_array):
+    """
+    Batch version of GetColorDesc, classifying every color in one vectorized pass.
+    INPUT:
+    hsv_array - array (N, 3) of (hue, sat, val)
+    OUTPUT: List of (TONE, TEMP) ex. [(DARK, WARM), (NEUTRAL, COOL)]
+    """
+    tone_idx, temp_idx = GetColorDescIndexBatch(hsv_array)
+    return [(tone_fuzzy[t], temp_fuzzy[c]) for t, c in zip(tone_idx, temp_idx)]
+
+
 ######################
 ## CLOTHES MATCHING ##
 ######################
@@ -299,23 +578,137 @@ def WinterMatch(outfit):
 
 
 
+MATCH_RULES = {"Basic": BasicMatch, "Neutral": NeutralMatch,
+               "Analogous": AnalogousMatch, "Contrast": ContrastMatch, # I added Contrast
+               "Summer": SummerMatch, "Winter": WinterMatch}
+match_names = list(MATCH_RULES)
+
+
 def GetValidMatches(outfit):
     """
     Iterate outfit over all color schemes and get all valid matches
     INPUT:
     outfit - tuple(top, bot, shs)
-        top - hsv
-        bot - hsv
-        shs - hsv
+        top - tuple(tone, temp)
+        bot - tuple(tone, temp)
+        shs - tuple(tone, temp)
     OUTPUT:
         All names of valid outfit matches
     """
-    
-    rules = {"Basic": BasicMatch, "Neutral": NeutralMatch,
-             "Analogous": AnalogousMatch, "Contrast": ContrastMatch, # I added Contrast
-             "Summer": SummerMatch, "Winter": WinterMatch}
-    valid_matches = []
-    for key in rules:
-        if rules[key](outfit):
-            valid_matches.append(key)
-    return valid_matches
\ No newline at end of file
+    return list(GetSignatureMatches(GetSignature(outfit)))
+
+
+########################
+## SIGNATURE MATCHING ##
+########################
+
+# Every rule only depends on how many colors fall into each (tone, temp) class,
+# so an outfit reduces to a count vector indexed by tone_idx * len(temp_fuzzy) + temp_idx
+signature_classes = [(t, c) for t in tone_fuzzy for c in temp_fuzzy]
+
+
+def GetSignature(outfit):
+    """
+    Reduce an outfit to its (tone, temp) class counts
+    INPUT:
+    outfit - list of tuple(tone, temp)
+    OUTPUT:
+        tuple of len(signature_classes) counts
+    """
+    counts = [0] * len(signature_classes)
+    for color in outfit:
+        counts[signature_classes.index(tuple(color))] += 1
+    return tuple(counts)
+
+
+def GetSignatureBatch(tone_idx, temp_idx, outfit_idx=None, n_outfits=None):
+    """
+    Count vectors for many outfits from classified colors
+    INPUT:
+    tone_idx, temp_idx - arrays (N,) as returned by GetColorDescIndexBatch
+    outfit_idx - array (N,) assigning every color to an outfit, all colors form one outfit if None
+    n_outfits - number of outfits, defaults to outfit_idx.max() + 1
+    OUTPUT:
+        int array (n_outfits, len(signature_classes))
+    """
+    class_idx = np.asarray(tone_idx) * len(temp_fuzzy) + np.asarray(temp_idx)
+    if outfit_idx is None:
+        outfit_idx = np.zeros(len(class_idx), dtype=np.intp)
+    outfit_idx = np.asarray(outfit_idx)
+    if n_outfits is None:
+        n_outfits = int(outfit_idx.max()) + 1 if len(outfit_idx) else 1
+    flat = outfit_idx * len(signature_classes) + class_idx
+    counts = np.bincount(flat, minlength=n_outfits * len(signature_classes))
+    return counts.reshape(n_outfits, len(signature_classes))
+
+
+@lru_cache(maxsize=None)
+def GetSignatureMatches(signature):
+    """
+    Memoized GetValidMatches for a count signature. Runs the match rules
+    on a canonical outfit with the same class counts.
+    INPUT:
+    signature - tuple as returned by GetSignature
+    OUTPUT:
+        tuple of names of valid outfit matches
+    """
+    outfit = [color for color, count in zip(signature_classes, signature) for _ in range(count)]
+    return tuple(key for key, rule in MATCH_RULES.items() if rule(outfit))
+
+
+def GetMatchMaskBatch(signatures):
+    """
+    Evaluate every match rule over many outfit signatures at once
+    INPUT:
+    signatures - int array (M, len(signature_classes))
+    OUTPUT:
+        uint8 array (M,) with bit i set when match_names[i] is valid
+    """
+    counts = np.asarray(signatures).reshape(-1, len(signature_classes))
+    by_class = dict(zip(signature_classes, counts.T))
+    total = counts.sum(axis=1)
+    neutral = by_class[('NEUTRAL', 'WARM')] + by_class[('NEUTRAL', 'COOL')]
+    dark = by_class[('DARK', 'WARM')] + by_class[('DARK', 'COOL')]
+    bright = by_class[('BRIGHT', 'WARM')] + by_class[('BRIGHT', 'COOL')]
+    warm = by_class[('NEUTRAL', 'WARM')] + by_class[('DARK', 'WARM')] + by_class[('BRIGHT', 'WARM')]
+    cool = total - warm
+    non_neutral_warm = by_class[('DARK', 'WARM')] + by_class[('BRIGHT', 'WARM')]
+
+    rules = {
+        "Basic": bright <= 1,
+        "Neutral": neutral == total,
+        "Analogous": (cool == total) | (warm == total),
+        "Contrast": (warm >= 1) & (dark >= 1) & (bright >= 1),
+        "Summer": (non_neutral_warm >= 2) & (dark <= 1) & (bright >= 1),
+        "Winter": (dark >= 1) & (bright == 0),
+    }
+    mask = np.zeros(len(counts), dtype=np.uint8)
+    for i, key in enumerate(match_names):
+        mask |= rules[key].astype(np.uint8) << i
+    return mask
+
+
+def GetMatchesFromMask(mask):
+    """
+    Names of the outfit matches set in a bitmask from GetMatchMaskBatch
+    """
+    return [key for i, key in enumerate(match_names) if int(mask) >> i & 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or verify the color description lookup tables")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--step", type=int, default=1, help="Grid stride used when verifying")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        os.makedirs(TABLE_DIRECTORY, exist_ok=True)
+        np.save(TONE_TABLE_PATH, BuildToneTable())
+        print(f"Saved tone table to {TONE_TABLE_PATH}")
+    else:
+        mismatches = VerifyColorDescTable(step=args.step)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(mismatches)} mismatches")
+        if mismatches:
+            raise SystemExit(1)
@@ -0,0 +1,109 @@
+"""Palettes of every size from a single color clustering.
+
+Clusters fitted once at the largest number of colors are merged two at a time with Ward's criterion, the
+merge adding the least within-cluster variance, using only their centroids and pixel weights. Every palette
+from one color to the number fitted is stored, so changing the number of colors never touches the pixels.
+Clusters that are empty or share a centroid, e.g. when more clusters were fitted than the pixels have distinct
+colors, are merged up front, so palettes never repeat a color and may have fewer colors than were fitted.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Palette of RGB centroids and their share of the pixels, in order of frequency
+Palette = Dict[Tuple[float, float, float], float]
+
+
+def ward_cost(centroids: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Increase of the within-cluster sum of squares of merging every pair of clusters
+
+    Args:
+        centroids (np.ndarray): Array of shape (k, 3)
+        weights (np.ndarray): Array of shape (k,) of cluster sizes
+
+    Returns:
+        np.ndarray: Array of shape (k, k), infinite on the diagonal
+    """
+    distances = ((centroids[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost = np.outer(weights, weights) / (weights[:, None] + weights[None, :]) * distances
+    cost = np.nan_to_num(cost, nan=0.0)
+    np.fill_diagonal(cost, np.inf)
+    return cost
+
+
+class ColorHierarchy:
+    """Agglomerative merge tree over the clusters of a color clustering"""
+
+    def __init__(self, centroids, weights):
+        """
+        Args:
+            centroids: Array-like of shape (k, 3) of RGB cluster centroids
+            weights: Array-like of shape (k,) of the number, or share, of pixels in each cluster
+
+        Raises:
+            ValueError: If the number of weights differs from the number of centroids, or no cluster has pixels
+        """
+        centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 3)
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        if len(centroids) != len(weights) or not (weights > 0).any():
+            raise ValueError("Expected as many weights as centroids, and at least one cluster with pixels")
+        self.n_clusters: int = len(centroids)
+
+        # Drop empty clusters and pool the weights of identical centroids
+        nonempty = weights > 0
+        centroids, inverse = np.unique(centroids[nonempty], axis=0, return_inverse=True)
+        weights = np.bincount(inverse.ravel(), weights=weights[nonempty], minlength=len(centroids))
+        self.max_k: int = len(centroids)
+        self.merges: List[Tuple[int, int]] = []
+        self._palettes: Dict[int, Tuple[np.ndarray, np.ndarray]] = {self.max_k: (centroids, weights)}
+
+        # Merge the cheapest pair until one cluster is left, the merged cluster replaces the first of the pair
+        cost = ward_cost(centroids, weights)
+        active = np.ones(self.max_k, dtype=bool)
+        centroids, weights = centroids.copy(), weights.copy()
+        for k in range(self.max_k - 1, 0, -1):
+            i, j = sorted(np.unravel_index(np.argmin(cost), cost.shape))
+            total = weights[i] + weights[j]
+            if total > 0:
+                centroids[i] = (centroids[i] * weights[i] + centroids[j] * weights[j]) / total
+            weights[i], weights[j] = total, 0.0
+            active[j] = False
+            self.merges.append((int(i), int(j)))
+
+            # Only the costs of the merged cluster change
+            distances = ((centroids - centroids[i]) ** 2).sum(axis=-1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                row = np.nan_to_num(weights[i] * weights / (weights[i] + weights) * distances, nan=0.0)
+            row[~active] = np.inf
+            row[i] = np.inf
+            cost[i, :] = cost[:, i] = row
+            cost[j, :] = cost[:, j] = np.inf
+            self._palettes[k] = (centroids[active].copy(), weights[active].copy())
+
+    def palette(self, n: int) -> Palette:
+        """The palette of n colors, answered from the stored merges
+
+        Args:
+            n (int): Number of colors, from 1 to max_k
+
+        Returns:
+            Palette: Share of the pixels of each color, in order of frequency
+        """
+        if not 1 <= n <= self.max_k:
+            raise ValueError(f"Palettes have between 1 and {self.max_k} colors, got {n}")
+        centroids, weights = self._palettes[n]
+        shares = weights / weights.sum()
+        order = np.argsort(-shares, kind='stable')
+        palette = {}
+        for i in order:
+            color = tuple(centroids[i].tolist())
+            palette[color] = palette.get(color, 0.0) + float(shares[i])
+        return palette
+
+    def palettes(self, n_min: int = 1, n_max: int = None) -> Dict[int, Palette]:
+        """Palettes of every number of colors from n_min to n_max, see palette
+
+        Numbers of colors above max_k, when the clusters had fewer distinct colors, get the palette of max_k colors.
+        """
+        return {n: self.palette(min(n, self.max_k)) for n in range(n_min, (n_max or self.max_k) + 1)}
@@ -0,0 +1,33 @@
+"""Match the colors of an outfit against the outfit rules.
+
+Only needs NumPy and the precompiled tone table, so the webapp can import it and classify colors in-process
+instead of calling /v1/matches, see MATCHING_MODE in webapp/utils/constants.py.
+"""
+from typing import List, Tuple
+
+from streamlit_camouflage.v1.fuzzy_classifier import GetColorDescBatch, GetValidMatches
+from streamlit_camouflage.v1.utils import rgb_to_hsv_batch
+
+
+def get_color_descs(rgbs) -> List[Tuple[str, str]]:
+    """Describe RGB colors (0 to 255)
+
+    Args:
+        rgbs: Array-like of shape (N, 3)
+
+    Returns:
+        List[Tuple[str, str]]: (TONE, TEMP) of every color
+    """
+    return GetColorDescBatch(rgb_to_hsv_batch(rgbs))
+
+
+def get_matches(rgbs) -> List[str]:
+    """Outfit types the RGB colors (0 to 255) of an outfit match
+
+    Args:
+        rgbs: Array-like of shape (N, 3)
+
+    Returns:
+        List[str]: Names of the matched outfit types, e.g. 'Basic'
+    """
+    return GetValidMatches(get_color_descs(rgbs))
@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+import math
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Stage timings of the request being handled, as (stage, seconds) pairs
+TIMINGS: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("timings", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MEGAPIXEL_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 12.0, 16.0, 24.0, 48.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ""
+    escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """A metric family in the Prometheus text exposition format, with one series per label set"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        """
+        Args:
+            name (str): Metric name
+            documentation (str): HELP text
+            labelnames (Tuple[str, ...], optional): Names of the labels of every series. Defaults to ().
+        """
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: Tuple[str, ...] = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _labels(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """Sample lines of every series, called with the lock held"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._labels(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        counts, _ = self._series.get(self._labels(labels), ([0], [0.0]))
+        return sum(counts)
+
+    def samples(self) -> Iterator[str]:
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(total[0])}"
+            yield f"{self.name}_count{_format_labels(key)} {cumulative}"
+
+
+REGISTRY: List[Metric] = []
+
+REQUEST_LATENCY = Histogram(
+    "camouflage_request_duration_seconds", "Time to handle a request, until the response starts",
+    ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = Gauge("camouflage_requests_in_flight", "Requests being handled", ("route",))
+STAGE_LATENCY = Histogram("camouflage_stage_duration_seconds", "Time spent in each processing stage", ("stage",))
+IMAGE_MEGAPIXELS = Histogram(
+    "camouflage_image_megapixels", "Size of uploaded images", ("route",), buckets=MEGAPIXEL_BUCKETS)
+MODEL_INFERENCES = Counter("camouflage_model_inferences_total", "Background removal model runs", ("model",))
+MODEL_IMAGES = Counter("camouflage_model_images_total", "Images segmented by the background removal model", ("model",))
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def record_timing(stage: str, seconds: float):
+    """Record the duration of a stage for the current request and the stage histogram"""
+    timings = TIMINGS.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+    STAGE_LATENCY.observe(seconds, stage=stage)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as a processing stage, see record_timing"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(stage, time.perf_counter() - start)
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """Server-Timing header value, stages repeated within a request are summed in order of first use"""
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+import numpy as np
+from PIL import Image as PILImage
+
+from streamlit_camouflage.v1.color_names import get_table as get_color_name_table
+from streamlit_camouflage.v1.config import ORT_GRAPH_OPTIMIZATION, ORT_INTER_OP_THREADS, ORT_INTRA_OP_THREADS
+from streamlit_camouflage.v1.fuzzy_classifier import GetColorDescBatch
+
+if TYPE_CHECKING:
+    import onnxruntime as ort
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "u2netp"
+
+# Names of the onnxruntime.GraphOptimizationLevel members, resolved when the session is created
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+_lock = threading.Lock()
+_session = None
+_ready = False
+_error: Optional[str] = None
+
+
+def get_session_options() -> "ort.SessionOptions":
+    """ONNX Runtime options from the CAMOUFLAGE_ORT_* environment variables"""
+    import onnxruntime as ort
+
+    if ORT_GRAPH_OPTIMIZATION not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph optimization level '{ORT_GRAPH_OPTIMIZATION}', "
+                         f"expected one of {list(GRAPH_OPTIMIZATION_LEVELS)}")
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = ORT_INTRA_OP_THREADS
+    sess_opts.inter_op_num_threads = ORT_INTER_OP_THREADS
+    sess_opts.graph_optimization_level = getattr(ort.GraphOptimizationLevel,
+                                                GRAPH_OPTIMIZATION_LEVELS[ORT_GRAPH_OPTIMIZATION])
+    return sess_opts
+
+
+def get_session():
+    """The u2netp background removal session, created on first use"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                from rembg.sessions import sessions_class
+
+                session_class = next(sc for sc in sessions_class if sc.name() == MODEL_NAME)
+                _session = session_class(MODEL_NAME, get_session_options())
+    return _session
+
+
+def warm_up():
+    """Run every stage once on a small synthetic image"""
+    from sklearn.cluster import KMeans
+
+    from streamlit_camouflage.v1.objects import remove_image_background
+
+    rng = np.random.default_rng(0)
+    image = PILImage.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8))
+    remove_image_background(image)
+    KMeans(n_clusters=2, random_state=1, n_init=1).fit(np.asarray(image).reshape(-1, 3))
+    GetColorDescBatch([(0.0, 50.0, 50.0)])
+
+
+def preload():
+    """Load the model and color name tables, warm them up and mark the backend ready"""
+    global _ready, _error
+    start = time.perf_counter()
+    try:
+        get_session()
+        get_color_name_table()
+        warm_up()
+    except Exception as e:
+        _error = str(e)
+        logger.exception(e)
+        return
+    _ready = True
+    logger.info(f"Backend ready in {time.perf_counter() - start:.2f}s")
+
+
+def mark_ready():
+    """Mark the backend ready without preloading, models then load on first use"""
+    global _ready
+    _ready = True
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def status() -> Dict[str, object]:
+    return {"ready": _ready, "error": _error}
@@ -1,68 +1,388 @@
 import io
 from io import BytesIO
-from typing import Dict, List, Tuple, NewType
+from typing import Dict, List, Optional, Tuple, NewType
 import logging
 
 import numpy as np
-from PIL import Image as PILImage
-from rembg import remove, new_session
-from scipy.spatial import KDTree
-from sklearn.cluster import KMeans
-from webcolors import (
-    CSS3_HEX_TO_NAMES,
-    hex_to_rgb,
+from PIL import Image as PILImage, ImageOps
+
+from streamlit_camouflage.v1.batching import MODEL_SIZE, MaskBatcher, Size
+from streamlit_camouflage.v1.color_names import DEFAULT_PALETTE, get_color_names
+from streamlit_camouflage.v1.config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+from streamlit_camouflage.v1.decoding import decode_image
+from streamlit_camouflage.v1.hierarchy import ColorHierarchy
+from streamlit_camouflage.v1.metrics import timed
+from streamlit_camouflage.v1.models import get_session
+from streamlit_camouflage.v1.sampling import RegionSampler
+from streamlit_camouflage.v1.utils import (
+    get_foreground_pixels,
+    quantize_pixels,
+    quantize_region_pixels,
+    scaled_size,
+    stratified_subsample,
 )
 
-def get_session():
-    return new_session("u2netp")
+MASK_BATCHER = MaskBatcher(get_session, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
 
-def get_kdt_db():
-    names = []
-    rgb_values = []
-    for color_hex, color_name in CSS3_HEX_TO_NAMES.items():
-        names.append(color_name)
-        rgb_values.append(hex_to_rgb(color_hex))
-    
-    return names, KDTree(rgb_values)
+Colors = NewType('Colors', Dict[Tuple[float, float, float], float])
 
-SESSION = get_session()
+EXTRACTION_MODES = ('full', 'fast', 'histogram')
+DEFAULT_MAX_PIXELS = 50_000
+MAX_COLORS = 16
+DEFAULT_QUANTIZE_BITS = 5
 
-COLOR_NAMES, KDT_DB = get_kdt_db()
+# Encodings of the background removal output, and their media types
+JPEG_ALPHA_BOUNDARY = 'camouflage-alpha'
+OUTPUT_MEDIA_TYPES = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'jpeg': f'multipart/mixed; boundary={JPEG_ALPHA_BOUNDARY}',
+    'mask': 'image/png',
+}
+DEFAULT_COMPRESS_LEVEL = 6
+DEFAULT_JPEG_QUALITY = 90
 
-Colors = NewType('Colors', Dict[Tuple[float, float, float], float])
+# Longest side of the image u2netp sees in the low resolution mask path, twice its input size so the
+# model's own LANCZOS resize still has detail to filter
+LOWRES_INPUT_SIDE = 2 * max(MODEL_SIZE)
 
 logger = logging.getLogger()
 
+def predict_mask(image: PILImage.Image, lowres: bool = False, size: Optional[Size] = None) -> PILImage.Image:
+    """Predict the background removal mask of an image, sharing the model inference with concurrent requests
+
+    Args:
+        image (PILImage.Image): Image to segment
+        lowres (bool, optional): Downsample the image to LOWRES_INPUT_SIDE before inference instead of
+            preprocessing it at full resolution, only the mask is upsampled. Defaults to False.
+        size (Optional[Size], optional): Size of the mask, None for the size of the image. Defaults to None.
+
+    Returns:
+        PILImage.Image: Grayscale mask, 0 for background
+    """
+    size = size or image.size
+    if lowres:
+        image = image.resize(scaled_size(image.size, LOWRES_INPUT_SIDE), PILImage.BILINEAR, reducing_gap=2.0)
+    with timed("rembg"):
+        return MASK_BATCHER.predict(image, size)
+
+def predict_foreground(
+        image: PILImage.Image,
+        lowres: bool = False,
+        max_side: Optional[int] = None
+    ) -> Tuple[PILImage.Image, PILImage.Image]:
+    """Orient and resize an image for output and predict its background removal mask
+
+    Args:
+        image (PILImage.Image): Image to remove the background from
+        lowres (bool, optional): Predict the mask from a downsampled image, see predict_mask. Defaults to False.
+        max_side (Optional[int], optional): Longest side of the output image, which is never upscaled.
+            Defaults to None, the size of the input image.
+
+    Returns:
+        Tuple[PILImage.Image, PILImage.Image]: The output image and its grayscale mask
+    """
+    image = ImageOps.exif_transpose(image)
+    if max_side is not None and scaled_size(image.size, max_side) != image.size:
+        image = image.resize(scaled_size(image.size, max_side), PILImage.LANCZOS, reducing_gap=3.0)
+    return image, predict_mask(image, lowres)
+
+def remove_image_background(
+        image: PILImage.Image,
+        lowres: bool = False,
+        max_side: Optional[int] = None
+    ) -> PILImage.Image:
+    """Remove the background of an image, sharing the model inference with concurrent requests
+
+    Equivalent to rembg's remove() with its default options when lowres is False and max_side is None.
+
+    Args:
+        image (PILImage.Image): Image to remove the background from
+        lowres (bool, optional): Predict the mask from a downsampled image, see predict_mask. Defaults to False.
+        max_side (Optional[int], optional): Longest side of the output image, which is never upscaled.
+            Defaults to None, the size of the input image.
+
+    Returns:
+        PILImage.Image: RGBA image with a transparent background
+    """
+    image, mask = predict_foreground(image, lowres, max_side)
+    return PILImage.composite(image, PILImage.new('RGBA', image.size, 0), mask)
+
+def encode_image(image: PILImage.Image, format: str, **params) -> bytes:
+    """Encode an image with PIL
+
+    Args:
+        image (PILImage.Image): Image to encode
+        format (str): PIL format name, e.g. 'PNG'
+        **params: Options of the PIL encoder
+
+    Returns:
+        bytes: Encoded image
+    """
+    buffer = io.BytesIO()
+    with timed("encode"):
+        image.save(buffer, format=format, **params)
+    # With no views of the buffer exported, getvalue hands over its bytes object trimmed in place, not a copy
+    return buffer.getvalue()
+
+def encode_multipart(parts: List[Tuple[str, str, bytes]], boundary: str) -> bytes:
+    """Encode a multipart/mixed body
+
+    Args:
+        parts (List[Tuple[str, str, bytes]]): Name, content type and content of each part
+        boundary (str): Boundary between the parts
+
+    Returns:
+        bytes: Multipart body
+    """
+    chunks = []
+    for name, content_type, content in parts:
+        chunks.append(f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+                      f'Content-Disposition: inline; name="{name}"\r\n\r\n'.encode())
+        chunks.append(content)
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(chunks)
+
+def fit_clusters(
+        pixels: np.ndarray,
+        n: int,
+        mode: str = 'full',
+        max_pixels: int = DEFAULT_MAX_PIXELS,
+        quantize_bits: int = DEFAULT_QUANTIZE_BITS
+    ) -> Tuple[np.ndarray, np.ndarray]:
+    """Cluster foreground pixels into n colors
+
+    Args:
+        pixels (np.ndarray): Array of shape (N, 3) of RGB pixels
+        n (int): Number of clusters
+        mode (str, optional): Color extraction mode, see Clothing. Defaults to 'full'.
+        max_pixels (int, optional): Pixel budget of the 'fast' mode. Defaults to DEFAULT_MAX_PIXELS.
+        quantize_bits (int, optional): Bits per channel of the 'histogram' mode. Defaults to DEFAULT_QUANTIZE_BITS.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Cluster centroids of shape (k, 3) and the number of pixels in each, where
+            k is n or, when fewer, the number of pixels, or occupied bins of the 'histogram' mode, clustered
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    # Find clusters of colors to determine dominant colors
+    weights = None
+    if mode == 'fast':
+        pixels = stratified_subsample(pixels, max_pixels, seed=1)
+        k = min(n, len(pixels))
+        color_cluster = MiniBatchKMeans(n_clusters=k, random_state=1, n_init=3).fit(pixels)
+    elif mode == 'histogram':
+        pixels, weights = quantize_pixels(pixels, quantize_bits)
+        k = min(n, len(pixels))
+        color_cluster = KMeans(n_clusters=k, random_state=1, n_init=10).fit(pixels, sample_weight=weights)
+    else:
+        k = min(n, len(pixels))
+        color_cluster = KMeans(n_clusters=k, random_state=1, n_init=10).fit(pixels)
+    return color_cluster.cluster_centers_, np.bincount(color_cluster.labels_, weights=weights, minlength=k)
+
+def cluster_colors(
+        pixels: np.ndarray,
+        n: int,
+        mode: str = 'full',
+        max_pixels: int = DEFAULT_MAX_PIXELS,
+        quantize_bits: int = DEFAULT_QUANTIZE_BITS
+    ) -> Colors:
+    """Find the dominant colors of foreground pixels
+
+    Args:
+        pixels (np.ndarray): Array of shape (N, 3) of RGB pixels
+        n (int): Number of colors to extract
+        mode (str, optional): Color extraction mode, see Clothing. Defaults to 'full'.
+        max_pixels (int, optional): Pixel budget of the 'fast' mode. Defaults to DEFAULT_MAX_PIXELS.
+        quantize_bits (int, optional): Bits per channel of the 'histogram' mode. Defaults to DEFAULT_QUANTIZE_BITS.
+
+    Returns:
+        Colors: Share of the pixels of each color, in order of frequency
+    """
+    colors, color_hist = fit_clusters(pixels, n, mode, max_pixels, quantize_bits)
+
+    # Compute the percent of the pixels containing that color
+    color_hist = color_hist.astype("float")
+    color_hist /= color_hist.sum()
+
+    # Save the color and the percent of pixels with that color
+    image_colors = dict()
+    pct_colors = sorted([(percent, color) for percent, color in zip(color_hist, colors)])[::-1]
+    for pct, color in pct_colors:
+        color = tuple(color.tolist())
+        image_colors[color] = pct
+    return image_colors
+
+def cluster_region_colors(
+        pixels: np.ndarray,
+        regions: np.ndarray,
+        n_regions: int,
+        n: int,
+        quantize_bits: int = DEFAULT_QUANTIZE_BITS
+    ) -> List[Colors]:
+    """Find the dominant colors of several regions, from histograms of all of them built in one pass
+
+    Each region's occupied histogram bins are clustered with KMeans weighted by bin counts, as the
+    'histogram' mode of cluster_colors.
+
+    Args:
+        pixels (np.ndarray): Array of shape (N, 3) of RGB pixels
+        regions (np.ndarray): Array of shape (N,) of the region of every pixel, from 0 to n_regions - 1
+        n_regions (int): Number of regions
+        n (int): Number of colors to extract from each region, fewer for regions with fewer distinct colors
+        quantize_bits (int, optional): Bits per channel of the histograms. Defaults to DEFAULT_QUANTIZE_BITS.
+
+    Returns:
+        List[Colors]: Share of the region's pixels of each color, in order of frequency, for every region
+    """
+    from sklearn.cluster import KMeans
+
+    palettes = []
+    for bins, weights in quantize_region_pixels(pixels, regions, n_regions, quantize_bits):
+        k = min(n, len(bins))
+        if k == 0:
+            palettes.append({})
+            continue
+        color_cluster = KMeans(n_clusters=k, random_state=1, n_init=10).fit(bins, sample_weight=weights)
+        color_hist = np.bincount(color_cluster.labels_, weights=weights, minlength=k)
+        color_hist /= color_hist.sum()
+        order = np.argsort(-color_hist, kind='stable')
+        palettes.append({tuple(color_cluster.cluster_centers_[i].tolist()): float(color_hist[i]) for i in order})
+    return palettes
+
 class Image:
     """Describes an image."""
 
-    def __init__(self, image_bytes: BytesIO):
+    def __init__(self, image_bytes: BytesIO, max_side: Optional[int] = None):
         """
         Args:
             image_bytes (BytesIO): Image of the clothing item
+            max_side (Optional[int], optional): Longest side the image is decoded at, see decode_image.
+                Defaults to None, the full image.
         """
         self.image_bytes: BytesIO = image_bytes
-        self.image: PILImage.Image = PILImage.open(image_bytes).convert('RGB')
+        self.image, self.original_size = decode_image(image_bytes, max_side)
 
-    def rembg(self) -> bytes:
-        image_rembg = remove(self.image, session=SESSION).convert('RGB')
-        img_byte_arr = io.BytesIO()
-        image_rembg.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        return img_byte_arr
+    def rembg(
+            self,
+            lowres: bool = False,
+            max_side: Optional[int] = None,
+            output: str = 'png',
+            compress_level: int = DEFAULT_COMPRESS_LEVEL,
+            quality: int = DEFAULT_JPEG_QUALITY
+        ) -> bytes:
+        """Remove the background of the image and encode the result
+
+        Args:
+            lowres (bool, optional): Predict the mask from a downsampled image, see predict_mask. Defaults to False.
+            max_side (Optional[int], optional): Longest side of the output image. Defaults to None.
+            output (str, optional): Encoding, one of OUTPUT_MEDIA_TYPES. 'png' and 'webp' (lossless) are RGBA
+                images with a transparent background, 'jpeg' is a multipart body of the unmasked JPEG image
+                followed by its mask as a grayscale PNG, 'mask' is the grayscale PNG mask alone. Defaults to 'png'.
+            compress_level (int, optional): zlib level of PNG outputs, 0 to 9, also sets the effort of lossless
+                WebP. Defaults to DEFAULT_COMPRESS_LEVEL.
+            quality (int, optional): Quality of the 'jpeg' output, 1 to 100. Defaults to DEFAULT_JPEG_QUALITY.
+
+        Returns:
+            bytes: Encoded output, of media type OUTPUT_MEDIA_TYPES[output]
+        """
+        if output not in OUTPUT_MEDIA_TYPES:
+            raise ValueError(f"Unknown output '{output}', expected one of {list(OUTPUT_MEDIA_TYPES)}")
+        image, mask = predict_foreground(self.image, lowres, max_side)
+
+        if output == 'mask':
+            return encode_image(mask, 'PNG', compress_level=compress_level)
+        if output == 'jpeg':
+            return encode_multipart([
+                ('image', 'image/jpeg', encode_image(image.convert('RGB'), 'JPEG', quality=quality)),
+                ('alpha', 'image/png', encode_image(mask, 'PNG', compress_level=compress_level)),
+            ], JPEG_ALPHA_BOUNDARY)
+
+        image_rembg = PILImage.composite(image, PILImage.new('RGBA', image.size, 0), mask)
+        if output == 'webp':
+            return encode_image(image_rembg, 'WEBP', lossless=True, method=round(compress_level * 6 / 9))
+        return encode_image(image_rembg, 'PNG', compress_level=compress_level)
+
+def build_sampler(
+        image_bytes: BytesIO,
+        rembg: bool = False,
+        lowres: bool = True,
+        max_side: Optional[int] = None
+    ) -> RegionSampler:
+    """Decode an image and build the summed-area tables to sample its colors from
+
+    Args:
+        image_bytes (BytesIO): Encoded image
+        rembg (bool, optional): Only sample the foreground found by background removal. Defaults to False,
+            which still masks out transparent pixels of images with an alpha channel.
+        lowres (bool, optional): Predict and keep the mask at the low resolution of predict_mask. Defaults to True.
+        max_side (Optional[int], optional): Longest side the image is decoded at. Defaults to None, the full image.
+
+    Returns:
+        RegionSampler: Sampler of the decoded image, in its pixel coordinates
+    """
+    image, _ = decode_image(image_bytes, max_side)
+    mask = image.getchannel('A') if image.mode == 'RGBA' else None
+    image = image.convert('RGB')
+    if rembg:
+        size = scaled_size(image.size, LOWRES_INPUT_SIDE) if lowres else None
+        mask = predict_mask(image, lowres, size)
+    with timed("sat"):
+        return RegionSampler(np.asarray(image), None if mask is None else np.asarray(mask))
 
 
 class Clothing:
     """Describes an article of clothing"""
 
-    def __init__(self, image_bytes: BytesIO):
+    def __init__(
+            self,
+            image_bytes: BytesIO,
+            mode: str = 'full',
+            max_pixels: int = DEFAULT_MAX_PIXELS,
+            quantize_bits: int = DEFAULT_QUANTIZE_BITS,
+            max_side: Optional[int] = None
+        ):
         """
         Args:
             image_bytes (BytesIO): Image of the clothing item
+            mode (str, optional): Color extraction mode, one of EXTRACTION_MODES. 'full' clusters every
+                foreground pixel with KMeans, 'fast' clusters at most max_pixels stratified samples with
+                MiniBatchKMeans, 'histogram' clusters the occupied bins of a quantized RGB histogram with
+                KMeans weighted by bin counts. Defaults to 'full'.
+            max_pixels (int, optional): Pixel budget of the 'fast' mode. Defaults to DEFAULT_MAX_PIXELS.
+            quantize_bits (int, optional): Bits per channel of the 'histogram' mode. Defaults to
+                DEFAULT_QUANTIZE_BITS.
+            max_side (Optional[int], optional): Longest side the image is decoded at, see decode_image.
+                Defaults to None, the full image.
         """
+        if mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode '{mode}', expected one of {EXTRACTION_MODES}")
         self.image_bytes: BytesIO = image_bytes
-        self.image: np.ndarray = PILImage.open(image_bytes).convert('RGB')
+        self.image, self.original_size = decode_image(image_bytes, max_side)
+        self.mode: str = mode
+        self.max_pixels: int = max_pixels
+        self.quantize_bits: int = quantize_bits
+        self.mask: PILImage.Image = None
         self.colors: Colors = None
+        self.hierarchy: ColorHierarchy = None
+
+    def rembg(self, lowres: bool = False):
+        """Remove the background from the clothing image
+
+        Only the mask is kept, colors are extracted from the pixels it selects without compositing the image.
+
+        Args:
+            lowres (bool, optional): Predict the mask from a downsampled image, see predict_mask. Defaults to False.
+        """
+        self.mask = predict_mask(self.image, lowres)
+
+    @property
+    def image_rembg(self) -> PILImage.Image:
+        """The clothing image with its background removed, composited on access"""
+        if self.mask is None:
+            return self.image
+        return PILImage.composite(self.image, PILImage.new('RGBA', self.image.size, 0), self.mask)
 
     def extract_colors(self, n: float = 4):
         """Extract the colors from clothing image
@@ -70,27 +390,34 @@ class Clothing:
         Args:
             n (float, optional): Number of colors to extract from the image. Defaults to 4.
         """
-        # Decompose image into pixels
-        pixels = np.array([pixel for row in np.array(self.image) for pixel in row if sum(pixel) != 0])
-    
-        # Find clusters of colors to determine dominant colors
-        color_cluster = KMeans(n_clusters=n, random_state=1, n_init=10).fit(pixels)
-        cluster, colors = color_cluster, color_cluster.cluster_centers_
-        
-        # Compute the percent of the pixels containing that color
-        color_labels = np.arange(0, len(np.unique(cluster.labels_)) + 1)
-        (color_hist, _) = np.histogram(cluster.labels_, bins = color_labels)
-        color_hist = color_hist.astype("float")
-        color_hist /= color_hist.sum()
+        # Decompose image into foreground pixels
+        with timed("pixels"):
+            pixels = get_foreground_pixels(self.image, self.mask)
 
-        # Save the color and the percent of pixels with that color
-        image_colors = dict()
-        pct_colors = sorted([(percent, color) for percent, color in zip(color_hist, colors)])[::-1]
-        for pct, color in pct_colors:
-            color = tuple(color.tolist())
-            image_colors[color] = pct
+        with timed("cluster"):
+            self.colors = cluster_colors(pixels, n, self.mode, self.max_pixels, self.quantize_bits)
 
-        self.colors = image_colors
+    def extract_palettes(self, n: int, max_n: int) -> Dict[int, Colors]:
+        """Extract palettes of n to max_n colors from a single clustering
+
+        The pixels are clustered once into max_n colors, smaller palettes merge those clusters, see
+        ColorHierarchy. The palette of n colors is kept as the colors of the clothing.
+
+        Args:
+            n (int): Smallest number of colors
+            max_n (int): Largest number of colors
+
+        Returns:
+            Dict[int, Colors]: Palette of every number of colors
+        """
+        with timed("pixels"):
+            pixels = get_foreground_pixels(self.image, self.mask)
+
+        with timed("cluster"):
+            self.hierarchy = ColorHierarchy(*fit_clusters(pixels, max_n, self.mode, self.max_pixels, self.quantize_bits))
+        palettes = self.hierarchy.palettes(n, max_n)
+        self.colors = palettes[n]
+        return palettes
 
     def get_colors(self) -> List[Tuple[float, float, float]]:
         """Gets the list of colors as rgb values in order of frequency
@@ -101,14 +428,14 @@ class Clothing:
         colors = [color for color, _ in self.colors.items()]
         return colors
 
-    def get_color_names(self) -> List[str]:
+    def get_color_names(self, palette: str = DEFAULT_PALETTE) -> List[str]:
         """Gets the names of the colors as strings in order of frequency
 
+        Args:
+            palette (str, optional): Color names to choose from, one of color_names.PALETTES.
+                Defaults to DEFAULT_PALETTE.
+
         Returns:
             List[str]: List of color names in order of frequency in the clothing image
         """
-        color_names = []
-        for color in self.get_colors():
-            distance, index = KDT_DB.query(color)
-            color_names.append(COLOR_NAMES[index])
-        return color_names
+        return get_color_names(self.get_colors(), palette)
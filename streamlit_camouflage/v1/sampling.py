@@ -0,0 +1,258 @@
+"""Sample the color of square windows of an image in constant time per query.
+
+A RegionSampler builds summed-area tables of an image once, weighted by an optional foreground mask, then
+answers the mean color of any window with four lookups. The dominant color uses an integral histogram of
+quantized colors on a downsampled grid, built on first use.
+"""
+from collections import OrderedDict
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from streamlit_camouflage.v1.config import SAMPLER_CACHE_MAX_BYTES, SAMPLER_CACHE_MAX_ENTRIES, SAMPLER_CACHE_TTL
+
+SAMPLE_METHODS = ('mean', 'dominant')
+
+# Quantization and grid of the integral histogram behind dominant colors
+HISTOGRAM_BITS = 2
+HISTOGRAM_SIDE = 128
+
+
+def summed_area_table(values: np.ndarray) -> np.ndarray:
+    """Summed-area table of an (H, W, C) array, padded with a leading row and column of zeros
+
+    The smallest unsigned integer type that cannot overflow is used for integer inputs.
+
+    Returns:
+        np.ndarray: Array of shape (H + 1, W + 1, C), where [y, x] is the sum of values[:y, :x]
+    """
+    height, width, channels = values.shape
+    if np.issubdtype(values.dtype, np.integer):
+        bound = int(values.max(initial=0)) * height * width
+        dtype = np.uint32 if bound < 2 ** 32 else np.uint64
+    else:
+        dtype = np.float64
+    table = np.zeros((height + 1, width + 1, channels), dtype=dtype)
+    np.cumsum(values, axis=0, dtype=dtype, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, dtype=dtype, out=table[1:, 1:])
+    return table
+
+
+def box_sums(table: np.ndarray, y0: np.ndarray, y1: np.ndarray, x0: np.ndarray, x1: np.ndarray) -> np.ndarray:
+    """Sums of the windows [y0, y1) x [x0, x1) from a summed-area table, one row per window"""
+    # Signed arithmetic, the intermediate differences of unsigned tables could wrap around
+    dtype = np.int64 if table.dtype.kind in 'iu' else table.dtype
+    corners = [table[y, x].astype(dtype) for y, x in ((y1, x1), (y0, x1), (y1, x0), (y0, x0))]
+    return corners[0] - corners[1] - corners[2] + corners[3]
+
+
+class RegionSampler:
+    """Mean and dominant colors of square windows of an image, in constant time per window"""
+
+    def __init__(
+            self,
+            image: np.ndarray,
+            mask: Optional[np.ndarray] = None,
+            histogram_bits: int = HISTOGRAM_BITS,
+            histogram_side: int = HISTOGRAM_SIDE
+        ):
+        """
+        Args:
+            image (np.ndarray): uint8 RGB array of shape (H, W, 3)
+            mask (Optional[np.ndarray], optional): Grayscale foreground mask, 0 for background. It may be smaller
+                than the image, e.g. the low resolution output of rembg, and is scaled to it with nearest
+                neighbour lookups. Defaults to None, every pixel counts.
+            histogram_bits (int, optional): Bits per channel of the colors counted for dominant colors.
+                Defaults to HISTOGRAM_BITS.
+            histogram_side (int, optional): Longest side of the grid dominant colors are counted on.
+                Defaults to HISTOGRAM_SIDE.
+        """
+        self.image: np.ndarray = np.ascontiguousarray(image[..., :3], dtype=np.uint8)
+        self.height, self.width = self.image.shape[:2]
+        self.weights: np.ndarray = self._weights(mask)
+        self.masked: bool = mask is not None
+        self.histogram_bits: int = histogram_bits
+        self.histogram_side: int = histogram_side
+
+        values = np.concatenate([self.image * self.weights[..., None], self.weights[..., None]], axis=-1)
+        self._table: np.ndarray = summed_area_table(values)
+        self._histogram: Optional[Tuple[np.ndarray, np.ndarray, float]] = None
+
+    def _weights(self, mask: Optional[np.ndarray]) -> np.ndarray:
+        if mask is None:
+            return np.ones((self.height, self.width), dtype=np.uint8)
+        mask = np.asarray(mask)
+        if mask.shape[:2] != (self.height, self.width):
+            rows = np.arange(self.height) * mask.shape[0] // self.height
+            cols = np.arange(self.width) * mask.shape[1] // self.width
+            mask = mask[rows[:, None], cols[None, :]]
+        return (mask >= 128).astype(np.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the image and its tables"""
+        histogram = sum(a.nbytes for a in self._histogram[:2]) if self._histogram is not None else 0
+        return self.image.nbytes + self.weights.nbytes + self._table.nbytes + histogram
+
+    def _windows(self, points, radius: int, scale: float = 1.0, shape: Tuple[int, int] = None):
+        """Bounds of the windows of radius pixels around (x, y) points, clipped to the image"""
+        height, width = shape or (self.height, self.width)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2) * scale
+        x = np.clip(np.floor(points[:, 0]).astype(np.int64), 0, width - 1)
+        y = np.clip(np.floor(points[:, 1]).astype(np.int64), 0, height - 1)
+        r = int(round(radius * scale))
+        return (np.maximum(y - r, 0), np.minimum(y + r + 1, height),
+                np.maximum(x - r, 0), np.minimum(x + r + 1, width))
+
+    def mean(self, points, radius: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Mean foreground color of the window of radius pixels around each point
+
+        Args:
+            points: Array-like of shape (N, 2) of x, y pixel coordinates
+            radius (int, optional): Half the side of the window, 0 for the pixel alone. Defaults to 5.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: RGB means of shape (N, 3) and the foreground share of each window.
+                Windows without foreground take the color of their center pixel, with a share of 0.
+        """
+        y0, y1, x0, x1 = self._windows(points, radius)
+        sums = box_sums(self._table, y0, y1, x0, x1).astype(np.float64)
+        counts = sums[:, 3]
+        centers = self.image[(y0 + y1) // 2, (x0 + x1) // 2].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(counts[:, None] > 0, sums[:, :3] / counts[:, None], centers)
+        return means, counts / ((y1 - y0) * (x1 - x0))
+
+    def _build_histogram(self) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Integral histogram of quantized colors, and the RGB sums of each bin, on a downsampled grid"""
+        scale = min(1.0, self.histogram_side / max(self.height, self.width))
+        rows = (np.arange(max(1, round(self.height * scale))) / scale).astype(np.int64)
+        cols = (np.arange(max(1, round(self.width * scale))) / scale).astype(np.int64)
+        grid = self.image[rows[:, None], cols[None, :]]
+        weights = self.weights[rows[:, None], cols[None, :]]
+
+        shift = 8 - self.histogram_bits
+        quantized = (grid >> shift).astype(np.int64)
+        bins = (quantized[..., 0] << 2 * self.histogram_bits) | (quantized[..., 1] << self.histogram_bits) | quantized[..., 2]
+        one_hot = (bins[..., None] == np.arange(1 << 3 * self.histogram_bits)) * weights[..., None]
+
+        counts = summed_area_table(one_hot.astype(np.uint8))
+        sums = summed_area_table((one_hot[..., None] * grid[..., None, :]).reshape(*one_hot.shape[:2], -1))
+        return counts, sums, scale
+
+    def dominant(self, points, radius: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Mean color of the most common quantized foreground color in the window of radius pixels around each point
+
+        Windows are snapped to the histogram grid, so they cover at least one grid cell.
+
+        Args:
+            points: Array-like of shape (N, 2) of x, y pixel coordinates
+            radius (int, optional): Half the side of the window. Defaults to 5.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: RGB colors of shape (N, 3) and the share of each window that has the
+                dominant color. Windows without foreground fall back to mean.
+        """
+        if self._histogram is None:
+            self._histogram = self._build_histogram()
+        counts_table, sums_table, scale = self._histogram
+
+        grid_shape = (counts_table.shape[0] - 1, counts_table.shape[1] - 1)
+        y0, y1, x0, x1 = self._windows(points, radius, scale, grid_shape)
+        counts = box_sums(counts_table, y0, y1, x0, x1)
+        best = counts.argmax(axis=1)
+        rows = np.arange(len(best))
+        best_counts = counts[rows, best]
+        sums = box_sums(sums_table, y0, y1, x0, x1).reshape(len(best), -1, 3)[rows, best]
+
+        colors, shares = self.mean(points, radius)
+        found = best_counts > 0
+        colors[found] = sums[found] / best_counts[found, None]
+        shares[found] = best_counts[found] / ((y1 - y0) * (x1 - x0))[found]
+        return colors, shares
+
+    def sample(self, points, radius: int = 5, method: str = 'mean') -> Tuple[np.ndarray, np.ndarray]:
+        """Colors of the windows around points with one of SAMPLE_METHODS, see mean and dominant"""
+        if method not in SAMPLE_METHODS:
+            raise ValueError(f"Unknown sampling method '{method}', expected one of {SAMPLE_METHODS}")
+        return getattr(self, method)(points, radius)
+
+
+class SamplerCache:
+    """Byte-budgeted LRU cache of prepared samplers, dropping those unused for ttl seconds
+
+    Samplers grow when their dominant color histogram is built, so sizes are re-read from nbytes on every use.
+    The most recently used sampler is always kept, even when it alone is over the budget.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_bytes: int = SAMPLER_CACHE_MAX_BYTES):
+        """
+        Args:
+            max_entries (int): Largest number of samplers kept
+            ttl (float): Seconds a sampler is kept after its last use
+            max_bytes (int, optional): Budget of the samplers' tables in bytes. Defaults to SAMPLER_CACHE_MAX_BYTES.
+        """
+        self.max_entries: int = max_entries
+        self.ttl: float = ttl
+        self.max_bytes: int = max_bytes
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._entries: "OrderedDict[str, Tuple[RegionSampler, float, int]]" = OrderedDict()
+
+    def _pop_oldest(self):
+        _, (_, _, nbytes) = self._entries.popitem(last=False)
+        self.size -= nbytes
+
+    def _expire(self, now: float):
+        while self._entries and next(iter(self._entries.values()))[1] + self.ttl < now:
+            self._pop_oldest()
+
+    def _store(self, key: str, sampler: RegionSampler, now: float):
+        """Store or refresh an entry as the most recently used, re-reading its size"""
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous[2]
+        self._entries[key] = (sampler, now, sampler.nbytes)
+        self.size += sampler.nbytes
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+            self._pop_oldest()
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[RegionSampler]:
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._store(key, entry[0], now)
+        return entry[0]
+
+    def put(self, key: str, sampler: RegionSampler):
+        now = time.monotonic()
+        self._expire(now)
+        self._store(key, sampler, now)
+
+    def update(self, key: str):
+        """Re-read the size of a sampler after its use built more tables, evicting others to fit the budget"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0].nbytes != entry[2]:
+            self._store(key, entry[0], entry[1])
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and memory usage"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+SAMPLER_CACHE = SamplerCache(SAMPLER_CACHE_MAX_ENTRIES, SAMPLER_CACHE_TTL)
@@ -0,0 +1,142 @@
+"""Split the foreground of a full-body photo into garment regions.
+
+The background removal mask is cleaned of small connected components, then the height of the remaining
+figure is cut into vertical bands in the proportions of a standing person. Each cut between two garments
+moves, within a search window, to the row where the mean foreground color changes most, e.g. the waistline.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+# Garment name and the band of the figure's height it covers, the head above the first band is left out
+GARMENT_BANDS = (
+    ('top', 0.12, 0.52),
+    ('bottom', 0.52, 0.93),
+    ('shoes', 0.93, 1.0),
+)
+# Share of the figure's height a cut between two garments may move by
+BOUNDARY_SEARCH = 0.08
+# Connected components smaller than this share of the foreground are noise
+MIN_COMPONENT_SHARE = 0.01
+# Regions smaller than this share of the foreground are dropped
+MIN_REGION_SHARE = 0.02
+
+
+def clean_foreground(foreground: np.ndarray, min_share: float = MIN_COMPONENT_SHARE) -> np.ndarray:
+    """Drop the connected components of a foreground mask smaller than min_share of the foreground
+
+    Args:
+        foreground (np.ndarray): Boolean array of shape (H, W)
+        min_share (float, optional): Smallest share of the foreground kept. Defaults to MIN_COMPONENT_SHARE.
+
+    Returns:
+        np.ndarray: Boolean array of shape (H, W)
+    """
+    from scipy import ndimage
+
+    components, n_components = ndimage.label(foreground)
+    if n_components == 0:
+        return foreground
+    sizes = np.bincount(components.ravel(), minlength=n_components + 1)
+    keep = sizes >= min_share * sizes[1:].sum()
+    keep[0] = False
+    return keep[components]
+
+
+def find_cut(
+        row_sums: np.ndarray,
+        row_counts: np.ndarray,
+        nominal: int,
+        search: int
+    ) -> int:
+    """Row near nominal where the mean foreground color above and below differs most
+
+    Args:
+        row_sums (np.ndarray): Array of shape (H, 3) of the summed foreground RGB of every row
+        row_counts (np.ndarray): Array of shape (H,) of the foreground pixels of every row
+        nominal (int): Row of the cut in the band proportions
+        search (int): Rows the cut may move by, also the height of the windows compared
+
+    Returns:
+        int: Row of the cut, the first row of the lower garment
+    """
+    height = len(row_counts)
+    if search < 1:
+        return nominal
+    sums = np.concatenate([np.zeros((1, 3)), np.cumsum(row_sums, axis=0)])
+    counts = np.concatenate([[0], np.cumsum(row_counts)])
+
+    rows = np.arange(max(nominal - search, 1), min(nominal + search, height - 1) + 1)
+    if len(rows) == 0:
+        return nominal
+    above, below = np.maximum(rows - search, 0), np.minimum(rows + search, height)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_above = (sums[rows] - sums[above]) / (counts[rows] - counts[above])[:, None]
+        mean_below = (sums[below] - sums[rows]) / (counts[below] - counts[rows])[:, None]
+    change = np.nan_to_num(np.linalg.norm(mean_above - mean_below, axis=1), nan=-1.0)
+    if change.max() <= 0:
+        return nominal
+    return int(rows[np.argmax(change)])
+
+
+def segment_garments(
+        image: np.ndarray,
+        mask: np.ndarray,
+        bands: Tuple[Tuple[str, float, float], ...] = GARMENT_BANDS,
+        search: float = BOUNDARY_SEARCH,
+        min_region_share: float = MIN_REGION_SHARE
+    ) -> Tuple[np.ndarray, List[str]]:
+    """Label the garment regions of a full-body photo
+
+    Args:
+        image (np.ndarray): uint8 RGB array of shape (H, W, 3)
+        mask (np.ndarray): Grayscale background removal mask of shape (H, W), 0 for background
+        bands (Tuple[Tuple[str, float, float], ...], optional): Garment names and the bands of the figure's
+            height they cover, from top to bottom. Defaults to GARMENT_BANDS.
+        search (float, optional): Share of the figure's height a cut between adjacent bands may move by to
+            follow a color change. Defaults to BOUNDARY_SEARCH.
+        min_region_share (float, optional): Regions smaller than this share of the foreground are dropped.
+            Defaults to MIN_REGION_SHARE.
+
+    Returns:
+        Tuple[np.ndarray, List[str]]: Array of shape (H, W) of region labels, 0 for background and i + 1 for the
+            i-th region, and the garment name of every region
+    """
+    foreground = clean_foreground(np.asarray(mask) >= 128)
+    labels = np.zeros(foreground.shape, dtype=np.int32)
+    rows = np.flatnonzero(foreground.any(axis=1))
+    if len(rows) == 0:
+        return labels, []
+    top, height = rows[0], rows[-1] + 1 - rows[0]
+
+    # Per-row statistics of the foreground, to place the cuts between garments
+    row_counts = foreground.sum(axis=1)
+    row_sums = np.einsum('hwc,hw->hc', image[..., :3].astype(np.float64), foreground)
+
+    cuts = [top + int(round(bands[0][1] * height))]
+    for (_, _, end), (_, start, _) in zip(bands[:-1], bands[1:]):
+        nominal = top + int(round(end * height))
+        if start == end:
+            nominal = find_cut(row_sums, row_counts, nominal, int(search * height))
+        cuts.append(nominal)
+    cuts.append(top + int(round(bands[-1][2] * height)))
+
+    names = []
+    total = foreground.sum()
+    for (name, _, _), start, end in zip(bands, cuts[:-1], cuts[1:]):
+        region = np.zeros_like(foreground)
+        region[start:end] = foreground[start:end]
+        if region.sum() < min_region_share * total:
+            continue
+        names.append(name)
+        labels[region] = len(names)
+    return labels, names
+
+
+def region_boxes(labels: np.ndarray, n_regions: int) -> List[Tuple[int, int, int, int]]:
+    """Bounding box (x0, y0, x1, y1), exclusive of x1 and y1, of every labelled region"""
+    boxes = []
+    for region in range(1, n_regions + 1):
+        ys, xs = np.nonzero(labels == region)
+        boxes.append((int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1))
+    return boxes
@@ -1,6 +1,210 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image as PILImage
+
+# Largest histogram counted with dense per-bin arrays, 2 MB per array of counts
+MAX_DENSE_BINS = 1 << 18
+
 
 def rgb_to_hex(rgb):
     """Convert RGB values (0 to 255) to HEX"""
     _rgb = tuple([int(c) for c in rgb])
     hex = '#%02x%02x%02x' % _rgb
-    return hex
\ No newline at end of file
+    return hex
+
+def rgb_to_hsv_batch(rgbs) -> np.ndarray:
+    """Convert RGB values (0 to 255) to HSV values (0 to 360, 0 to 100, 0 to 100)
+
+    Vectorized equivalent of colorsys.rgb_to_hsv over an (N, 3) array.
+    """
+    rgb = np.asarray(rgbs, dtype=np.float64).reshape(-1, 3) / 255.0
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    maxc = rgb.max(axis=1)
+    minc = rgb.min(axis=1)
+    rangec = maxc - minc
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.where(maxc > 0, rangec / maxc, 0.0)
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = (h / 6.0) % 1.0
+    gray = minc == maxc
+    h[gray] = 0.0
+    s[gray] = 0.0
+
+    return np.stack([h * 360.0, s * 100.0, maxc * 100.0], axis=1)
+
+def has_alpha(image: PILImage.Image) -> bool:
+    """Whether the image carries transparency, e.g. the output of rembg"""
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+def get_foreground_pixels(image: PILImage.Image, mask: PILImage.Image = None) -> np.ndarray:
+    """Get the foreground pixels of an image with its background removed
+
+    Pixels with a mask value of at least 128 are foreground when a background removal mask is given, so the
+    faint halo of a soft mask is left out. Otherwise pixels with a non-zero alpha are foreground when the image
+    has an alpha channel. Images without one (e.g. flattened rembg output) fall back to treating pure black
+    pixels as removed background.
+
+    Args:
+        image (PILImage.Image): Image with its background removed, or the original image when mask is given
+        mask (PILImage.Image, optional): Grayscale background removal mask the size of the image. Defaults to None.
+
+    Returns:
+        np.ndarray: Array of shape (N, 3) of the RGB foreground pixels in row-major order
+    """
+    if mask is not None:
+        foreground = np.asarray(mask.convert('L')) >= 128
+        if has_alpha(image):
+            array = np.asarray(image.convert('RGBA'))
+            foreground &= array[..., 3] > 0
+        else:
+            array = np.asarray(image.convert('RGB'))
+        return array[foreground][:, :3]
+
+    if has_alpha(image):
+        array = np.asarray(image.convert('RGBA'))
+        return array[array[..., 3] > 0][:, :3]
+
+    array = np.asarray(image.convert('RGB'))
+    return array[array.any(axis=-1)]
+
+def scaled_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """Size scaled down, keeping the aspect ratio, so that its longest side is at most max_side
+
+    Args:
+        size (Tuple[int, int]): Width and height
+        max_side (int): Longest side allowed, sizes that already fit are returned unchanged
+
+    Returns:
+        Tuple[int, int]: Scaled width and height, each at least 1
+    """
+    width, height = size
+    scale = max_side / max(width, height)
+    if scale >= 1:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def stratified_subsample(pixels: np.ndarray, max_pixels: int, seed: int = None) -> np.ndarray:
+    """Sample at most max_pixels rows, one at random from each of max_pixels equal-size strata
+
+    Foreground pixels are in row-major order, so strata are contiguous regions of the image and the sample
+    keeps the spatial spread of the garment.
+
+    Args:
+        pixels (np.ndarray): Array of shape (N, 3) of pixels
+        max_pixels (int): Pixel budget
+        seed (int, optional): Seed of the random generator. Defaults to None.
+
+    Returns:
+        np.ndarray: Array of shape (min(N, max_pixels), 3) of sampled pixels
+    """
+    n = len(pixels)
+    if n <= max_pixels:
+        return pixels
+    rng = np.random.default_rng(seed)
+    stride = n / max_pixels
+    idx = ((np.arange(max_pixels) + rng.random(max_pixels)) * stride).astype(np.intp)
+    return pixels[np.minimum(idx, n - 1)]
+
+def bin_means(pixels: np.ndarray, bins: np.ndarray, n_bins: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Mean color and pixel count of every occupied bin of a histogram
+
+    Histograms of at most MAX_DENSE_BINS bins are counted densely. Larger ones are indexed by their occupied bins
+    only, so memory follows the number of pixels rather than the number of bins.
+
+    Args:
+        pixels (np.ndarray): Array of shape (N, 3) of pixels
+        bins (np.ndarray): Array of shape (N,) of the bin of every pixel, from 0 to n_bins - 1
+        n_bins (int): Number of bins of the histogram
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Occupied bins in increasing order, array of shape (M,), the mean
+            color of each, array of shape (M, 3), and their pixel counts, array of shape (M,)
+    """
+    if n_bins <= MAX_DENSE_BINS:
+        counts = np.bincount(bins, minlength=n_bins)
+        occupied = np.nonzero(counts)[0]
+        counts = counts[occupied]
+        sums = np.stack([np.bincount(bins, weights=pixels[:, c], minlength=n_bins)[occupied] for c in range(3)], axis=1)
+    else:
+        occupied, ids = np.unique(bins, return_inverse=True)
+        ids = ids.ravel()
+        counts = np.bincount(ids, minlength=len(occupied))
+        sums = np.stack([np.bincount(ids, weights=pixels[:, c], minlength=len(occupied)) for c in range(3)], axis=1)
+    return occupied, sums / counts[:, None], counts.astype(np.float64)
+
+def quantize_pixels(pixels: np.ndarray, bits: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """Aggregate pixels into a quantized RGB histogram
+
+    Args:
+        pixels (np.ndarray): Array of shape (N, 3) of uint8 pixels
+        bits (int, optional): Bits kept per channel. Defaults to 5.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Mean color of every occupied bin, array of shape (M, 3), and the
+            number of pixels in each of those bins, array of shape (M,)
+    """
+    pixels = np.asarray(pixels, dtype=np.uint8).reshape(-1, 3)
+    q = (pixels >> (8 - bits)).astype(np.intp)
+    bins = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+    _, means, counts = bin_means(pixels, bins, 1 << (3 * bits))
+    return means, counts
+
+def quantize_region_pixels(
+        pixels: np.ndarray,
+        regions: np.ndarray,
+        n_regions: int,
+        bits: int = 5
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Aggregate the pixels of several regions into one quantized RGB histogram each, in a single pass
+
+    Args:
+        pixels (np.ndarray): Array of shape (N, 3) of uint8 pixels
+        regions (np.ndarray): Array of shape (N,) of the region of every pixel, from 0 to n_regions - 1
+        n_regions (int): Number of regions
+        bits (int, optional): Bits kept per channel. Defaults to 5.
+
+    Returns:
+        List[Tuple[np.ndarray, np.ndarray]]: For every region, as quantize_pixels, the mean color of its occupied
+            bins and their pixel counts
+    """
+    pixels = np.asarray(pixels, dtype=np.uint8).reshape(-1, 3)
+    q = (pixels >> (8 - bits)).astype(np.intp)
+    n_bins = 1 << (3 * bits)
+    bins = np.asarray(regions, dtype=np.intp) * n_bins + ((q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2])
+
+    # One histogram over (region, bin) pairs, occupied bins come out grouped by region
+    occupied, means, counts = bin_means(pixels, bins, n_regions * n_bins)
+    bounds = np.searchsorted(occupied, np.arange(n_regions + 1) * n_bins)
+    return [(means[start:end], counts[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+def palette_drift(
+        reference: Dict[Tuple[float, float, float], float],
+        candidate: Dict[Tuple[float, float, float], float]
+    ) -> float:
+    """Distance between two palettes as extracted by Clothing.extract_colors
+
+    Colors are paired by minimum total RGB distance and the distances are averaged, weighted by the share of
+    each reference color.
+
+    Args:
+        reference (Colors): Reference palette, e.g. from the full resolution image
+        candidate (Colors): Palette to compare against the reference
+
+    Returns:
+        float: Weighted mean RGB distance (0 to ~441) between paired colors
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    ref_colors = np.array(list(reference.keys()), dtype=np.float64)
+    ref_pcts = np.array(list(reference.values()), dtype=np.float64)
+    cand_colors = np.array(list(candidate.keys()), dtype=np.float64)
+
+    distances = np.linalg.norm(ref_colors[:, None, :] - cand_colors[None, :, :], axis=-1)
+    ref_idx, cand_idx = linear_sum_assignment(distances)
+    weights = ref_pcts[ref_idx]
+    return float((distances[ref_idx, cand_idx] * weights).sum() / weights.sum())
@@ -0,0 +1,107 @@
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from streamlit_camouflage.v1.fuzzy_classifier import (
+    GetColorDescIndexBatch,
+    GetMatchMaskBatch,
+    GetMatchesFromMask,
+    GetSignatureBatch,
+    signature_classes,
+)
+from streamlit_camouflage.v1.utils import rgb_to_hsv_batch
+
+RGB = Tuple[float, float, float]
+
+MAX_COMBINATIONS = 1_000_000
+
+
+def rank_combinations(
+        garment_slots: List[str],
+        garment_colors: List[List[RGB]],
+        limit: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+    """Find and rank every outfit made of one garment per slot that matches at least one outfit type
+
+    Garments are classified once, combinations are reduced to (tone, temp) count signatures and every
+    unique signature is matched once. Only arrays are returned, so the outfits can be ranked in a worker
+    process and turned into match names lazily, see find_combinations.
+
+    Args:
+        garment_slots (List[str]): Slot of each garment, e.g. top, bottom or shoes
+        garment_colors (List[List[RGB]]): RGB colors (0 to 255) of each garment
+        limit (int, optional): Maximum number of outfits to return. If None, all matching outfits are returned
+
+    Raises:
+        ValueError: If the number of combinations exceeds MAX_COMBINATIONS
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Array of shape (M, n_slots) of garment indices (one per slot, in order of
+            first appearance) and the match mask of every outfit, ranked by number of match types and then by
+            match type
+    """
+    n_garments = len(garment_slots)
+    if n_garments == 0:
+        return np.zeros((0, 0), dtype=np.int64), np.zeros(0, dtype=np.uint8)
+
+    # Classify the colors of every garment in a single pass
+    rgbs = [rgb for colors in garment_colors for rgb in colors]
+    garment_idx = np.repeat(np.arange(n_garments), [len(colors) for colors in garment_colors])
+    tone_idx, temp_idx = GetColorDescIndexBatch(rgb_to_hsv_batch(rgbs))
+    garment_signatures = GetSignatureBatch(tone_idx, temp_idx, outfit_idx=garment_idx, n_outfits=n_garments)
+
+    # Group garments by slot
+    slots = list(dict.fromkeys(garment_slots))
+    slot_garments = [np.array([i for i, s in enumerate(garment_slots) if s == slot]) for slot in slots]
+    shape = tuple(len(garments) for garments in slot_garments)
+    n_combinations = int(np.prod(shape))
+    if n_combinations > MAX_COMBINATIONS:
+        raise ValueError(f"{n_combinations} combinations exceeds the maximum of {MAX_COMBINATIONS}")
+
+    # Signature of every combination is the sum of its garments' signatures
+    signatures = np.zeros((1, len(signature_classes)), dtype=np.int32)
+    for garments in slot_garments:
+        signatures = (signatures[:, None, :] + garment_signatures[garments][None, :, :]).reshape(-1, len(signature_classes))
+
+    # Match each unique signature once
+    unique_signatures, inverse = np.unique(signatures, axis=0, return_inverse=True)
+    masks = GetMatchMaskBatch(unique_signatures)[inverse.ravel()]
+
+    matching = np.nonzero(masks)[0]
+    # Rank by number of match types, then by match type in match_names order
+    bits = np.unpackbits(masks[matching, None], axis=1, bitorder='little').astype(np.int8)
+    order = np.lexsort([-bits[:, i] for i in reversed(range(bits.shape[1]))] + [-bits.sum(axis=1)])
+    if limit is not None:
+        order = order[:limit]
+
+    combination_idx = np.unravel_index(matching[order], shape)
+    garments = np.stack([slot_garments[s][combination_idx[s]] for s in range(len(slots))], axis=1)
+    return garments.astype(np.int64), masks[matching[order]]
+
+
+def iter_combinations(garments: np.ndarray, masks: np.ndarray) -> Iterator[Tuple[List[int], List[str]]]:
+    """Garment indices and match type names of ranked outfits, see rank_combinations"""
+    for outfit, mask in zip(garments, masks):
+        yield outfit.tolist(), GetMatchesFromMask(mask)
+
+
+def find_combinations(
+        garment_slots: List[str],
+        garment_colors: List[List[RGB]],
+        limit: Optional[int] = None
+    ) -> Iterator[Tuple[List[int], List[str]]]:
+    """Find every outfit made of one garment per slot that matches at least one outfit type
+
+    Args:
+        garment_slots (List[str]): Slot of each garment, e.g. top, bottom or shoes
+        garment_colors (List[List[RGB]]): RGB colors (0 to 255) of each garment
+        limit (int, optional): Maximum number of outfits to return. If None, all matching outfits are returned
+
+    Raises:
+        ValueError: If the number of combinations exceeds MAX_COMBINATIONS
+
+    Yields:
+        Tuple[List[int], List[str]]: Garment indices (one per slot, in order of first appearance) and the names
+            of the outfit match types, ranked by number of match types and then by match type
+    """
+    yield from iter_combinations(*rank_combinations(garment_slots, garment_colors, limit))
@@ -0,0 +1,134 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import contextvars
+import functools
+import math
+import time
+from typing import Callable, Dict, Optional
+
+from streamlit_camouflage.v1.config import MAX_QUEUED_JOBS, MAX_QUEUED_MEGAPIXELS, WORKER_KIND, WORKERS
+from streamlit_camouflage.v1.metrics import record_timing
+
+
+class Overloaded(Exception):
+    """Raised when a job is not admitted to the worker pool"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Worker pool is overloaded, retry after {retry_after}s")
+        self.retry_after: int = retry_after
+
+
+class WorkerPool:
+    """Runs CPU-bound stages off the event loop
+
+    Jobs are admitted while the number of queued jobs and the megapixels they carry stay under their limits,
+    otherwise Overloaded is raised with an estimate of when to retry.
+
+    Thread workers run jobs in a copy of the caller's context, so their stage timings reach the request.
+    Process workers cannot report stages, the whole job is recorded as a single 'worker' stage.
+    """
+
+    def __init__(
+            self,
+            kind: str = 'thread',
+            max_workers: int = 1,
+            max_queued_jobs: int = 64,
+            max_queued_megapixels: float = 200.0
+        ):
+        """
+        Args:
+            kind (str, optional): 'thread' or 'process'. Defaults to 'thread'.
+            max_workers (int, optional): Number of workers. Defaults to 1.
+            max_queued_jobs (int, optional): Maximum number of queued or running jobs. Defaults to 64.
+            max_queued_megapixels (float, optional): Maximum megapixels of queued or running jobs. A job is always
+                admitted when the pool is idle. Defaults to 200.
+        """
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown worker kind '{kind}', expected 'thread' or 'process'")
+        self.kind: str = kind
+        self.max_workers: int = max_workers
+        self.max_queued_jobs: int = max_queued_jobs
+        self.max_queued_megapixels: float = max_queued_megapixels
+        self.queued_jobs: int = 0
+        self.queued_megapixels: float = 0.0
+        self.rejected: int = 0
+        self.seconds_per_megapixel: float = 1.0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="camouflage")
+        return self._executor
+
+    def retry_after(self) -> int:
+        """Estimated seconds until the queued work drains"""
+        return max(1, math.ceil(self.queued_megapixels * self.seconds_per_megapixel / self.max_workers))
+
+    def admit(self, megapixels: float):
+        """Check a job against the queue limits
+
+        Raises:
+            Overloaded: If the job would exceed the queue limits
+        """
+        idle = self.queued_jobs == 0
+        if not idle and (self.queued_jobs >= self.max_queued_jobs
+                         or self.queued_megapixels + megapixels > self.max_queued_megapixels):
+            self.rejected += 1
+            raise Overloaded(self.retry_after())
+
+    async def run(self, fn: Callable, *args, megapixels: float = 0.0, **kwargs):
+        """Run fn(*args, **kwargs) in the pool
+
+        Args:
+            fn (Callable): Function to run, must be picklable for process pools
+            megapixels (float, optional): Size of the image the job works on, used for admission. Defaults to 0.
+
+        Raises:
+            Overloaded: If the job is not admitted
+        """
+        self.admit(megapixels)
+        self.queued_jobs += 1
+        self.queued_megapixels += megapixels
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            if self.kind == 'process':
+                result = await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+                record_timing("worker", time.perf_counter() - start)
+            else:
+                context = contextvars.copy_context()
+                job = functools.partial(self._timed_job, start, fn, *args, **kwargs)
+                result = await loop.run_in_executor(self.executor, context.run, job)
+        finally:
+            self.queued_jobs -= 1
+            self.queued_megapixels -= megapixels
+
+        # Track the cost of a megapixel to estimate Retry-After
+        if megapixels > 0:
+            observed = (time.perf_counter() - start) / megapixels
+            self.seconds_per_megapixel = 0.8 * self.seconds_per_megapixel + 0.2 * observed
+        return result
+
+    @staticmethod
+    def _timed_job(submitted: float, fn: Callable, *args, **kwargs):
+        record_timing("queue", time.perf_counter() - submitted)
+        return fn(*args, **kwargs)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued_jobs": self.queued_jobs,
+            "queued_megapixels": self.queued_megapixels,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+WORKER_POOL = WorkerPool(WORKER_KIND, WORKERS, MAX_QUEUED_JOBS, MAX_QUEUED_MEGAPIXELS)
@@ -3,6 +3,8 @@ import os
 import pathlib
 from io import BytesIO
 
+from streamlit_camouflage.v1 import objects
+
 DIRECTORY_PATH = pathlib.Path(os.path.dirname(__file__))
 
 @pytest.fixture
@@ -19,6 +21,18 @@ def shirt_plaid_red_black_grey_no_background() -> BytesIO:
     result = BytesIO(read_file)
     return result
 
+@pytest.fixture
+def threshold_mask(monkeypatch):
+    """Replace background removal with a threshold, pixels whose gray level differs from the top-left corner's
+    are foreground"""
+    def predict_mask(image, lowres=False, size=None):
+        gray = image.convert("L")
+        background = gray.getpixel((0, 0))
+        return gray.point(lambda v: 255 if abs(v - background) > 16 else 0).resize(size or image.size)
+
+    monkeypatch.setattr(objects, "predict_mask", predict_mask)
+    return predict_mask
+
 @pytest.fixture
 def shirt_plaid_red_black_grey_colors():
     return {
@@ -0,0 +1,114 @@
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+import numpy as np
+import onnxruntime as ort
+from PIL import Image as PILImage
+import pytest
+
+from streamlit_camouflage.api import app
+from streamlit_camouflage.v1 import decoding, matching, models
+
+
+def test_health_and_ready(monkeypatch):
+    client = TestClient(app)
+
+    assert client.get("/v1/health").status_code == 200
+
+    monkeypatch.setattr(models, "_ready", False)
+    assert client.get("/v1/ready").status_code == 503
+
+    monkeypatch.setattr(models, "_ready", True)
+    response = client.get("/v1/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+
+
+def test_session_options(monkeypatch):
+    monkeypatch.setattr(models, "ORT_INTRA_OP_THREADS", 2)
+    monkeypatch.setattr(models, "ORT_INTER_OP_THREADS", 1)
+    monkeypatch.setattr(models, "ORT_GRAPH_OPTIMIZATION", "basic")
+
+    sess_opts = models.get_session_options()
+    assert sess_opts.intra_op_num_threads == 2
+    assert sess_opts.inter_op_num_threads == 1
+    assert sess_opts.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+
+    monkeypatch.setattr(models, "ORT_GRAPH_OPTIMIZATION", "fastest")
+    with pytest.raises(ValueError):
+        models.get_session_options()
+
+
+@pytest.mark.parametrize("output,accept,media_type", [
+    (None, None, "image/png"),
+    (None, "image/webp,image/png;q=0.9", "image/webp"),
+    (None, "text/html, multipart/mixed;q=0.5", "multipart/mixed; boundary=camouflage-alpha"),
+    ("mask", "image/webp", "image/png"),
+])
+def test_rembg_outputs(threshold_mask, output, accept, media_type):
+    client = TestClient(app)
+
+    array = np.zeros((40, 60, 3), dtype=np.uint8)
+    array[:, 30:] = 200
+    buffer = BytesIO()
+    PILImage.fromarray(array).save(buffer, format="PNG")
+
+    params = {"output": output} if output else {}
+    headers = {"Accept": accept} if accept else {}
+    response = client.post("/v1/rembg", params=params, headers=headers, files={"file": buffer.getvalue()})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == media_type
+    assert int(response.headers["content-length"]) == len(response.content)
+
+    if media_type.startswith("multipart"):
+        jpeg_part, png_part = response.content.split(b"--camouflage-alpha")[1:3]
+        image = PILImage.open(BytesIO(jpeg_part.split(b"\r\n\r\n", 1)[1]))
+        mask = PILImage.open(BytesIO(png_part.split(b"\r\n\r\n", 1)[1]))
+        assert (image.format, image.mode, mask.mode) == ("JPEG", "RGB", "L")
+        return
+
+    image = PILImage.open(BytesIO(response.content))
+    assert image.size == (60, 40)
+    if output == "mask":
+        assert image.mode == "L"
+        assert np.asarray(image)[:, :30].max() == 0
+    else:
+        assert image.mode == "RGBA"
+        alpha = np.asarray(image)[..., 3]
+        assert alpha[:, :30].max() == 0 and alpha[:, 30:].min() == 255
+
+
+def test_upload_decoding(monkeypatch):
+    client = TestClient(app)
+    buffer = BytesIO()
+    array = np.random.default_rng(0).integers(0, 256, (300, 400, 3), dtype=np.uint8)
+    PILImage.fromarray(array).save(buffer, format="JPEG")
+
+    response = client.post("/v1/colors", params={"mode": "histogram", "max_side": 100}, files={"file": buffer.getvalue()})
+    assert response.status_code == 200
+    assert response.json()["image"] == {"width": 400, "height": 300, "decoded_width": 100, "decoded_height": 75}
+
+    monkeypatch.setattr(decoding, "MAX_IMAGE_PIXELS", 10_000)
+    response = client.post("/v1/colors", params={"mode": "histogram"}, files={"file": buffer.getvalue()})
+    assert response.status_code == 413
+
+
+def test_colors_fewer_bins_than_colors():
+    client = TestClient(app)
+    buffer = BytesIO()
+    PILImage.new("RGB", (40, 30), (10, 120, 200)).save(buffer, format="PNG")
+
+    for params in ({"mode": "histogram", "n": 4}, {"mode": "histogram", "quantize_bits": 1, "n": 16}):
+        response = client.post("/v1/colors", params=params, files={"file": buffer.getvalue()})
+        assert response.status_code == 200
+        colors = response.json()["colors"]
+        assert len(colors) == 1 and colors[0]["hex"] == "#0a78c8" and colors[0]["pct"] == 1
+
+
+def test_embedded_matching_agrees_with_api():
+    client = TestClient(app)
+    rng = np.random.default_rng(2)
+    for outfit in rng.integers(0, 256, (20, 3, 3)):
+        colors = [{"r": float(r), "g": float(g), "b": float(b), "hex": "", "pct": 0.0, "name": ""} for r, g, b in outfit]
+        response = client.post("/v1/matches", json={"colors": colors})
+        assert response.json()["matches"] == matching.get_matches(outfit)
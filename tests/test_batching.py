@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image as PILImage
+
+from streamlit_camouflage.v1 import objects
+from streamlit_camouflage.v1.batching import MaskBatcher, predict_masks
+
+
+class FakeInput:
+    name = "input.1"
+
+    def __init__(self, batch_dim):
+        self.shape = [batch_dim, 3, 320, 320]
+
+
+class FakeInnerSession:
+    """Predicts the first channel of the input as the mask and records batch sizes"""
+
+    def __init__(self, batch_dim):
+        self.batch_dim = batch_dim
+        self.batch_sizes = []
+
+    def get_inputs(self):
+        return [FakeInput(self.batch_dim)]
+
+    def run(self, output_names, inputs):
+        batch = inputs["input.1"]
+        self.batch_sizes.append(len(batch))
+        return [batch[:, :1, :, :]]
+
+
+class FakeSession:
+    def __init__(self, batch_dim="batch"):
+        self.inner_session = FakeInnerSession(batch_dim)
+        self.input_sizes = []
+
+    def normalize(self, img, mean, std, size):
+        self.input_sizes.append(img.size)
+        array = np.asarray(img.convert("RGB").resize(size), dtype=np.float32) / 255.0
+        return {"input.1": array.transpose((2, 0, 1))[None]}
+
+
+def make_image(value):
+    array = np.zeros((40, 60, 3), dtype=np.uint8)
+    array[:, 30:] = value
+    return PILImage.fromarray(array)
+
+
+def test_flat_predictions():
+    session = FakeSession()
+    blank, white = PILImage.new("RGB", (60, 40)), PILImage.new("RGB", (60, 40), (255, 255, 255))
+    masks = predict_masks(session, [blank, white])
+
+    assert [np.asarray(mask).tolist() for mask in masks] == [[[0] * 60] * 40, [[255] * 60] * 40]
+
+
+def test_batched_predictions():
+    session = FakeSession()
+    batcher = MaskBatcher(lambda: session, max_batch_size=4, max_wait_ms=50)
+
+    images = [make_image(30 * (i + 1)) for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        masks = list(executor.map(batcher.predict, images))
+
+    # Concurrent requests share inferences
+    assert sum(session.inner_session.batch_sizes) == 8
+    assert len(session.inner_session.batch_sizes) < 8
+    assert max(session.inner_session.batch_sizes) <= 4
+
+    # Every caller gets the mask of its own image
+    for image, mask in zip(images, masks):
+        assert mask.size == image.size
+        mask = np.asarray(mask)
+        assert mask[:, :25].max() < 32
+        assert mask[:, 35:].min() > 224
+
+
+def test_fixed_batch_size():
+    session = FakeSession(batch_dim=1)
+    batcher = MaskBatcher(lambda: session, max_batch_size=4, max_wait_ms=50)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        masks = list(executor.map(batcher.predict, [make_image(100) for _ in range(4)]))
+
+    assert session.inner_session.batch_sizes == [1, 1, 1, 1]
+    assert all(mask.size == (60, 40) for mask in masks)
+
+
+def test_lowres_mask(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(objects, "MASK_BATCHER", MaskBatcher(lambda: session, max_batch_size=1))
+
+    array = np.zeros((1200, 1600, 3), dtype=np.uint8)
+    array[:, 800:] = 200
+    image = PILImage.fromarray(array)
+
+    # The model sees a downsampled image and only the mask is upsampled
+    mask = objects.predict_mask(image, lowres=True)
+    assert session.input_sizes == [(objects.LOWRES_INPUT_SIDE, 480)]
+    assert mask.size == image.size
+    mask = np.asarray(mask)
+    assert mask[:, :750].max() < 32
+    assert mask[:, 850:].min() > 224
+
+    # Output resolution of the background removal
+    image_rembg = objects.remove_image_background(image, lowres=True, max_side=400)
+    assert image_rembg.size == (400, 300)
+    assert image_rembg.mode == 'RGBA'
+
+    # Colors come straight from the pixels selected by the mask
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    clothing = objects.Clothing(buffer, mode='histogram')
+    clothing.rembg(lowres=True)
+    clothing.extract_colors(n=2)
+    assert [round(c) for c in clothing.get_colors()[0]] == [200, 200, 200]
+    assert list(clothing.colors.values())[0] > 0.9
+    assert clothing.image_rembg.mode == 'RGBA'
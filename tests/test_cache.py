@@ -0,0 +1,91 @@
+import asyncio
+
+from streamlit_camouflage.v1.cache import ResultCache
+
+
+def test_memory_tier():
+    cache = ResultCache(max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+
+    # Adding a third entry evicts the least recently used one
+    cache.put("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.size == 10
+
+    # Entries larger than the budget are not kept in memory
+    cache.put("d", b"x" * 11)
+    assert cache.get("d") is None
+    assert cache.stats()["hits"] == 2
+
+
+def test_disk_tier(tmp_path):
+    cache = ResultCache(max_bytes=10, directory=str(tmp_path))
+    cache.put("a" * 64, b"12345")
+
+    cache = ResultCache(max_bytes=10, directory=str(tmp_path))
+    assert cache.get("a" * 64) == b"12345"
+    assert cache.get("a" * 64) == b"12345"
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_disk_budget(tmp_path):
+    keys = [c * 64 for c in "abcd"]
+    cache = ResultCache(max_bytes=0, directory=str(tmp_path), max_disk_bytes=10)
+    cache.put(keys[0], b"12345")
+    cache.put(keys[1], b"12345")
+
+    # A disk hit makes an entry the most recently used, so the third entry evicts the other one
+    assert cache.get(keys[0]) == b"12345"
+    cache.put(keys[2], b"12345")
+    assert cache.get(keys[1]) is None
+    assert not (tmp_path / "bb" / keys[1]).exists()
+    assert cache.stats()["disk_bytes"] == 10 and cache.stats()["disk_entries"] == 2
+
+    # Entries larger than the budget are not written
+    cache.put(keys[3], b"x" * 11)
+    assert cache.get(keys[3]) is None
+
+    # The disk index is rebuilt from the directory
+    cache = ResultCache(max_bytes=0, directory=str(tmp_path), max_disk_bytes=10)
+    assert cache.stats()["disk_bytes"] == 10
+    assert {cache.get(key) for key in keys[:3]} == {b"12345", None}
+
+
+def test_keys():
+    assert ResultCache.make_key("colors", b"image", mode="fast") == ResultCache.make_key("colors", b"image", mode="fast")
+    assert ResultCache.make_key("colors", b"image", mode="fast") != ResultCache.make_key("colors", b"image", mode="full")
+    assert ResultCache.make_key("colors", b"image") != ResultCache.make_key("rembg", b"image")
+
+
+def test_single_flight():
+    cache = ResultCache(max_bytes=100)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"result"
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_compute("key", compute) for _ in range(5)])
+
+    assert asyncio.run(run()) == [b"result"] * 5
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 4
+
+    # Failures are shared with waiters and not cached
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("failed")
+
+    async def run_failing():
+        return await asyncio.gather(*[cache.get_or_compute("other", fail) for _ in range(2)], return_exceptions=True)
+
+    results = asyncio.run(run_failing())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache.get("other") is None
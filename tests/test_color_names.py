@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from streamlit_camouflage.v1.color_names import (
+    PALETTES,
+    get_color_indices,
+    get_color_names,
+    get_palette_colors,
+    get_table,
+    rgb_to_lab,
+    to_color_space,
+)
+
+
+def test_rgb_to_lab():
+    lab = rgb_to_lab([(0, 0, 0), (255, 255, 255), (255, 0, 0)])
+    assert np.allclose(lab[0], (0, 0, 0), atol=1e-6)
+    assert np.allclose(lab[1], (100, 0, 0), atol=1e-2)
+    assert np.allclose(lab[2], (53.24, 80.09, 67.20), atol=1e-2)
+
+
+@pytest.mark.parametrize("palette", list(PALETTES))
+def test_color_names_match_nearest_neighbour(palette):
+    rgbs = np.random.default_rng(0).uniform(0, 255, (2000, 3))
+
+    colors = get_palette_colors(palette)
+    space = PALETTES[palette]
+    distances = ((to_color_space(rgbs, space)[:, None] - to_color_space(list(colors.values()), space)[None]) ** 2)
+    expected = np.array(list(colors))[distances.sum(axis=-1).argmin(axis=1)].tolist()
+    assert get_color_names(rgbs, palette) == expected
+
+    # Without the exact pass, colors take the name of their cell center, which is nearly always the same
+    agreement = np.mean(np.array(get_color_names(rgbs, palette, exact=False)) == np.array(expected))
+    assert agreement > 0.8
+
+
+def test_color_names(shirt_plaid_red_black_grey_colors, shirt_plaid_red_black_grey_color_names):
+    colors = list(shirt_plaid_red_black_grey_colors)
+    assert get_color_names(colors) == shirt_plaid_red_black_grey_color_names
+    assert get_color_names([]) == []
+    assert get_color_indices([(300, -5, 0)]).shape == (1,)
+    assert len(get_table('xkcd')['names']) > len(get_table('css3')['names'])
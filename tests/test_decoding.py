@@ -0,0 +1,58 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image as PILImage
+import pytest
+
+from streamlit_camouflage.v1.decoding import ImageTooLarge, decode_image, probe_image
+
+
+def encode(array: np.ndarray, format: str, orientation: int = None) -> BytesIO:
+    image = PILImage.fromarray(array)
+    exif = image.getexif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, format=format, exif=exif)
+    buffer.seek(0)
+    return buffer
+
+
+def test_jpeg_draft_decoding():
+    array = np.zeros((3000, 4000, 3), dtype=np.uint8)
+    array[:, 2000:] = 200
+
+    # Decoded at 1/4 scale by the JPEG decoder, then downsampled to the working size
+    image, original_size = decode_image(encode(array, 'JPEG'), max_side=700)
+    assert original_size == (4000, 3000)
+    assert image.size == (700, 525)
+    assert probe_image(encode(array, 'JPEG'), max_side=700) == ((4000, 3000), (700, 525))
+    assert abs(int(np.asarray(image)[:, 600].mean()) - 200) <= 2
+
+    # Other formats are decoded in full and downsampled
+    image, _ = decode_image(encode(array[:300, :400], 'PNG'), max_side=100)
+    assert image.size == (100, 75)
+
+    # Without a working size the image is decoded in full
+    image, _ = decode_image(encode(array, 'JPEG'))
+    assert image.size == (4000, 3000)
+
+
+def test_exif_orientation():
+    array = np.zeros((30, 40, 3), dtype=np.uint8)
+    array[:, :10] = 255
+
+    # Orientation 6 is rotated 90 degrees clockwise for display
+    image, original_size = decode_image(encode(array, 'PNG', orientation=6))
+    assert original_size == image.size == (30, 40)
+    assert np.asarray(image)[:10].min() == 255
+    assert probe_image(encode(array, 'PNG', orientation=6), max_side=20) == ((30, 40), (15, 20))
+
+
+def test_decompression_bomb():
+    buffer = encode(np.zeros((100, 100, 3), dtype=np.uint8), 'PNG')
+    with pytest.raises(ImageTooLarge):
+        probe_image(buffer, max_pixels=9_999)
+    buffer.seek(0)
+    with pytest.raises(ImageTooLarge):
+        decode_image(buffer, max_pixels=9_999)
@@ -0,0 +1,80 @@
+from colorsys import rgb_to_hsv
+from itertools import product
+
+import numpy as np
+
+from streamlit_camouflage.v1.fuzzy_classifier import (
+    GetColorDesc,
+    GetColorDescBatch,
+    GetColorDescFuzzy,
+    GetColorDescIndexBatch,
+    GetColorDescTable,
+    GetMatchesFromMask,
+    GetMatchMaskBatch,
+    GetSignature,
+    GetSignatureBatch,
+    GetValidMatches,
+    MATCH_RULES,
+    VerifyColorDescTable,
+)
+from streamlit_camouflage.v1.utils import rgb_to_hsv_batch
+
+
+def test_color_desc_table():
+    # The shipped lookup tables must agree with the skfuzzy simulation
+    assert VerifyColorDescTable(step=5) == []
+
+    # Single colors match the skfuzzy path off the integer grid
+    rng = np.random.default_rng(2)
+    hsvs = [(0.0, 0.0, 0.0), (12.4, 61.2, 48.6), (210.0, 49.6, 62.15), (359.7, 100.0, 100.0)]
+    for hsv in hsvs + [tuple(hsv) for hsv in rng.random((30, 3)) * [360, 100, 100]]:
+        assert GetColorDesc(hsv) == GetColorDescFuzzy(hsv)
+
+
+def test_color_desc_batch():
+    # The vectorized engine must agree with the lookup tables on the whole integer grid
+    tone_table, temp_table = GetColorDescTable()
+    sat, val = np.meshgrid(np.arange(101), np.arange(101), indexing='ij')
+    hsvs = np.stack([np.zeros(sat.size), sat.ravel(), val.ravel()], axis=1)
+    tone_idx, _ = GetColorDescIndexBatch(hsvs)
+    assert np.array_equal(tone_idx, np.asarray(tone_table).ravel())
+
+    hsvs = np.stack([np.arange(361), np.zeros(361), np.zeros(361)], axis=1)
+    _, temp_idx = GetColorDescIndexBatch(hsvs)
+    assert np.array_equal(temp_idx, np.asarray(temp_table))
+
+    # And with the skfuzzy path off the grid
+    rng = np.random.default_rng(1)
+    hsvs = rng.random((50, 3)) * [360, 100, 100]
+    assert GetColorDescBatch(hsvs) == [GetColorDescFuzzy(hsv) for hsv in hsvs]
+    assert GetColorDescBatch(np.empty((0, 3))) == []
+
+
+def test_rgb_to_hsv_batch():
+    rgbs = [(0, 0, 0), (255, 255, 255), (124.03, 32.38, 46.37), (31.99, 15.66, 24.17), (0, 0, 255)]
+    expected = [
+        tuple(c * scale for c, scale in zip(rgb_to_hsv(*[v / 255.0 for v in rgb]), (360.0, 100.0, 100.0)))
+        for rgb in rgbs
+    ]
+    assert np.allclose(rgb_to_hsv_batch(rgbs), expected)
+
+
+def test_signature_matching():
+    classes = [(tone, temp) for tone in ['NEUTRAL', 'DARK', 'BRIGHT'] for temp in ['WARM', 'COOL']]
+    outfits = [list(outfit) for n in range(5) for outfit in product(classes, repeat=n)]
+
+    signatures = np.array([GetSignature(outfit) for outfit in outfits])
+    masks = GetMatchMaskBatch(signatures)
+    for outfit, mask in zip(outfits, masks):
+        expected = [key for key, rule in MATCH_RULES.items() if rule(outfit)]
+        assert GetValidMatches(outfit) == expected
+        assert GetMatchesFromMask(mask) == expected
+
+    # Signatures built from classified colors match the per-outfit counts
+    tone_idx = np.array([0, 2, 1, 2])
+    temp_idx = np.array([1, 0, 0, 0])
+    signatures = GetSignatureBatch(tone_idx, temp_idx, outfit_idx=np.array([0, 0, 1, 1]))
+    assert signatures.tolist() == [
+        list(GetSignature([('NEUTRAL', 'COOL'), ('BRIGHT', 'WARM')])),
+        list(GetSignature([('DARK', 'WARM'), ('BRIGHT', 'WARM')])),
+    ]
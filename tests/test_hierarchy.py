@@ -0,0 +1,108 @@
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+import numpy as np
+from PIL import Image as PILImage
+import pytest
+
+from streamlit_camouflage.api import app
+from streamlit_camouflage.v1 import advanced_objects
+from streamlit_camouflage.v1.hierarchy import ColorHierarchy, ward_cost
+
+
+def naive_ward(centroids, weights, n):
+    """Merge the cheapest pair, recomputing every cost, until n clusters are left"""
+    clusters = [(np.array(c, dtype=float), float(w)) for c, w in zip(centroids, weights)]
+    while len(clusters) > n:
+        cost = ward_cost(np.array([c for c, _ in clusters]), np.array([w for _, w in clusters]))
+        i, j = sorted(np.unravel_index(np.argmin(cost), cost.shape))
+        (ci, wi), (cj, wj) = clusters[i], clusters[j]
+        clusters[i] = ((ci * wi + cj * wj) / (wi + wj), wi + wj)
+        del clusters[j]
+    return clusters
+
+
+def test_merges_match_naive_ward():
+    rng = np.random.default_rng(0)
+    centroids = rng.random((10, 3)) * 255
+    weights = rng.integers(1, 1000, 10)
+    hierarchy = ColorHierarchy(centroids, weights)
+
+    for n in range(1, 11):
+        palette = hierarchy.palette(n)
+        expected = naive_ward(centroids, weights, n)
+        assert len(palette) == n
+        assert sorted(np.round(list(palette), 6).tolist()) == sorted(np.round([c for c, _ in expected], 6).tolist())
+        assert np.isclose(sum(palette.values()), 1)
+        # Palettes are in order of frequency
+        assert list(palette.values()) == sorted(palette.values(), reverse=True)
+
+    # A single cluster is the weighted mean of every centroid
+    (color, share), = hierarchy.palette(1).items()
+    assert np.allclose(color, np.average(centroids, axis=0, weights=weights)) and share == 1
+
+    with pytest.raises(ValueError):
+        hierarchy.palette(11)
+
+
+def test_duplicate_and_empty_clusters():
+    # KMeans fitted with more clusters than distinct colors repeats centroids and leaves clusters empty
+    hierarchy = ColorHierarchy([(200, 200, 200)] * 6 + [(10, 10, 10)] * 2, [2500, 0, 0, 0, 0, 0, 500, 0])
+    assert hierarchy.max_k == 2 and hierarchy.n_clusters == 8
+    assert hierarchy.palette(2) == {(200.0, 200.0, 200.0): 2500 / 3000, (10.0, 10.0, 10.0): 500 / 3000}
+    assert hierarchy.palettes(1, 8)[8] == hierarchy.palette(2)
+    (color, share), = hierarchy.palette(1).items()
+    assert np.allclose(color, (200 * 2500 + 10 * 500) / 3000) and share == 1
+
+    with pytest.raises(ValueError):
+        ColorHierarchy([(0, 0, 0)] * 2, [0, 0])
+
+
+def test_colors_palette_range():
+    client = TestClient(app)
+    array = np.zeros((60, 80, 3), dtype=np.uint8)
+    array[:, :20] = (220, 20, 20)
+    array[:, 20:40] = (20, 220, 20)
+    array[:, 40:60] = (20, 20, 220)
+    array[:, 60:] = (230, 230, 30)
+    buffer = BytesIO()
+    PILImage.fromarray(array).save(buffer, format="PNG")
+
+    response = client.post("/v1/colors", params={"n": 2, "max_n": 4}, files={"file": buffer.getvalue()})
+    assert response.status_code == 200
+    body = response.json()
+    assert [palette["n"] for palette in body["palettes"]] == [2, 3, 4]
+    assert [len(palette["colors"]) for palette in body["palettes"]] == [2, 3, 4]
+    assert body["colors"] == body["palettes"][0]["colors"]
+    assert {color["hex"] for color in body["palettes"][2]["colors"]} == {"#dc1414", "#14dc14", "#1414dc", "#e6e61e"}
+
+    response = client.post("/v1/colors", params={"n": 4, "max_n": 2}, files={"file": buffer.getvalue()})
+    assert response.status_code == 422
+
+
+def two_tone_png():
+    array = np.zeros((40, 60, 3), dtype=np.uint8)
+    array[:, :20] = (220, 20, 20)
+    array[:, 20:] = (20, 20, 220)
+    buffer = BytesIO()
+    PILImage.fromarray(array).save(buffer, format="PNG")
+    return buffer
+
+
+def test_palettes_of_few_colors():
+    client = TestClient(app)
+    for params in ({"n": 2, "max_n": 8}, {"n": 2, "max_n": 8, "mode": "histogram"}):
+        response = client.post("/v1/colors", params=params, files={"file": two_tone_png().getvalue()})
+        assert response.status_code == 200
+        body = response.json()
+        assert [palette["n"] for palette in body["palettes"]] == list(range(2, 9))
+        for palette in body["palettes"]:
+            colors = {(round(c["r"]), round(c["g"]), round(c["b"]), round(c["pct"], 6)) for c in palette["colors"]}
+            assert colors == {(20, 20, 220, 0.666667), (220, 20, 20, 0.333333)}
+
+    # Fewer distinct colors than the noise colors left out
+    clothing = advanced_objects.Clothing(two_tone_png())
+    clothing.image_rembg = clothing.image.convert("RGBA")
+    clothing.set_n_colors(4)
+    clothing.extract_colors()
+    assert sorted(clothing.colors.values()) == pytest.approx([1 / 3, 2 / 3])
@@ -0,0 +1,88 @@
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+import numpy as np
+from PIL import Image as PILImage
+import pytest
+
+from streamlit_camouflage.api import app
+from streamlit_camouflage.v1.metrics import Counter, Histogram, Metric, REGISTRY, server_timing, timed, TIMINGS
+
+
+def parse_server_timing(header):
+    return {stage.split(";")[0]: float(stage.split("dur=")[1]) for stage in header.split(", ")}
+
+
+def test_histogram_rendering():
+    histogram = Histogram("test_duration_seconds", "Test durations", ("route",), buckets=(0.1, 1.0))
+    counter = Counter("test_total", "Test count", ("route",))
+    try:
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, route="/a")
+        counter.inc(route='/"b"')
+
+        lines = histogram.render().splitlines()
+        assert lines[:2] == ["# HELP test_duration_seconds Test durations", "# TYPE test_duration_seconds histogram"]
+        assert 'test_duration_seconds_bucket{route="/a",le="0.1"} 1' in lines
+        assert 'test_duration_seconds_bucket{route="/a",le="1"} 2' in lines
+        assert 'test_duration_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+        assert 'test_duration_seconds_sum{route="/a"} 5.55' in lines
+        assert 'test_duration_seconds_count{route="/a"} 3' in lines
+        assert 'test_total{route="/\\"b\\""} 1' in counter.render().splitlines()
+    finally:
+        REGISTRY.remove(histogram)
+        REGISTRY.remove(counter)
+
+
+def test_metrics_need_samples():
+    class Incomplete(Metric):
+        kind = "gauge"
+
+    # A metric without samples fails when it is created, not when /metrics is scraped
+    registered = len(REGISTRY)
+    with pytest.raises(TypeError):
+        Incomplete("test_incomplete", "Incomplete metric")
+    assert len(REGISTRY) == registered
+
+
+def test_timed_stages():
+    timings = []
+    token = TIMINGS.set(timings)
+    try:
+        with timed("decode"):
+            pass
+        with timed("naming"):
+            pass
+        with timed("decode"):
+            pass
+    finally:
+        TIMINGS.reset(token)
+
+    assert [stage for stage, _ in timings] == ["decode", "naming", "decode"]
+    assert list(parse_server_timing(server_timing(timings))) == ["decode", "naming"]
+
+
+def test_server_timing_and_metrics():
+    client = TestClient(app)
+    buffer = BytesIO()
+    array = np.random.default_rng(0).integers(0, 256, (300, 400, 3), dtype=np.uint8)
+    PILImage.fromarray(array).save(buffer, format="JPEG")
+
+    response = client.post("/v1/colors", params={"mode": "histogram"}, files={"file": buffer.getvalue()})
+    assert response.status_code == 200
+    timings = parse_server_timing(response.headers["Server-Timing"])
+    assert {"queue", "decode", "pixels", "cluster", "naming", "total"} <= set(timings)
+    assert timings["total"] >= timings["cluster"]
+
+    response = client.post("/v1/matches", json=response.json())
+    assert {"color_desc", "matches", "total"} <= set(parse_server_timing(response.headers["Server-Timing"]))
+
+    response = client.get("/v1/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    metrics = response.text
+    assert 'camouflage_request_duration_seconds_count{method="POST",route="/v1/colors",status="200"}' in metrics
+    assert 'camouflage_requests_in_flight{route="/v1/colors"} 0' in metrics
+    assert 'camouflage_stage_duration_seconds_bucket{stage="cluster",le="+Inf"}' in metrics
+    assert 'camouflage_image_megapixels_sum{route="/v1/colors"}' in metrics
+    assert "# TYPE camouflage_model_inferences_total counter" in metrics
@@ -1,4 +1,6 @@
+import numpy as np
 from streamlit_camouflage.v1.objects import Image, Clothing
+from streamlit_camouflage.v1.utils import palette_drift
 from PIL import Image as PILImage
 from io import BytesIO
 import pathlib
@@ -18,7 +20,12 @@ def test_image(shirt_plaid_red_black_grey, shirt_plaid_red_black_grey_no_backgro
     im_rembg = im.rembg()
 
     assert type(im_rembg) == bytes
-    assert im_rembg == shirt_plaid_red_black_grey_no_background.read()
+
+    # The alpha channel is kept, flattening it gives the background-free image
+    image_rembg = PILImage.open(BytesIO(im_rembg))
+    assert image_rembg.mode == 'RGBA'
+    expected = PILImage.open(shirt_plaid_red_black_grey_no_background)
+    assert np.array_equal(np.array(image_rembg.convert('RGB')), np.array(expected))
 
 def test_clothing(
         shirt_plaid_red_black_grey_no_background, 
@@ -53,4 +60,24 @@ def test_clothing(
     # Get the names of the colors
     fetched_color_names = clothing.get_color_names()
     expected_color_names = shirt_plaid_red_black_grey_color_names
-    assert fetched_color_names == expected_color_names
\ No newline at end of file
+    assert fetched_color_names == expected_color_names
+
+def test_clothing_fast(shirt_plaid_red_black_grey_no_background, shirt_plaid_red_black_grey_colors):
+    # Extract colors from a subsample of the pixels
+    clothing = Clothing(image_bytes=shirt_plaid_red_black_grey_no_background, mode='fast', max_pixels=20_000)
+    clothing.extract_colors(n=4)
+
+    assert len(clothing.colors) == 4
+    assert abs(sum(clothing.colors.values()) - 1.0) < 1e-9
+
+    # The palette stays close to the full resolution result
+    assert palette_drift(shirt_plaid_red_black_grey_colors, clothing.colors) < 5.0
+
+def test_clothing_histogram(shirt_plaid_red_black_grey_no_background, shirt_plaid_red_black_grey_colors):
+    # Extract colors from a quantized histogram of the pixels
+    clothing = Clothing(image_bytes=shirt_plaid_red_black_grey_no_background, mode='histogram', quantize_bits=5)
+    clothing.extract_colors(n=4)
+
+    assert len(clothing.colors) == 4
+    assert abs(sum(clothing.colors.values()) - 1.0) < 1e-9
+    assert palette_drift(shirt_plaid_red_black_grey_colors, clothing.colors) < 5.0
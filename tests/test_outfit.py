@@ -0,0 +1,94 @@
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+import numpy as np
+from PIL import Image as PILImage
+
+from streamlit_camouflage.api import app
+from streamlit_camouflage.v1 import matching
+from streamlit_camouflage.v1.segmentation import region_boxes, segment_garments
+from streamlit_camouflage.v1.utils import quantize_pixels, quantize_region_pixels
+
+
+def make_figure():
+    """White background with a skin-colored head, a red top, blue trousers, black shoes and a speck of noise"""
+    image = np.full((200, 100, 3), 255, dtype=np.uint8)
+    image[0:30, 40:60] = (224, 172, 105)
+    image[30:95, 25:75] = (200, 30, 30)
+    image[95:185, 30:70] = (30, 40, 160)
+    image[185:200, 28:72] = (10, 10, 10)
+    image[5:7, 5:7] = (0, 200, 0)
+    return image
+
+
+def test_segment_garments():
+    image = make_figure()
+    mask = np.where((image < 240).any(axis=-1), 255, 0).astype(np.uint8)
+    labels, names = segment_garments(image, mask)
+
+    assert names == ["top", "bottom", "shoes"]
+    # The noise component and the head are left out
+    assert labels[5, 5] == 0 and labels[10, 50] == 0
+    # The cut between the top and the bottom follows the color change
+    assert (labels[40:95, 25:75] == 1).all() and (labels[95:180, 30:70] == 2).all()
+    assert region_boxes(labels, len(names))[1] == (30, 95, 70, 185)
+
+    # No foreground, no regions
+    labels, names = segment_garments(image, np.zeros_like(mask))
+    assert names == [] and not labels.any()
+
+
+def test_outfit_analyze(threshold_mask):
+    client = TestClient(app)
+    buffer = BytesIO()
+    PILImage.fromarray(make_figure()).save(buffer, format="PNG")
+
+    response = client.post("/v1/outfit/analyze", params={"n": 2}, files={"file": buffer.getvalue()})
+    assert response.status_code == 200
+    body = response.json()
+    assert [region["name"] for region in body["regions"]] == ["top", "bottom", "shoes"]
+    top, bottom, shoes = body["regions"]
+    assert top["colors"][0]["hex"] == "#c81e1e"
+    assert bottom["colors"][0]["hex"] == "#1e28a0"
+    assert len(shoes["colors"]) == 1 and shoes["colors"][0]["hex"] == "#0a0a0a"
+    assert np.isclose(sum(region["pct"] for region in body["regions"]), 1, atol=0.1)
+    assert isinstance(body["matches"], list)
+    assert body["image"]["width"] == 100
+
+
+def test_outfit_matches_use_dominant_colors(threshold_mask):
+    client = TestClient(app)
+
+    def analyze(image, n):
+        buffer = BytesIO()
+        PILImage.fromarray(image).save(buffer, format="PNG")
+        response = client.post("/v1/outfit/analyze", params={"n": n}, files={"file": buffer.getvalue()})
+        assert response.status_code == 200
+        return response.json()
+
+    # Shaded stripes on the top add colors to its palette but leave its dominant color
+    plain = make_figure()
+    striped = plain.copy()
+    striped[40:95:4, 25:75] = (120, 15, 15)
+    striped[42:95:4, 25:75] = (235, 90, 90)
+
+    expected = matching.get_matches([(200, 30, 30), (30, 40, 160), (10, 10, 10)])
+    assert analyze(plain, 2)["matches"] == expected
+    for n in (2, 3, 4):
+        body = analyze(striped, n)
+        assert len(body["regions"][0]["colors"]) == n
+        assert body["matches"] == expected
+
+
+def test_quantize_region_pixels():
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (2000, 3), dtype=np.uint8)
+    regions = rng.integers(0, 3, 2000)
+
+    # Same histograms as quantizing every region on its own, also when they are too large to count densely
+    for bits in (5, 8):
+        histograms = quantize_region_pixels(pixels, regions, 4, bits)
+        assert len(histograms) == 4 and len(histograms[3][0]) == 0
+        for region, (means, counts) in enumerate(histograms[:3]):
+            expected_means, expected_counts = quantize_pixels(pixels[regions == region], bits)
+            assert np.allclose(means, expected_means) and counts.tolist() == expected_counts.tolist()
@@ -0,0 +1,113 @@
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+import numpy as np
+from PIL import Image as PILImage
+
+from streamlit_camouflage.api import app
+from streamlit_camouflage.v1.sampling import RegionSampler, SamplerCache
+
+
+def brute_force_mean(image, weights, x, y, radius):
+    window = (slice(max(y - radius, 0), y + radius + 1), slice(max(x - radius, 0), x + radius + 1))
+    pixels = image[window].reshape(-1, 3)[weights[window].ravel() > 0]
+    return pixels.mean(axis=0), len(pixels) / weights[window].size
+
+
+def test_mean_matches_brute_force():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    mask = np.zeros((15, 20), dtype=np.uint8)
+    mask[:, 8:] = 255
+
+    # The low resolution mask is scaled to the image
+    sampler = RegionSampler(image, mask)
+    assert sampler.weights.shape == (60, 80)
+    assert sampler.weights[:, :32].sum() == 0 and sampler.weights[:, 32:].all()
+
+    points = [(40, 30), (33, 0), (79, 59), (50.7, 10.2)]
+    means, shares = sampler.mean(points, radius=4)
+    for (x, y), mean, share in zip(points, means, shares):
+        expected_mean, expected_share = brute_force_mean(image, sampler.weights, int(x), int(y), 4)
+        assert np.allclose(mean, expected_mean)
+        assert np.isclose(share, expected_share)
+
+    # Windows without foreground take their center pixel
+    means, shares = sampler.mean([(5, 5)], radius=2)
+    assert np.array_equal(means[0], image[5, 5]) and shares[0] == 0
+
+
+def test_dominant_color():
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    image[:, :70] = (200, 10, 10)
+    image[:, 70:] = (10, 10, 200)
+    sampler = RegionSampler(image, histogram_side=50)
+
+    colors, shares = sampler.dominant([(60, 50), (95, 50)], radius=30)
+    assert np.allclose(colors[0], (200, 10, 10))
+    assert np.allclose(colors[1], (10, 10, 200))
+    assert 0.5 < shares[0] <= 1
+
+
+def test_sampler_cache(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("streamlit_camouflage.v1.sampling.time.monotonic", lambda: clock[0])
+    cache = SamplerCache(max_entries=2, ttl=60)
+    samplers = [RegionSampler(np.zeros((4, 4, 3), dtype=np.uint8)) for _ in range(3)]
+    for i, sampler in enumerate(samplers):
+        cache.put(str(i), sampler)
+    assert cache.get("0") is None
+    assert cache.get("2") is samplers[2]
+
+    cache.put("3", samplers[0])
+    clock[0] += 61
+    assert cache.get("3") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_sampler_cache_budget():
+    image = np.zeros((40, 40, 3), dtype=np.uint8)
+    samplers = [RegionSampler(image, histogram_side=40) for _ in range(3)]
+    size = samplers[0].nbytes
+    cache = SamplerCache(max_entries=10, ttl=60, max_bytes=2 * size)
+    cache.put("0", samplers[0])
+    cache.put("1", samplers[1])
+    assert cache.stats()["bytes"] == 2 * size
+
+    # Building the dominant histogram grows a sampler past the budget, the least recently used one is evicted
+    assert cache.get("0") is samplers[0]
+    samplers[0].dominant([(20, 20)])
+    cache.update("0")
+    assert cache.get("1") is None and cache.get("0") is samplers[0]
+    assert cache.stats()["bytes"] == samplers[0].nbytes and cache.stats()["evictions"] == 1
+
+    # The most recently used sampler is kept even when it alone is over the budget
+    cache = SamplerCache(max_entries=10, ttl=60, max_bytes=size // 2)
+    cache.put("2", samplers[2])
+    assert cache.get("2") is samplers[2] and cache.stats()["entries"] == 1
+
+
+def test_sample_endpoints(threshold_mask):
+    client = TestClient(app)
+
+    array = np.zeros((40, 60, 3), dtype=np.uint8)
+    array[:, 30:] = (200, 180, 160)
+    buffer = BytesIO()
+    PILImage.fromarray(array).save(buffer, format="PNG")
+
+    response = client.post("/v1/sample/prepare", params={"rembg": True}, files={"file": buffer.getvalue()})
+    assert response.status_code == 200
+    info = response.json()
+    assert (info["width"], info["height"], info["masked"]) == (60, 40, True)
+
+    query = {"points": [{"x": 45, "y": 20}, {"x": 31, "y": 20}], "radius": 3}
+    response = client.post(f"/v1/sample/{info['id']}", json=query)
+    assert response.status_code == 200
+    colors = response.json()["colors"]
+    assert [(c["r"], c["g"], c["b"]) for c in colors] == [(200, 180, 160)] * 2
+    assert colors[0]["pct"] == 1 and colors[1]["pct"] < 1
+
+    assert client.post("/v1/sample/unknown", json=query).status_code == 404
+
+    stats = client.get("/v1/sample/cache").json()
+    assert stats["entries"] >= 1 and stats["bytes"] <= stats["max_bytes"]
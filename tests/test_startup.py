@@ -0,0 +1,67 @@
+import importlib.util
+import json
+import os
+import pathlib
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+import pytest
+
+DIRECTORY_PATH = pathlib.Path(os.path.dirname(__file__))
+ROOT_PATH = DIRECTORY_PATH.parent
+BUDGET = json.loads((DIRECTORY_PATH / "startup_budget.json").read_text())
+RUNS = 3
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """Cumulative import time in microseconds of every module imported by a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_PATH, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def slowest(times: Dict[str, int], n: int = 10) -> List[Tuple[str, int]]:
+    return sorted(times.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+@pytest.mark.parametrize("module,budget_ms", BUDGET["modules"].items())
+def test_import_budget(module, budget_ms):
+    if module.startswith("webapp") and importlib.util.find_spec("streamlit") is None:
+        pytest.skip("streamlit is not installed")
+
+    # Best of a few runs, the first one also pays for writing the bytecode cache
+    runs = [import_times(module) for _ in range(RUNS)]
+    times = min(runs, key=lambda times: times[module])
+    elapsed_ms = times[module] / 1000
+    assert elapsed_ms <= budget_ms, (
+        f"Importing {module} took {elapsed_ms:.0f}ms, over its {budget_ms}ms budget. "
+        f"Slowest imports (us): {slowest(times)}"
+    )
+
+
+def test_heavy_dependencies_are_lazy():
+    modules = ["streamlit_camouflage.api", "streamlit_camouflage.v1.advanced_objects"]
+    code = (f"import json, sys\nimport {', '.join(modules)}\n"
+            f"print(json.dumps(sorted(set(m.split('.')[0] for m in sys.modules))))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_PATH, capture_output=True, text=True, check=True)
+    imported = set(json.loads(result.stdout))
+    assert imported.isdisjoint(BUDGET["lazy"]), sorted(imported.intersection(BUDGET["lazy"]))
+
+
+@pytest.mark.parametrize("module", ["matching"])
+def test_embedded_modules_are_standalone(module):
+    # The webapp imports these modules in-process, they must not pull in the API or image stacks
+    code = (f"import json, sys\nimport streamlit_camouflage.v1.{module}\n"
+            "print(json.dumps(sorted(set(m.split('.')[0] for m in sys.modules))))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_PATH, capture_output=True, text=True, check=True)
+    imported = set(json.loads(result.stdout))
+    assert imported.isdisjoint(BUDGET["lazy"] + ["fastapi", "starlette", "webcolors"])
@@ -0,0 +1,67 @@
+import numpy as np
+from PIL import Image as PILImage
+
+from streamlit_camouflage.v1.utils import get_foreground_pixels, quantize_pixels, scaled_size, stratified_subsample
+
+
+def test_get_foreground_pixels():
+    array = np.array([
+        [[0, 0, 0, 255], [10, 20, 30, 0]],
+        [[40, 50, 60, 128], [0, 0, 0, 0]],
+    ], dtype=np.uint8)
+
+    # With an alpha channel, black garment pixels are kept and transparent pixels dropped
+    pixels = get_foreground_pixels(PILImage.fromarray(array, mode='RGBA'))
+    assert pixels.tolist() == [[0, 0, 0], [40, 50, 60]]
+
+    # Without one, black pixels are treated as background
+    pixels = get_foreground_pixels(PILImage.fromarray(array[..., :3], mode='RGB'))
+    assert pixels.tolist() == [[10, 20, 30], [40, 50, 60]]
+
+    # A background removal mask selects pixels of the original image, combined with its own alpha
+    mask = PILImage.fromarray(np.array([[255, 255], [0, 255]], dtype=np.uint8), mode='L')
+    pixels = get_foreground_pixels(PILImage.fromarray(array[..., :3], mode='RGB'), mask)
+    assert pixels.tolist() == [[0, 0, 0], [10, 20, 30], [0, 0, 0]]
+    pixels = get_foreground_pixels(PILImage.fromarray(array, mode='RGBA'), mask)
+    assert pixels.tolist() == [[0, 0, 0]]
+
+    # The faint halo of a soft mask is background
+    mask = PILImage.fromarray(np.array([[128, 127], [0, 1]], dtype=np.uint8), mode='L')
+    pixels = get_foreground_pixels(PILImage.fromarray(array[..., :3], mode='RGB'), mask)
+    assert pixels.tolist() == [[0, 0, 0]]
+
+
+def test_scaled_size():
+    assert scaled_size((4000, 3000), 640) == (640, 480)
+    assert scaled_size((300, 6000), 640) == (32, 640)
+    assert scaled_size((640, 100), 640) == (640, 100)
+    assert scaled_size((10000, 1), 100) == (100, 1)
+
+
+def test_stratified_subsample():
+    pixels = np.arange(3000).reshape(1000, 3)
+
+    sample = stratified_subsample(pixels, 100, seed=1)
+    assert sample.shape == (100, 3)
+
+    # One pixel from each stratum of 10 consecutive pixels
+    assert (sample[:, 0] // 30 == np.arange(100)).all()
+
+    assert stratified_subsample(pixels, 2000) is pixels
+
+
+def test_quantize_pixels():
+    pixels = np.array([[0, 0, 0], [7, 7, 7], [8, 0, 0], [255, 255, 255]], dtype=np.uint8)
+
+    colors, counts = quantize_pixels(pixels, bits=5)
+
+    # The first two pixels share a bin whose color is their mean
+    assert colors.tolist() == [[3.5, 3.5, 3.5], [8, 0, 0], [255, 255, 255]]
+    assert counts.tolist() == [2, 1, 1]
+
+    # Histograms too large to count densely are indexed by their occupied bins
+    pixels = np.random.default_rng(0).integers(0, 256, (1000, 3), dtype=np.uint8)
+    colors, counts = quantize_pixels(pixels, bits=8)
+    expected, expected_counts = np.unique(pixels, axis=0, return_counts=True)
+    assert colors.tolist() == expected.tolist()
+    assert counts.tolist() == expected_counts.tolist()
@@ -0,0 +1,62 @@
+from itertools import product
+import json
+
+from fastapi.testclient import TestClient
+import numpy as np
+
+from streamlit_camouflage.api import app
+from streamlit_camouflage.v1.fuzzy_classifier import GetColorDescBatch, GetValidMatches
+from streamlit_camouflage.v1.utils import rgb_to_hsv_batch
+from streamlit_camouflage.v1.wardrobe import find_combinations, rank_combinations
+
+
+def test_find_combinations():
+    rng = np.random.default_rng(0)
+    slots = ['top'] * 4 + ['bottom'] * 3 + ['shoes'] * 2
+    colors = [[tuple(c) for c in rng.random((rng.integers(1, 4), 3)) * 255] for _ in slots]
+
+    combinations = list(find_combinations(slots, colors))
+
+    # Same outfits as checking every combination one at a time
+    descs = [GetColorDescBatch(rgb_to_hsv_batch(c)) for c in colors]
+    expected = {}
+    for outfit in product(range(4), range(4, 7), range(7, 9)):
+        matches = GetValidMatches(sum([descs[i] for i in outfit], start=[]))
+        if matches:
+            expected[outfit] = matches
+    assert {tuple(garments): matches for garments, matches in combinations} == expected
+
+    # Outfits with more match types come first
+    n_matches = [len(matches) for _, matches in combinations]
+    assert n_matches == sorted(n_matches, reverse=True)
+
+    assert len(list(find_combinations(slots, colors, limit=3))) == min(3, len(combinations))
+    assert list(find_combinations([], [])) == []
+
+
+def test_combinations_endpoint():
+    rng = np.random.default_rng(1)
+    slots = ['top'] * 3 + ['bottom'] * 3 + ['shoes'] * 2
+    colors = [[tuple(c) for c in rng.random((2, 3)) * 255] for _ in slots]
+    wardrobe = {"garments": [
+        {"id": f"g{i}", "slot": slot, "colors": [
+            {"r": r, "g": g, "b": b, "hex": "", "pct": 0.5, "name": ""} for r, g, b in garment
+        ]}
+        for i, (slot, garment) in enumerate(zip(slots, colors))
+    ]}
+    client = TestClient(app)
+
+    response = client.post("/v1/wardrobe/combinations", json=wardrobe)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    expected = [([f"g{i}" for i in garments], matches) for garments, matches in find_combinations(slots, colors)]
+    assert [(line["garments"], line["matches"]) for line in lines] == expected
+
+    response = client.post("/v1/wardrobe/combinations", params={"limit": 1}, json=wardrobe)
+    assert len(response.text.splitlines()) == min(1, len(expected))
+    for limit in (0, -1):
+        response = client.post("/v1/wardrobe/combinations", params={"limit": limit}, json=wardrobe)
+        assert response.status_code == 422
+
+    garments, masks = rank_combinations(slots, colors)
+    assert garments.shape == (len(expected), 3) and len(masks) == len(expected)
@@ -0,0 +1,69 @@
+import asyncio
+from io import BytesIO
+import time
+
+import httpx
+import numpy as np
+from PIL import Image as PILImage
+import pytest
+
+from streamlit_camouflage.v1.workers import Overloaded, WorkerPool
+
+
+def test_admission():
+    pool = WorkerPool('thread', max_workers=1, max_queued_jobs=2, max_queued_megapixels=10.0)
+
+    async def run():
+        # An idle pool admits any job
+        slow = asyncio.ensure_future(pool.run(time.sleep, 0.2, megapixels=12.0))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(Overloaded) as e:
+            await pool.run(time.sleep, 0.0, megapixels=1.0)
+        assert e.value.retry_after >= 1
+
+        await slow
+        assert pool.queued_megapixels == 0
+        return await pool.run(sum, [1, 2, 3], megapixels=1.0)
+
+    assert asyncio.run(run()) == 6
+    assert pool.stats()["rejected"] == 1
+    pool.shutdown()
+
+
+def test_matches_latency_while_colors_saturated(shirt_plaid_red_black_grey_no_background):
+    from streamlit_camouflage.api import app
+
+    # Distinct uploads so the result cache does not coalesce them
+    array = np.array(PILImage.open(shirt_plaid_red_black_grey_no_background))
+    uploads = []
+    for i in range(4):
+        array[0, 0] = i + 1
+        buffer = BytesIO()
+        PILImage.fromarray(array).save(buffer, format='PNG')
+        uploads.append(buffer.getvalue())
+
+    color = {"r": 124.0, "g": 32.0, "b": 46.0, "hex": "", "pct": 1.0, "name": ""}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            colors = [
+                asyncio.ensure_future(client.post("/v1/colors", files={"file": ("shirt.png", upload, "image/png")}))
+                for upload in uploads
+            ]
+            await asyncio.sleep(0.1)
+
+            start = time.perf_counter()
+            response = await client.post("/v1/matches", json={"colors": [color]})
+            matches_latency = time.perf_counter() - start
+            assert response.status_code == 200
+
+            colors_done = sum(future.done() for future in colors)
+            responses = await asyncio.gather(*colors)
+        return matches_latency, colors_done, responses
+
+    matches_latency, colors_done, responses = asyncio.run(run())
+    assert matches_latency < 0.5
+    assert colors_done < len(uploads)
+    assert all(response.status_code in (200, 429) for response in responses)
@@ -1,15 +1,15 @@
+import hashlib
 import logging
 import sys
 
 import numpy as np
 import streamlit as st
 from streamlit_image_coordinates import streamlit_image_coordinates
-from PIL import Image
 
 sys.path.insert(0, ".")
 
-from webapp.utils.constants import HIDE_FOOTER_STYLE, PAGE_HEADER_HTML, OUTFIT_DESCRIPTIONS, COLUMN_STYLE, STATEMENT_OUTFITS
-from webapp.utils.webutils import get_color_rect, api_request
+from webapp.utils.constants import HIDE_FOOTER_STYLE, PAGE_HEADER_HTML, OUTFIT_DESCRIPTIONS, COLUMN_STYLE, STATEMENT_OUTFITS, DISPLAY_IMAGE_WIDTH
+from webapp.utils.webutils import get_color_rect, get_matches, decode_upload, display_image, map_coordinates, pick_color
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -38,6 +38,13 @@ if 'next' not in st.session_state:
 if 'back' not in st.session_state:
     st.session_state['back'] = False
 
+# Decoded image and rendered swatch strip, kept across reruns until the image or colors change
+if 'decoded_image' not in st.session_state:
+    st.session_state['decoded_image'] = None
+
+if 'swatch' not in st.session_state:
+    st.session_state['swatch'] = None
+
 def go_forward():
     st.session_state['page_number'] += 1
 
@@ -48,6 +55,31 @@ def start_over():
     st.session_state['page_number'] = 1
     st.session_state['colors'] = []
     st.session_state['image'] = None
+    st.session_state['decoded_image'] = None
+    st.session_state['swatch'] = None
+
+def get_decoded_image(uploaded_image) -> dict:
+    """Full resolution and display sized arrays of the uploaded image, decoded once per image"""
+    key = hashlib.sha1(uploaded_image.getvalue()).hexdigest()
+    decoded = st.session_state['decoded_image']
+    if decoded is None or decoded['key'] != key:
+        image = decode_upload(uploaded_image)
+        decoded = {
+            'key': key,
+            'image': image,
+            'display': display_image(image, DISPLAY_IMAGE_WIDTH),
+        }
+        st.session_state['decoded_image'] = decoded
+    return decoded
+
+def get_swatch(colors: list, width: int, height: int) -> np.ndarray:
+    """Swatch strip of the chosen colors, rendered once per list of colors"""
+    key = (tuple((c['r'], c['g'], c['b'], c['pct']) for c in colors), width, height)
+    swatch = st.session_state['swatch']
+    if swatch is None or swatch['key'] != key:
+        swatch = {'key': key, 'rect': get_color_rect(colors=colors, width=width, height=height)}
+        st.session_state['swatch'] = swatch
+    return swatch['rect']
 
 # Logging message types
 def user_activity(message):
@@ -83,6 +115,8 @@ if st.session_state['page_number'] == 1:
     # Show camera input
     uploaded_image = st.camera_input(f"image", label_visibility="hidden", on_change=user_activity, args=(f"IMAGE CAPTURE - Image changed",))
     st.session_state['image'] = uploaded_image
+    if uploaded_image is None:
+        st.session_state['decoded_image'] = None
 
     # Show next button
     col1, col2 = st.columns(2)
@@ -95,12 +129,11 @@ if st.session_state['page_number'] == 2:
     st.markdown("_Touch the image below to pick out your colors_")
 
     # Display the image and capture touches
-    uploaded_image = st.session_state['image']
-    image = Image.open(uploaded_image)
-    image_ndarray = np.array(image)
-    coords = streamlit_image_coordinates(image_ndarray)
+    decoded = get_decoded_image(st.session_state['image'])
+    coords = streamlit_image_coordinates(decoded['display'])
     if coords:
-        color = image_ndarray[coords['y'], coords['x']]
+        y, x = map_coordinates(coords, decoded['display'].shape, decoded['image'].shape)
+        color = pick_color(decoded['image'], x, y)
         c = {
             "r": float(color[0]), 
             "g": float(color[1]), 
@@ -120,7 +153,7 @@ if st.session_state['page_number'] == 2:
         height = 100
         for c in chosen_colors:
             c['pct'] = 1 / len(chosen_colors)
-        rect = get_color_rect(colors=chosen_colors, width=width, height=height)
+        rect = get_swatch(chosen_colors, width=width, height=height)
         with st.container(border=True):
             st.image(rect, use_column_width=True)
     
@@ -142,11 +175,7 @@ if st.session_state["page_number"] == 3:
         # Check outfit for matches
         with st.spinner("Checking for a match..."):
             try:
-                json = {"colors": chosen_colors}
-                route = "matches"
-                response = api_request(route=route, json=json)
-                matches = response.json()
-                matches = matches['matches']
+                matches = get_matches(chosen_colors)
                 system_activity(f"MATCHING - Matches found - {matches}")
             except Exception as e:
                 system_error(f"MATCHING - Failed to find outfit matching types", e)
@@ -20,6 +20,28 @@ API_ROUTES = {
     "rembg": API_ENDPOINT + "/rembg"
 }
 
+# API client: connection pool size, (connect, read) timeouts in seconds, retries of failed or overloaded
+# requests, and the lifetime in seconds and number of cached responses
+API_POOL_SIZE = int(os.environ.get("API_POOL_SIZE", 16))
+API_TIMEOUT = (
+    float(os.environ.get("API_CONNECT_TIMEOUT", 3.05)),
+    float(os.environ.get("API_READ_TIMEOUT", 30.0)),
+)
+API_RETRIES = int(os.environ.get("API_RETRIES", 2))
+API_RETRY_BACKOFF = float(os.environ.get("API_RETRY_BACKOFF", 0.5))
+API_CACHE_TTL = int(os.environ.get("API_CACHE_TTL", 3600))
+API_CACHE_MAX_ENTRIES = int(os.environ.get("API_CACHE_MAX_ENTRIES", 256))
+
+# Where outfit matches are computed: 'embedded' classifies colors in the webapp with streamlit_camouflage.v1.matching,
+# falling back to the API when the package is not installed, 'remote' always calls the API
+MATCHING_MODE = os.environ.get("MATCHING_MODE", "embedded")
+
+# Width of the image shown for picking colors, taps are mapped back to the full resolution image
+DISPLAY_IMAGE_WIDTH = 640
+
+# Half the side in pixels of the window averaged around a tap, 0 picks the tapped pixel alone
+SAMPLE_RADIUS = 4
+
 # Write outfit descriptions
 OUTFIT_DESCRIPTIONS = {
     "Basic": """
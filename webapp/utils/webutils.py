@@ -1,14 +1,37 @@
+import hashlib
+import importlib
+import json as jsonlib
+import logging
+import random
+import time
 import numpy as np
-from typing import List
+from PIL import Image, ImageOps
+from typing import List, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
 
-from webapp.utils.constants import API_ROUTES
+from webapp.utils.constants import (
+    API_CACHE_MAX_ENTRIES,
+    API_CACHE_TTL,
+    API_POOL_SIZE,
+    API_RETRIES,
+    API_RETRY_BACKOFF,
+    API_ROUTES,
+    API_TIMEOUT,
+    MATCHING_MODE,
+    SAMPLE_RADIUS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying, the backend is overloaded or restarting
+RETRY_STATUSES = (429, 502, 503, 504)
 
 
 def get_color_rect(colors: List[dict], height: int = 50, width: int = 300) -> np.ndarray:
-    """Get a numpy array of shape (width, height, 3) containing proportional amounts of each color in the
+    """Get a numpy array of shape (height, width, 3) containing proportional amounts of each color in the
     clothing image
 
     Args:
@@ -16,27 +39,205 @@ def get_color_rect(colors: List[dict], height: int = 50, width: int = 300) -> np
         width (int, optional): Width of the color rectangle in pixels. Defaults to 300.
 
     Returns:
-        np.ndarray: _description_
+        np.ndarray: uint8 RGB image of the colors side by side
+    """
+    rgbs = np.array([[color['r'], color['g'], color['b']] for color in colors]).round().astype(np.uint8)
+    if len(colors) == 1:
+        widths = [width]
+    else:
+        widths = [int(color['pct'] * width) for color in colors]
+
+    # Build one row and repeat it, instead of a block per color
+    row = np.repeat(rgbs, widths, axis=0)
+    return np.broadcast_to(row, (height,) + row.shape).copy()
+
+def decode_upload(uploaded) -> np.ndarray:
+    """Decode an uploaded image
+
+    Args:
+        uploaded: Image file, e.g. from st.camera_input
+
+    Returns:
+        np.ndarray: uint8 RGB array of shape (height, width, 3)
+    """
+    image = ImageOps.exif_transpose(Image.open(uploaded))
+    return np.asarray(image.convert('RGB'))
+
+def display_image(image: np.ndarray, max_width: int) -> np.ndarray:
+    """Downscale an image to at most max_width pixels wide for display
+
+    Args:
+        image (np.ndarray): RGB array
+        max_width (int): Largest width in pixels
+
+    Returns:
+        np.ndarray: The image, downscaled when it is wider than max_width
+    """
+    height, width = image.shape[:2]
+    if width <= max_width:
+        return image
+    size = (max_width, max(1, round(height * max_width / width)))
+    return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR, reducing_gap=2.0))
+
+def map_coordinates(coords: dict, display_shape: tuple, image_shape: tuple) -> Tuple[int, int]:
+    """Map a tap on the displayed image to the pixel of the full resolution image
+
+    Args:
+        coords (dict): 'x' and 'y' of the tap on the displayed image
+        display_shape (tuple): Shape of the displayed image
+        image_shape (tuple): Shape of the full resolution image
+
+    Returns:
+        Tuple[int, int]: Row and column in the full resolution image
+    """
+    y = int((coords['y'] + 0.5) * image_shape[0] / display_shape[0])
+    x = int((coords['x'] + 0.5) * image_shape[1] / display_shape[1])
+    return min(max(y, 0), image_shape[0] - 1), min(max(x, 0), image_shape[1] - 1)
+
+@st.cache_resource(show_spinner=False)
+def get_session() -> requests.Session:
+    """HTTP session shared by every script run, keeping connections to the API alive
+
+    Returns:
+        requests.Session: Session with a connection pool of API_POOL_SIZE connections
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def read_files(files: dict) -> dict:
+    """Read uploads into bytes so they can be hashed and sent again on retries
+
+    Args:
+        files (dict): Uploads by field name, as bytes, file-like objects or (filename, content) tuples
+
+    Returns:
+        dict: (filename, bytes) by field name
     """
+    read = {}
+    for field, value in (files or {}).items():
+        filename, content = value[:2] if isinstance(value, tuple) else (getattr(value, 'name', field), value)
+        if hasattr(content, 'getvalue'):
+            content = content.getvalue()
+        elif hasattr(content, 'read'):
+            content = content.read()
+        read[field] = (filename, content)
+    return read
+
+def payload_hash(route: str, files: dict = None, json: dict = None) -> str:
+    """Hash of a request, identifying it in the response cache"""
+    digest = hashlib.sha256(route.encode())
+    for field, (_, content) in sorted((files or {}).items()):
+        digest.update(field.encode())
+        digest.update(hashlib.sha256(content).digest())
+    digest.update(jsonlib.dumps(json, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def retry_delay(attempt: int, response: requests.Response = None) -> float:
+    """Seconds to wait before a retry, exponential backoff with full jitter or the server's Retry-After"""
+    delay = random.uniform(0, API_RETRY_BACKOFF * 2 ** attempt)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is not None and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
 
-    color_rect = []
-    for color in colors:
-        _color = [color['r'], color['g'], color['b']]
-        _color = [c / 255.0 for c in _color]
+def post(route: str, files: dict = None, json: dict = None) -> requests.Response:
+    """POST to an API route through the shared session, retrying connection errors, timeouts and overloads
 
-        if len(colors) == 1:
-            color_width = width
-        else:
-            percent = color['pct']
-            color_width = int(percent * width)
+    Args:
+        route (str): Key of API_ROUTES
+        files (dict, optional): Uploads from read_files. Defaults to None.
+        json (dict, optional): JSON body. Defaults to None.
+
+    Raises:
+        requests.HTTPError: If the API responds with an error after every retry
+        requests.RequestException: If the API cannot be reached after every retry
+
+    Returns:
+        requests.Response: Successful response
+    """
+    session = get_session()
+    for attempt in range(API_RETRIES + 1):
+        last_attempt = attempt == API_RETRIES
+        try:
+            response = session.post(API_ROUTES[route], files=files, json=json, timeout=API_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_attempt:
+                raise
+            logger.warning(f"Retrying {route} after {type(e).__name__}")
+            time.sleep(retry_delay(attempt))
+            continue
+        if response.status_code in RETRY_STATUSES and not last_attempt:
+            logger.warning(f"Retrying {route} after status {response.status_code}")
+            time.sleep(retry_delay(attempt, response))
+            continue
+        response.raise_for_status()
+        return response
+
+@st.cache_data(ttl=API_CACHE_TTL, max_entries=API_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_request(route: str, key: str, _files: dict = None, _json: dict = None) -> Union[dict, bytes]:
+    """Decoded response of a request, cached by its route and payload hash
+
+    The payload arguments are not hashed by Streamlit, key identifies them.
+    """
+    response = post(route, files=_files, json=_json)
+    if response.headers.get("content-type", "").startswith("application/json"):
+        return response.json()
+    return response.content
+
+def api_request(route: str, files: dict = None, json: dict = None) -> Union[dict, bytes]:
+    """Send a request to the API, reusing the response of an identical recent request
+
+    Args:
+        route (str): Key of API_ROUTES
+        files (dict, optional): Uploads by field name. Defaults to None.
+        json (dict, optional): JSON body. Defaults to None.
 
-        rect_color = np.zeros([height, color_width, 3])
-        rect_color = np.full_like(rect_color, _color)
-        color_rect.append(rect_color)
-    return np.concatenate(color_rect, axis=1)
+    Returns:
+        Union[dict, bytes]: Decoded JSON, or the body of other responses such as images
+    """
+    files = read_files(files) if files else None
+    return cached_request(route, payload_hash(route, files, json), _files=files, _json=json)
 
 @st.cache_resource(show_spinner=False)
-def api_request(route: str, files: dict = None, json: dict = None):
-    response = requests.post(API_ROUTES[route], files=files, json=json, stream=True)
-    response.raise_for_status()
-    return response
\ No newline at end of file
+def load_embedded(module: str):
+    """A module of streamlit_camouflage.v1 run in-process, or None when the package is not installed"""
+    try:
+        return importlib.import_module(f"streamlit_camouflage.v1.{module}")
+    except ImportError as e:
+        logger.warning(f"Embedded {module} is unavailable: {e}")
+        return None
+
+def get_matches(colors: List[dict]) -> List[str]:
+    """Outfit types the colors match, computed in-process or by the API according to MATCHING_MODE
+
+    Args:
+        colors (List[dict]): Colors with 'r', 'g' and 'b' values (0 to 255)
+
+    Returns:
+        List[str]: Names of the matched outfit types
+    """
+    if MATCHING_MODE == "embedded":
+        matching = load_embedded("matching")
+        if matching is not None:
+            return matching.get_matches([(c['r'], c['g'], c['b']) for c in colors])
+    return api_request("matches", json={"colors": colors})['matches']
+
+def pick_color(image: np.ndarray, x: int, y: int) -> np.ndarray:
+    """Mean color of the SAMPLE_RADIUS window around a pixel, clipped to the image
+
+    A single tap only reads its own window, so it is averaged directly instead of building summed-area tables
+    of the whole photo.
+
+    Args:
+        image (np.ndarray): RGB array
+        x (int): Column of the pixel
+        y (int): Row of the pixel
+
+    Returns:
+        np.ndarray: RGB values (0 to 255)
+    """
+    window = image[max(y - SAMPLE_RADIUS, 0):y + SAMPLE_RADIUS + 1, max(x - SAMPLE_RADIUS, 0):x + SAMPLE_RADIUS + 1]
+    return window[..., :3].reshape(-1, 3).mean(axis=0).round()